@@ -9,7 +9,8 @@ import os
 
 from services.config_service import get_config_service
 
-from services.db_service import get_db_service
+from services.async_db_service import get_async_db_service
+from api.responses import FastJSONResponse
 from services.azure_service import AzureService
 from services.ai_base import AIServiceBase
 
@@ -66,10 +67,10 @@ async def summarize_email(request: AnalysisRequest):
     """
     生成邮件摘要
     """
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 1. 获取邮件内容
-    email = db.get_email_by_id(request.email_id)
+    email = await db.get_email_by_id(request.email_id)
     if not email:
         raise HTTPException(status_code=404, detail="邮件不存在")
     
@@ -87,13 +88,13 @@ async def summarize_email(request: AnalysisRequest):
     
     # 4. 保存分析结果到数据库
     analysis_id = str(uuid.uuid4())
-    db.save_analysis_result(
+    await db.save_analysis_result(
         result_id=analysis_id,
         task_id=request.task_id,
         email_id=request.email_id,
         analysis_type="summary",
         model_provider=model_to_use,
-        result=summary_result.model_dump()
+        result=summary_result
     )
     
     # 5. 返回结果
@@ -111,10 +112,10 @@ async def analyze_sentiment(request: AnalysisRequest):
     """
     情感分析
     """
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 1. 获取邮件内容
-    email = db.get_email_by_id(request.email_id)
+    email = await db.get_email_by_id(request.email_id)
     if not email:
         raise HTTPException(status_code=404, detail="邮件不存在")
     
@@ -131,13 +132,13 @@ async def analyze_sentiment(request: AnalysisRequest):
     
     # 4. 保存结果
     analysis_id = str(uuid.uuid4())
-    db.save_analysis_result(
+    await db.save_analysis_result(
         result_id=analysis_id,
         task_id=request.task_id,
         email_id=request.email_id,
         analysis_type="sentiment",
         model_provider=model_to_use,
-        result=sentiment_result.model_dump()
+        result=sentiment_result
     )
     
     # 5. 返回结果
@@ -155,10 +156,10 @@ async def extract_entities(request: AnalysisRequest):
     """
     实体提取
     """
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 1. 获取邮件内容
-    email = db.get_email_by_id(request.email_id)
+    email = await db.get_email_by_id(request.email_id)
     if not email:
         raise HTTPException(status_code=404, detail="邮件不存在")
     
@@ -175,13 +176,13 @@ async def extract_entities(request: AnalysisRequest):
     
     # 4. 保存结果
     analysis_id = str(uuid.uuid4())
-    db.save_analysis_result(
+    await db.save_analysis_result(
         result_id=analysis_id,
         task_id=request.task_id,
         email_id=request.email_id,
         analysis_type="entities",
         model_provider=model_to_use,
-        result=entity_result.model_dump()
+        result=entity_result
     )
     
     # 5. 返回结果
@@ -194,7 +195,7 @@ async def extract_entities(request: AnalysisRequest):
     )
 
 
-@router.get("/results/{email_id}")
+@router.get("/results/{email_id}", response_class=FastJSONResponse)
 async def get_analysis_results(email_id: int, analysis_type: Optional[str] = None):
     """
     获取邮件的分析结果历史
@@ -203,21 +204,21 @@ async def get_analysis_results(email_id: int, analysis_type: Optional[str] = Non
         email_id: 邮件 ID
         analysis_type: 可选，筛选特定类型的分析结果 (summary/sentiment/entities)
     """
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 检查邮件是否存在
-    email = db.get_email_by_id(email_id)
+    email = await db.get_email_by_id(email_id)
     if not email:
         raise HTTPException(status_code=404, detail="邮件不存在")
     
     # 获取分析结果
-    results = db.get_analysis_results(email_id, analysis_type)
+    results = await db.get_analysis_results(email_id, analysis_type, raw_json=True)
     
-    return {
+    return FastJSONResponse({
         "email_id": email_id,
         "total": len(results),
         "results": results
-    }
+    })
 
 
 @router.get("/models", response_model=list[ModelInfo])
@@ -19,7 +19,7 @@ from services.batch_analysis_service import (
     DEFAULT_ANALYSIS_PROMPT,
     DEFAULT_FILTER_KEYWORDS
 )
-from services.db_service import get_db_service
+from services.async_db_service import get_async_db_service
 
 
 router = APIRouter(prefix="/api/batch-analysis", tags=["batch-analysis"])
@@ -64,15 +64,15 @@ async def start_batch_analysis(request: BatchAnalysisStartRequest):
     任务在后台异步执行，关闭页面不影响进度。
     可通过 /status 端点查询进度。
     """
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(request.task_id)
+    task = await db.get_task(request.task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
     # 检查是否有正在运行的分析任务
-    existing_jobs = db.get_batch_jobs_by_task(request.task_id)
+    existing_jobs = await db.get_batch_jobs_by_task(request.task_id)
     running_jobs = [j for j in existing_jobs if j["status"] == "RUNNING"]
     if running_jobs:
         raise HTTPException(
@@ -128,7 +128,10 @@ async def get_batch_analysis_status(job_id: str):
             "success": job["success_count"],
             "failed": job["failed_count"],
             "skipped": job["skipped_count"],
-            "percent": progress_percent
+            "percent": progress_percent,
+            # 仅运行中的任务有值（来自进度看板）
+            "in_flight": job.get("in_flight", 0),
+            "items_per_second": job.get("items_per_second", 0.0)
         },
         "config": {
             "model": job["model_provider"],
@@ -136,6 +139,8 @@ async def get_batch_analysis_status(job_id: str):
             "max_retries": job["max_retries"],
             "analysis_type": job.get("analysis_type", "email")
         },
+        # 运行中任务的自适应并发：当前上限、暂停秒数和上限变化记录（已结束的任务为 null）
+        "adaptive_concurrency": job.get("adaptive_concurrency"),
         "timestamps": {
             "created_at": job["created_at"],
             "started_at": job["started_at"],
@@ -198,10 +203,10 @@ async def get_batch_analysis_jobs(task_id: str):
     """
     获取指定任务的所有批量分析作业
     """
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
@@ -9,7 +9,7 @@ import asyncio
 
 from services.config_service import get_config_service
 
-from services.db_service import get_db_service
+from services.async_db_service import get_async_db_service
 
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
@@ -39,10 +39,10 @@ async def chat(request: ChatRequest):
     2. 从 DuckDB 中检索相关邮件
     3. 构建上下文并调用 AI 生成答案
     """
-    db_service = get_db_service()
+    db_service = get_async_db_service()
     
     # 检查任务是否存在
-    task = db_service.get_task(request.task_id)
+    task = await db_service.get_task(request.task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -80,7 +80,7 @@ async def search_relevant_emails(
     简化版本：直接返回最近的邮件
     """
     try:
-        return db_service.get_emails_by_task(task_id, limit=limit)
+        return await db_service.get_emails_by_task(task_id, limit=limit, include_clean=True)
     except Exception as e:
         print(f"Error getting emails: {e}")
         return []
@@ -11,7 +11,8 @@ import csv
 import json
 from urllib.parse import quote
 
-from services.db_service import get_db_service
+from services.async_db_service import get_async_db_service
+from api.responses import FastJSONResponse
 
 router = APIRouter(prefix="/api/clusters", tags=["clusters"])
 
@@ -24,41 +25,51 @@ class ClusterAnalyzeRequest(BaseModel):
     model: str = "azure"  # 仅支持 "azure"
 
 
-@router.get("/people/{task_id}")
+@router.get("/people/{task_id}", response_class=FastJSONResponse)
 async def get_people_clusters(
     task_id: str, 
     page: int = Query(1, ge=1),
-    page_size: int = Query(20, ge=1, le=100)
+    page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，指定时忽略 page")
 ):
     """获取往来聚类列表"""
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    return db.get_people_clusters(task_id, page, page_size)
+    try:
+        result = await db.get_people_clusters(task_id, page, page_size, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(result)
 
 
-@router.get("/subjects/{task_id}")
+@router.get("/subjects/{task_id}", response_class=FastJSONResponse)
 async def get_subject_clusters(
     task_id: str,
     page: int = Query(1, ge=1),
-    page_size: int = Query(20, ge=1, le=100)
+    page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor，指定时忽略 page")
 ):
     """获取主题聚类列表"""
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    return db.get_subject_clusters(task_id, page, page_size)
+    try:
+        result = await db.get_subject_clusters(task_id, page, page_size, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse(result)
 
 
-@router.get("/people/{task_id}/emails")
+@router.get("/people/{task_id}/emails", response_class=FastJSONResponse)
 async def get_people_cluster_emails(
     task_id: str,
     participant1: str = Query(..., description="参与者1"),
@@ -66,42 +77,42 @@ async def get_people_cluster_emails(
     limit: int = Query(50, ge=1, le=200)
 ):
     """获取两个参与者之间的往来邮件"""
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    emails = db.get_emails_by_participants(task_id, participant1, participant2, limit)
-    return {"emails": emails}
+    emails = await db.get_emails_by_participants(task_id, participant1, participant2, limit)
+    return FastJSONResponse({"emails": emails})
 
 
-@router.get("/subjects/{task_id}/emails")
+@router.get("/subjects/{task_id}/emails", response_class=FastJSONResponse)
 async def get_subject_cluster_emails(
     task_id: str,
     subject: str = Query(..., description="邮件主题"),
     limit: int = Query(50, ge=1, le=200)
 ):
     """获取指定主题的邮件"""
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    emails = db.get_emails_by_subject(task_id, subject, limit)
-    return {"emails": emails}
+    emails = await db.get_emails_by_subject(task_id, subject, limit)
+    return FastJSONResponse({"emails": emails})
 
 
 @router.post("/analyze")
 async def analyze_clusters(request: ClusterAnalyzeRequest):
     """批量分析聚类（生成 AI 洞察）"""
-    db = get_db_service()
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(request.task_id)
+    task = await db.get_task(request.task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
@@ -118,13 +129,13 @@ async def analyze_clusters(request: ClusterAnalyzeRequest):
                 # 解析参与者
                 parts = cluster_key.split(" ↔ ")
                 if len(parts) == 2:
-                    emails = db.get_emails_by_participants(
-                        request.task_id, parts[0].strip(), parts[1].strip(), limit=20
+                    emails = await db.get_emails_by_participants(
+                        request.task_id, parts[0].strip(), parts[1].strip(), limit=20, include_clean=True
                     )
                 else:
                     emails = []
             else:
-                emails = db.get_emails_by_subject(request.task_id, cluster_key, limit=20)
+                emails = await db.get_emails_by_subject(request.task_id, cluster_key, limit=20, include_clean=True)
             
             if not emails:
                 results.append({
@@ -177,7 +188,7 @@ async def analyze_clusters(request: ClusterAnalyzeRequest):
                 }, ensure_ascii=False)
             
             # 保存洞察结果
-            db.save_cluster_insight(
+            await db.save_cluster_insight(
                 request.task_id,
                 request.cluster_type,
                 cluster_key,
@@ -205,81 +216,88 @@ async def analyze_clusters(request: ClusterAnalyzeRequest):
     }
 
 
+# 流式导出时累积到该大小再输出一块
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def _flatten_insight(cluster: dict) -> dict:
+    """将 ai_insight JSON 展开为 risk_level / summary / tags / key_findings 列"""
+    row = cluster.copy()
+    
+    # 解析 AI 洞察
+    ai_insight_str = row.pop("ai_insight", "")
+    risk_level = ""
+    summary = ""
+    tags = ""
+    key_findings = ""
+    
+    if ai_insight_str:
+        try:
+            insight_data = json.loads(ai_insight_str)
+            risk_level = insight_data.get("risk_level", "")
+            summary = insight_data.get("summary", "")
+            
+            # 处理标签列表
+            tags_list = insight_data.get("tags", [])
+            if isinstance(tags_list, list):
+                tags = ", ".join(str(t) for t in tags_list)
+            else:
+                tags = str(tags_list)
+                
+            key_findings = insight_data.get("key_findings", "")
+        except json.JSONDecodeError:
+            # 解析失败，将原始字符串放入 summary 或保持为空
+            summary = ai_insight_str
+    
+    # 添加新字段
+    row["risk_level"] = risk_level
+    row["summary"] = summary
+    row["tags"] = tags
+    row["key_findings"] = key_findings
+    return row
+
+
+def _stream_clusters_csv(clusters, fieldnames: List[str]):
+    """逐块产出 CSV 文本（带 BOM，Excel 可直接打开）"""
+    output = io.StringIO()
+    output.write('\ufeff')
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    for cluster in clusters:
+        writer.writerow(_flatten_insight(cluster))
+        if output.tell() >= EXPORT_FLUSH_BYTES:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+
 @router.get("/export/{task_id}")
 async def export_clusters(
     task_id: str,
     cluster_type: str = Query("people", description="聚类类型: people 或 subjects")
 ):
-    """导出聚类数据为 CSV (解析 AI 洞察字段)"""
-    db = get_db_service()
+    """导出聚类数据为 CSV (解析 AI 洞察字段)，从数据库游标流式输出"""
+    db = get_async_db_service()
     
     # 验证任务存在
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    clusters = db.get_all_clusters_for_export(task_id, cluster_type)
-    
-    # 处理数据，解析 ai_insight
-    processed_clusters = []
-    for cluster in clusters:
-        # 复制原有数据
-        row = cluster.copy()
-        
-        # 解析 AI 洞察
-        ai_insight_str = row.pop("ai_insight", "")
-        risk_level = ""
-        summary = ""
-        tags = ""
-        key_findings = ""
-        
-        if ai_insight_str:
-            try:
-                insight_data = json.loads(ai_insight_str)
-                risk_level = insight_data.get("risk_level", "")
-                summary = insight_data.get("summary", "")
-                
-                # 处理标签列表
-                tags_list = insight_data.get("tags", [])
-                if isinstance(tags_list, list):
-                    tags = ", ".join(str(t) for t in tags_list)
-                else:
-                    tags = str(tags_list)
-                    
-                key_findings = insight_data.get("key_findings", "")
-            except json.JSONDecodeError:
-                # 解析失败，将原始字符串放入 summary 或保持为空
-                summary = ai_insight_str
-        
-        # 添加新字段
-        row["risk_level"] = risk_level
-        row["summary"] = summary
-        row["tags"] = tags
-        row["key_findings"] = key_findings
-        
-        processed_clusters.append(row)
-    
-    # 创建 CSV 内容
-    output = io.StringIO()
-    
     # 定义新的表头
     base_fields = ["participants", "email_count", "latest_activity"] if cluster_type == "people" else ["subject", "email_count", "latest_activity"]
     insight_fields = ["risk_level", "summary", "tags", "key_findings"]
     fieldnames = base_fields + insight_fields
     
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(processed_clusters)
-    
-    # 返回文件流
-    output.seek(0)
+    clusters = db.db.iter_clusters_for_export(task_id, "people" if cluster_type == "people" else "subjects")
     filename = f"{task['name']}_{cluster_type}_clusters.csv"
     
     # 处理文件名编码
     encoded_filename = quote(filename)
     
     return StreamingResponse(
-        iter(['\ufeff' + output.getvalue()]),
+        _stream_clusters_csv(clusters, fieldnames),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=\"{encoded_filename}\"; filename*=utf-8''{encoded_filename}"
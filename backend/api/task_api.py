@@ -3,15 +3,23 @@
 提供任务的创建、查询、删除等接口
 支持分阶段导入：上传 -> 预览 -> 配置 -> 导入
 """
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+from urllib.parse import quote
+import os
 import uuid
+import tempfile
 from pathlib import Path
 
 from services.db_service import get_db_service
-from services.storage_service import get_storage_service
+from services.async_db_service import get_async_db_service, DBQueryTimeout, EXPORT_TIMEOUT
+from services.storage_service import get_storage_service, UploadError, DEFAULT_UPLOAD_CHUNK_SIZE
 from services.preview_service import get_preview_service
+from api.responses import FastJSONResponse
 
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
@@ -24,6 +32,7 @@ class TaskResponse(BaseModel):
     status: str
     created_at: str
     file_path: Optional[str] = None
+    ingest_progress: Optional[Dict[str, Any]] = None  # 导入进度（行数、字节数、速率）
 
 
 class TaskCreate(BaseModel):
@@ -59,6 +68,8 @@ class ImportConfig(BaseModel):
     temp_file_id: str                  # 临时文件标识（上传时返回的 ID）
     mapping: FieldMapping              # 字段映射
     filter: Optional[FilterConfig] = None  # 过滤配置（可选）
+    append_to_task_id: Optional[str] = None  # 追加到已有任务（按内容哈希跳过已导入的邮件）
+    mask_pii: bool = False             # 导入后预脱敏（调用 LLM 时直接读取脱敏结果）
 
 
 class UploadResponse(BaseModel):
@@ -88,7 +99,7 @@ async def create_task(
     task_id = str(uuid.uuid4())
     
     # 获取服务实例
-    db_service = get_db_service()
+    db_service = get_async_db_service()
     storage_service = get_storage_service()
     
     # 保存上传的文件
@@ -99,7 +110,7 @@ async def create_task(
     )
     
     # 创建任务记录
-    task = db_service.create_task(task_id, name, file_path)
+    task = await db_service.create_task(task_id, name, file_path)
     
     # 在后台处理文件导入
     if background_tasks:
@@ -116,8 +127,8 @@ async def create_task(
 @router.get("/", response_model=List[TaskResponse])
 async def list_tasks():
     """获取所有任务列表"""
-    db_service = get_db_service()
-    tasks = db_service.get_tasks()
+    db_service = get_async_db_service()
+    tasks = await db_service.get_tasks()
     return [TaskResponse(**task) for task in tasks]
 
 
@@ -128,14 +139,14 @@ _temp_files: Dict[str, Dict[str, Any]] = {}
 
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
     """
     分阶段导入 - 第一步：上传文件并返回预览信息
     
     上传文件后不立即导入，而是返回列名和样本数据供用户配置映射和过滤规则
     
     Args:
-        file: 上传的 CSV 文件
+        file: 上传的 CSV 文件或邮箱文件（mbox、.eml、.eml/Maildir 的 zip 压缩包）
         
     Returns:
         包含临时文件 ID、列名、样本数据的响应
@@ -143,9 +154,7 @@ async def upload_file(file: UploadFile = File(...)):
     # 生成临时文件 ID
     temp_file_id = str(uuid.uuid4())
     
-    # 获取服务实例
     storage_service = get_storage_service()
-    preview_service = get_preview_service()
     
     # 保存上传的文件（使用临时 ID 作为任务 ID）
     file_path = await storage_service.save_upload_file(
@@ -154,6 +163,26 @@ async def upload_file(file: UploadFile = File(...)):
         file.filename
     )
     
+    # 嗅探和哈希文件在线程池中执行，不阻塞事件循环
+    return await run_in_threadpool(_build_upload_preview, temp_file_id, file_path, file.filename, background_tasks)
+
+
+def _build_upload_preview(
+    temp_file_id: str,
+    file_path: str,
+    filename: str,
+    background_tasks: Optional[BackgroundTasks] = None
+) -> UploadResponse:
+    """
+    读取已上传文件的列名、样本数据和文件信息，登记为待导入的临时文件
+    
+    预览只读取文件开头（同步执行，路由在线程池中调用）；响应返回后由后台任务生成列式暂存副本
+    并统计精确行数，精确行数可通过 GET /api/tasks/preview/{temp_file_id} 查询。
+    解析失败时删除临时文件并返回 400
+    """
+    storage_service = get_storage_service()
+    preview_service = get_preview_service()
+    
     try:
         # 获取列名
         columns = preview_service.get_csv_columns(file_path)
@@ -163,11 +192,14 @@ async def upload_file(file: UploadFile = File(...)):
         
         # 获取文件信息
         file_info = preview_service.get_file_info(file_path)
+        if background_tasks is not None:
+            # 响应返回后生成列式暂存副本并统计精确行数
+            background_tasks.add_task(_prepare_upload, file_path)
         
         # 存储临时文件信息
         _temp_files[temp_file_id] = {
             "file_path": file_path,
-            "filename": file.filename,
+            "filename": filename,
             "columns": columns
         }
         
@@ -183,6 +215,104 @@ async def upload_file(file: UploadFile = File(...)):
         storage_service.delete_task_files(f"temp_{temp_file_id}")
         raise HTTPException(status_code=400, detail=f"文件解析失败: {str(e)}")
 
+
+class ResumableUploadInit(BaseModel):
+    """分片上传初始化请求"""
+    filename: str
+    total_size: int                    # 文件总字节数
+    chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE
+
+
+@router.post("/upload/init")
+async def init_resumable_upload(request: ResumableUploadInit):
+    """
+    分片上传 - 创建上传会话
+    
+    返回的 upload_id 同时作为后续预览 / 导入使用的 temp_file_id
+    """
+    try:
+        return get_storage_service().init_resumable_upload(
+            request.filename, request.total_size, request.chunk_size
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/upload/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """分片上传 - 查询已接收的分片（断点续传）"""
+    try:
+        return get_storage_service().get_upload_status(upload_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.put("/upload/{upload_id}/chunk")
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    x_chunk_checksum: Optional[str] = Header(None)
+):
+    """
+    分片上传 - 写入一个分片（请求体为分片原始字节）
+    
+    分片可以并行、乱序上传；X-Chunk-Checksum 头为分片的 SHA-256（十六进制）
+    """
+    data = await request.body()
+    try:
+        status = await run_in_threadpool(
+            get_storage_service().write_upload_chunk, upload_id, offset, data, x_chunk_checksum
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 返回进度即可，无需回传完整的分片列表
+    return {
+        "upload_id": upload_id,
+        "received": len(status["received_chunks"]),
+        "total_chunks": status["total_chunks"]
+    }
+
+
+@router.post("/upload/{upload_id}/finalize", response_model=UploadResponse)
+async def finalize_resumable_upload(upload_id: str, background_tasks: BackgroundTasks = None):
+    """
+    分片上传 - 完成上传，并进入与 /upload 相同的预览流程
+    """
+    storage_service = get_storage_service()
+    try:
+        file_path = storage_service.finalize_resumable_upload(upload_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await run_in_threadpool(_build_upload_preview, upload_id, file_path, Path(file_path).name, background_tasks)
+
+
+def _prepare_upload(file_path: str):
+    """后台任务：生成上传文件的列式暂存副本，统计精确行数并写入预览缓存"""
+    try:
+        get_preview_service().prepare_upload(file_path)
+    except Exception as e:
+        print(f"Error preparing upload {file_path}: {e}")
+
+
+@router.get("/preview/{temp_file_id}")
+async def get_upload_preview_info(temp_file_id: str):
+    """
+    获取已上传文件的最新文件信息（后台统计完成后 row_count 为精确行数）
+    """
+    if temp_file_id not in _temp_files:
+        raise HTTPException(status_code=404, detail="临时文件不存在或已过期")
+    
+    file_path = _temp_files[temp_file_id]["file_path"]
+    file_info = await run_in_threadpool(get_preview_service().get_file_info, file_path)
+    return {"temp_file_id": temp_file_id, "file_info": file_info}
+
+
 class FilterPreviewRequest(BaseModel):
     """过滤预览请求"""
     temp_file_id: str
@@ -193,6 +323,9 @@ class FilterPreviewRequest(BaseModel):
 async def get_filtered_count(request: FilterPreviewRequest):
     """
     获取应用过滤规则后的预计数据行数
+    
+    一次扫描同时返回每条规则命中的行数、仅被该规则命中的行数和规则两两重叠的行数，
+    便于一次调整多条规则
     """
     if request.temp_file_id not in _temp_files:
         raise HTTPException(
@@ -209,10 +342,11 @@ async def get_filtered_count(request: FilterPreviewRequest):
         # 将 Pydantic 模型转为 dict
         filter_dict = request.filter.model_dump()
         
-        count = preview_service.get_filtered_row_count(file_path, filter_dict)
-        return {"count": count}
+        return await run_in_threadpool(preview_service.get_filter_impact, file_path, filter_dict)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+
+
 @router.post("/import", response_model=TaskResponse)
 async def import_with_config(
     config: ImportConfig,
@@ -221,7 +355,9 @@ async def import_with_config(
     """
     分阶段导入 - 第二步：使用用户配置执行导入
     
-    接收字段映射和过滤规则，创建任务并执行导入
+    接收字段映射和过滤规则，创建任务并执行导入；
+    指定 append_to_task_id 时不创建新任务，只把任务中尚不存在的邮件追加进去，
+    新增 / 重复行数见任务的 ingest_progress（rows_inserted / rows_duplicate）
     
     Args:
         config: 导入配置（包含任务名称、字段映射、过滤规则）
@@ -259,22 +395,35 @@ async def import_with_config(
             detail=f"以下必选字段未配置映射: {', '.join(missing_fields)}"
         )
     
-    # 生成正式任务 ID
-    task_id = str(uuid.uuid4())
-    
     # 获取服务实例
-    db_service = get_db_service()
+    db_service = get_async_db_service()
     storage_service = get_storage_service()
     
+    append = config.append_to_task_id is not None
+    if append:
+        task_id = config.append_to_task_id
+        task = await db_service.get_task(task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task["status"] == "PROCESSING":
+            raise HTTPException(status_code=409, detail="任务正在导入中，请稍后再追加")
+        # 追加的文件放在任务目录的子目录中，不覆盖任务原有文件，随任务一起删除
+        target_dir = str(Path(task_id) / f"append_{config.temp_file_id}")
+    else:
+        # 生成正式任务 ID
+        task_id = str(uuid.uuid4())
+        target_dir = task_id
+    
     # 将临时文件移动到正式目录
     new_file_path = storage_service.move_temp_file(
         file_path, 
         f"temp_{config.temp_file_id}", 
-        task_id
+        target_dir
     )
     
     # 创建任务记录
-    task = db_service.create_task(task_id, config.task_name, new_file_path)
+    if not append:
+        task = await db_service.create_task(task_id, config.task_name, new_file_path)
     
     # 准备映射和过滤配置
     mapping_dict = mapping.model_dump()
@@ -288,7 +437,9 @@ async def import_with_config(
             new_file_path,
             filename,
             mapping_dict,
-            filter_dict
+            filter_dict,
+            append,
+            config.mask_pii
         )
     
     # 清理临时文件记录
@@ -302,7 +453,9 @@ def process_file_import_with_config(
     file_path: str, 
     filename: str,
     mapping: Dict[str, Any],
-    filter_config: Optional[Dict[str, Any]] = None
+    filter_config: Optional[Dict[str, Any]] = None,
+    append: bool = False,
+    mask_pii: bool = False
 ):
     """
     后台任务：使用用户配置处理文件导入
@@ -313,6 +466,8 @@ def process_file_import_with_config(
         filename: 文件名
         mapping: 字段映射配置
         filter_config: 过滤配置
+        append: 追加到已有任务
+        mask_pii: 导入后预脱敏
     """
     db_service = get_db_service()
     
@@ -326,26 +481,58 @@ def process_file_import_with_config(
             file_path, 
             file_ext,
             mapping,
-            filter_config
+            filter_config,
+            append=append,
+            mask_pii=mask_pii
         )
         
     except Exception as e:
         print(f"Error processing file import for task {task_id}: {e}")
-        db_service.update_task_status(task_id, "FAILED")
+        # 追加导入失败时 ingest_file_with_config 已恢复任务原状态，错误只记录在导入进度中
+        if not append:
+            db_service.update_task_status(task_id, "FAILED")
 
 
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task(task_id: str):
-    """获取单个任务详情"""
-    db_service = get_db_service()
-    task = db_service.get_task(task_id)
+    """获取单个任务详情（包含导入进度）"""
+    db_service = get_async_db_service()
+    task = await db_service.get_task(task_id)
     
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    task["ingest_progress"] = await db_service.get_ingest_progress(task_id)
     return TaskResponse(**task)
 
 
+@router.post("/{task_id}/mask-pii")
+async def mask_task_pii(task_id: str, background_tasks: BackgroundTasks):
+    """
+    为已导入的任务预脱敏（后台进程池执行），之后追加导入的邮件也会自动脱敏
+    """
+    db_service = get_async_db_service()
+    task = await db_service.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task["status"] == "PROCESSING":
+        raise HTTPException(status_code=409, detail="任务正在导入中，请稍后再试")
+    
+    background_tasks.add_task(process_task_pii_masking, task_id)
+    return {"task_id": task_id, "status": "MASKING"}
+
+
+def process_task_pii_masking(task_id: str):
+    """后台任务：预脱敏任务中尚未脱敏的邮件"""
+    from services.ingest_service import IngestService
+    
+    try:
+        masked = IngestService(get_db_service()).precompute_masked_content(task_id)
+        print(f"[PII] Task {task_id}: 预脱敏 {masked} 封邮件")
+    except Exception as e:
+        print(f"Error masking PII for task {task_id}: {e}")
+
+
 @router.delete("/{task_id}")
 async def delete_task(task_id: str):
     """
@@ -354,16 +541,16 @@ async def delete_task(task_id: str):
     2. 删除数据库中的任务记录
     3. 删除磁盘上的文件
     """
-    db_service = get_db_service()
+    db_service = get_async_db_service()
     storage_service = get_storage_service()
     
     # 检查任务是否存在
-    task = db_service.get_task(task_id)
+    task = await db_service.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     # 删除数据库记录（包括关联的邮件）
-    db_service.delete_task(task_id)
+    await db_service.delete_task(task_id)
     
     # 删除磁盘文件
     storage_service.delete_task_files(task_id)
@@ -371,18 +558,80 @@ async def delete_task(task_id: str):
     return {"message": f"Task {task_id} deleted successfully"}
 
 
-@router.get("/{task_id}/emails")
-async def get_task_emails(task_id: str, limit: int = 100, offset: int = 0):
-    """获取任务的邮件记录"""
-    db_service = get_db_service()
+@router.get("/{task_id}/emails", response_class=FastJSONResponse)
+async def get_task_emails(
+    task_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sender: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    has_analysis: Optional[bool] = None,
+    offset: int = Query(0, ge=0, description="旧版偏移分页，指定 cursor 或过滤条件时忽略")
+):
+    """
+    获取任务的邮件记录（按 id 顺序）
+    
+    游标分页：首次请求不带 cursor，之后传入上一页返回的 next_cursor，next_cursor 为 null 表示没有更多数据；
+    可按发件人（sender）、时间范围（[start, end)，ISO 格式）、是否已有分析结果（has_analysis）过滤
+    """
+    db_service = get_async_db_service()
     
     # 检查任务是否存在
-    task = db_service.get_task(task_id)
+    task = await db_service.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    if offset and cursor is None and not any([sender, start, end, has_analysis is not None]):
+        emails = await db_service.get_emails_by_task(task_id, limit, offset, raw_json=True)
+        return FastJSONResponse({"emails": emails, "limit": limit, "offset": offset, "next_cursor": None})
+    
+    try:
+        page = await db_service.get_emails_page(
+            task_id, limit, cursor, sender=sender, start=start, end=end, has_analysis=has_analysis, raw_json=True
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({**page, "limit": limit})
+
+
+@router.get("/{task_id}/export")
+async def export_task(task_id: str, format: str = "parquet"):
+    """
+    导出任务的邮件及最新分析结果（Parquet 或 NDJSON）
+    
+    由 DuckDB 写出临时文件后以文件流返回，响应结束后删除临时文件
+    """
+    db_service = get_async_db_service()
+    
+    task = await db_service.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    emails = db_service.get_emails_by_task(task_id, limit, offset)
-    return {"emails": emails, "limit": limit, "offset": offset}
+    extensions = {"parquet": "parquet", "ndjson": "ndjson"}
+    if format not in extensions:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+    
+    fd, output_path = tempfile.mkstemp(suffix=f".{extensions[format]}")
+    os.close(fd)
+    try:
+        await db_service.export_task(task_id, output_path, format, timeout=EXPORT_TIMEOUT)
+    except DBQueryTimeout:
+        os.remove(output_path)
+        raise
+    except Exception as e:
+        os.remove(output_path)
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+    
+    filename = quote(f"{task['name']}_emails.{extensions[format]}")
+    return FileResponse(
+        output_path,
+        media_type="application/vnd.apache.parquet" if format == "parquet" else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f"attachment; filename=\"{filename}\"; filename*=utf-8''{filename}"
+        },
+        background=BackgroundTask(os.remove, output_path)
+    )
 
 
 def process_file_import(task_id: str, file_path: str, filename: str):
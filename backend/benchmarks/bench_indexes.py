@@ -0,0 +1,98 @@
+"""
+索引基准测试脚本 - 热点点查在建索引前后的延迟
+
+生成一个包含 N 封邮件（默认 500 万）的临时数据库，分别在删除索引、建立索引后
+调用 DBService 的点查方法，输出每次调用的平均延迟。
+最后一项为不经 MATERIALIZED CTE、直接按 task_id + sender 过滤的对照查询：DuckDB 只对
+过滤条件全部落在单个索引列上的扫描使用索引，多列索引也不参与扫描，该查询有无索引都是全表扫描。
+get_emails_for_analysis 为批量分析生产者的分页查询（按 id 窗口反连接 analysis_results），不依赖索引，作为对照。
+
+用法：python benchmarks/bench_indexes.py [--rows 5000000] [--repeat 50]
+"""
+import sys
+import os
+import time
+import argparse
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.db_service import DBService, INDEXES, EMAIL_SELECT
+
+
+def populate(db: DBService, rows: int):
+    """两个任务各占一半邮件；5 万个发件人、20 万个主题；20% 的邮件有分析结果"""
+    db.create_task("bench", "bench")
+    db.create_task("other", "other")
+    db.conn.execute(f"""
+        INSERT INTO emails (id, task_id, sender, receiver, subject, content, timestamp)
+        SELECT range::INTEGER,
+               CASE WHEN range % 2 = 0 THEN 'bench' ELSE 'other' END,
+               'user' || (range % 50000) || '@company.com',
+               'peer' || (range % 97) || '@vendor.com',
+               '主题 ' || (range % 200000),
+               '正文 ' || range,
+               TIMESTAMP '2024-01-01' + INTERVAL (range % 86400) SECOND
+        FROM range({rows})
+    """)
+    db.conn.execute(f"""
+        INSERT INTO analysis_results (id, task_id, email_id, analysis_type, model_provider, result, created_at)
+        SELECT 'r' || range, 'bench', (range * 5)::INTEGER, 'batch_summary', 'azure', '{{}}', now()
+        FROM range({rows // 5})
+    """)
+
+
+def lookups(db: DBService):
+    return {
+        "get_emails_by_sender": lambda i: db.get_emails_by_sender("bench", f"user{i * 2 % 50000}@company.com"),
+        "get_emails_by_subject": lambda i: db.get_emails_by_subject("bench", f"主题 {i * 2}"),
+        "get_emails_by_participants": lambda i: db.get_emails_by_participants(
+            "bench", f"user{i * 2}@company.com", f"peer{i * 2 % 97}@vendor.com"),
+        "get_emails_for_analysis": lambda i: db.get_emails_for_analysis("bench", i * 4096, (i + 1) * 4096, 40),
+        "get_analysis_results": lambda i: db.get_analysis_results(i * 5, "batch_summary"),
+        "sender_without_cte": lambda i: db.conn.execute(
+            f"""SELECT {EMAIL_SELECT} FROM emails WHERE task_id = ? AND sender = ?
+                ORDER BY timestamp DESC LIMIT 50""",
+            ["bench", f"user{i * 2 % 50000}@company.com"]
+        ).fetchall(),
+    }
+
+
+def measure(db: DBService, repeat: int):
+    timings = {}
+    for name, call in lookups(db).items():
+        call(0)
+        started = time.perf_counter()
+        for i in range(1, repeat + 1):
+            call(i)
+        timings[name] = (time.perf_counter() - started) / repeat * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点查索引基准测试")
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DBService(os.path.join(tmp, "bench.duckdb"))
+        print(f"生成 {args.rows:,} 封邮件...")
+        populate(db, args.rows)
+
+        for name in INDEXES:
+            db.conn.execute(f"DROP INDEX IF EXISTS {name}")
+        before = measure(db, args.repeat)
+
+        started = time.perf_counter()
+        db.ensure_indexes()
+        print(f"建立索引耗时 {time.perf_counter() - started:.1f}s")
+        after = measure(db, args.repeat)
+
+        print(f"\n{'查询':<28}{'无索引 (ms)':>14}{'有索引 (ms)':>14}{'加速':>8}")
+        for name in before:
+            print(f"{name:<28}{before[name]:>14.2f}{after[name]:>14.2f}{before[name] / after[name]:>7.1f}x")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+JSON 响应基准测试脚本 - 逐行转换 + 标准库编码、Arrow 列批次 + orjson、分析结果原样拼接的吞吐对比
+
+生成一个包含 N 封邮件（默认 20 万，半数带分析结果）的临时数据库，对同一条查询分别用两种方式
+得到响应字节，输出每秒处理的行数：
+- 逐行：fetchall -> dict(zip) -> 逐行 isoformat / json.loads -> jsonable_encoder -> json.dumps
+  （改造前 DBService + FastAPI 默认 JSONResponse 的路径）
+- Arrow：fetch_records（Arrow 列批次整列转换）-> FastJSONResponse（orjson）
+- 原样拼接：同 Arrow，但分析结果不解析，以 orjson.Fragment 拼接进响应（raw_json=True）
+
+用法：python benchmarks/bench_json_responses.py [--rows 200000] [--repeat 10]
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from api.responses import FastJSONResponse
+from services.db_service import DBService, EMAIL_COLUMNS, fetch_records
+
+
+# 邮件列表页（先截取当前页，再只为当前页关联分析结果，与 DBService._email_listing 相同）
+LISTING_SQL = f"""
+    WITH page AS (
+        SELECT {", ".join(EMAIL_COLUMNS)} FROM emails WHERE task_id = 'bench' ORDER BY id LIMIT ?
+    ),
+    analysis AS (
+        SELECT email_id, result FROM analysis_results WHERE email_id IN (SELECT id FROM page)
+    )
+    SELECT page.*, analysis.result AS batch_analysis_result
+    FROM page
+    LEFT JOIN analysis ON analysis.email_id = page.id
+    ORDER BY page.id
+"""
+
+
+def populate(db: DBService, rows: int):
+    """邮件正文约 200 字；偶数 id 的邮件有一条 batch_summary 结果（与模型输出长度相当）"""
+    db.create_task("bench", "bench")
+    db.conn.execute(f"""
+        INSERT INTO emails (id, task_id, sender, receiver, subject, content, timestamp)
+        SELECT range::INTEGER, 'bench',
+               'user' || (range % 5000) || '@company.com',
+               'peer' || (range % 97) || '@vendor.com',
+               '主题 ' || (range % 20000),
+               repeat('邮件正文内容', 30) || range,
+               TIMESTAMP '2024-01-01' + INTERVAL (range) SECOND
+        FROM range({rows})
+    """)
+    db.conn.execute(f"""
+        INSERT INTO analysis_results (id, task_id, email_id, analysis_type, model_provider, result, created_at)
+        SELECT 'r' || range, 'bench', range::INTEGER, 'batch_summary', 'azure',
+               '{{"summary": "' || repeat('供应商要求调整付款安排，', 8) || range || '", "risk_level": "中", '
+               || '"tags": ["合同", "付款", "供应商"], "key_findings": "' || repeat('提前付款存在合规风险。', 3) || '", '
+               || '"key_points": ["确认付款节点", "复核合同条款", "通知财务"]}}', now()
+        FROM range(0, {rows}, 2)
+    """)
+
+
+def legacy_response(db: DBService, limit: int) -> bytes:
+    """改造前的路径"""
+    result = db.conn.execute(LISTING_SQL, [limit]).fetchall()
+    columns = EMAIL_COLUMNS + ["batch_analysis_result"]
+    emails = []
+    for row in result:
+        email = dict(zip(columns, row))
+        if email.get("timestamp"):
+            email["timestamp"] = email["timestamp"].isoformat()
+        if email.get("batch_analysis_result"):
+            email["batch_analysis_result"] = json.loads(email["batch_analysis_result"])
+        emails.append(email)
+    content = jsonable_encoder({"emails": emails})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def arrow_response(db: DBService, limit: int, raw_json: bool = False) -> bytes:
+    """Arrow 列批次 + orjson"""
+    emails = fetch_records(
+        db.conn.execute(LISTING_SQL, [limit]), json_columns=("batch_analysis_result",), raw_json=raw_json
+    )
+    return FastJSONResponse({"emails": emails}).body
+
+
+def raw_response(db: DBService, limit: int) -> bytes:
+    """Arrow 列批次 + 分析结果原样拼接"""
+    return arrow_response(db, limit, raw_json=True)
+
+
+def measure(call, db: DBService, limit: int, repeat: int) -> float:
+    """返回每秒行数"""
+    call(db, limit)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call(db, limit)
+    return limit * repeat / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 响应基准测试")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DBService(os.path.join(tmp, "bench.duckdb"))
+        print(f"生成 {args.rows:,} 封邮件...")
+        populate(db, args.rows)
+        expected = json.loads(legacy_response(db, 100))
+        assert json.loads(arrow_response(db, 100)) == expected == json.loads(raw_response(db, 100))
+
+        print(f"\n{'行数':>10}{'逐行 (行/秒)':>16}{'Arrow (行/秒)':>16}{'原样拼接 (行/秒)':>18}{'加速':>8}")
+        for limit in (100, 1000, 10000, args.rows):
+            legacy = measure(legacy_response, db, limit, args.repeat)
+            arrow = measure(arrow_response, db, limit, args.repeat)
+            raw = measure(raw_response, db, limit, args.repeat)
+            print(f"{limit:>10,}{legacy:>16,.0f}{arrow:>16,.0f}{raw:>18,.0f}{raw / legacy:>7.1f}x")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
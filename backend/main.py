@@ -3,8 +3,12 @@ Student c - 后端主入口
 FastAPI 应用配置
 """
 # Trigger reload
-from fastapi import FastAPI
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 import os
 
@@ -17,6 +21,8 @@ from api.clusters_api import router as clusters_router
 from api.preview_api import router as preview_router
 from api.config_api import router as config_router
 from api.batch_analysis_api import router as batch_analysis_router
+from services.async_db_service import DBQueryTimeout
+from services.db_service import get_db_service
 
 # 加载环境变量
 # 加载环境变量
@@ -26,11 +32,19 @@ load_dotenv()
 os.makedirs('data', exist_ok=True)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时在后台线程中为旧版本导入的任务构建聚类物化表和统计汇总（读取方不触发构建）"""
+    threading.Thread(target=get_db_service().backfill_rollups, daemon=True).start()
+    yield
+
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="Student c API",
     description="本地化邮件分析系统 API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -42,6 +56,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 数据库查询超时返回 504，不影响其他请求
+@app.exception_handler(DBQueryTimeout)
+async def db_query_timeout_handler(request: Request, exc: DBQueryTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
 # 注册路由
 app.include_router(task_router)
 app.include_router(analysis_router)
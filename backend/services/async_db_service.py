@@ -0,0 +1,113 @@
+"""
+异步数据库服务模块 - 在专用线程池中执行 DuckDB 查询，避免阻塞事件循环
+
+async 路由直接调用 DBService 时，查询在事件循环线程中同步执行，
+一次数秒的聚合会让其他请求（包括 /health 和批量分析的 asyncio 任务）全部停顿。
+AsyncDBService 将 DBService 的每个方法包装为协程：
+- 在独立的线程池中执行（与默认 executor 分开，大小为 DB_EXECUTOR_WORKERS）
+- 每次调用有超时（DB_QUERY_TIMEOUT 秒），超时后中断该线程上的查询并抛出 DBQueryTimeout
+
+用法：db = get_async_db_service(); task = await db.get_task(task_id)
+      长耗时调用可单独指定超时：await db.export_task(..., timeout=EXPORT_TIMEOUT)
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from services.db_service import DBService, get_db_service
+
+
+# 查询线程池大小，默认与读游标池一致
+DEFAULT_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_SIZE", "8")))
+# 单次调用超时（秒）
+DEFAULT_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", "30"))
+# 导出等长耗时调用的超时（秒）
+EXPORT_TIMEOUT = float(os.getenv("DB_EXPORT_TIMEOUT", "600"))
+
+
+class DBQueryTimeout(Exception):
+    """数据库调用超时"""
+
+    def __init__(self, method: str, timeout: float):
+        super().__init__(f"数据库查询超时: {method} 超过 {timeout:g} 秒")
+        self.method = method
+        self.timeout = timeout
+
+
+class AsyncDBService:
+    """DBService 的异步包装"""
+
+    def __init__(
+        self,
+        db: DBService,
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        self.db = db
+        self.timeout = timeout or DEFAULT_QUERY_TIMEOUT
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or DEFAULT_EXECUTOR_WORKERS, thread_name_prefix="duckdb"
+        )
+
+    async def run(self, func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在查询线程池中执行 func(*args, **kwargs)
+
+        调用期间绑定一个读游标（写方法内部自动切换到写入通道）；超时后中断读游标上的查询，
+        写入不会被中断，会在后台完成。
+        """
+        timeout = timeout or self.timeout
+        # 执行线程绑定的游标；执行结束前清空，避免超时后中断已归还给其他调用的游标
+        binding: Dict[str, Any] = {}
+        lock = threading.Lock()
+
+        def call():
+            with self.db.connections.reader() as conn:
+                with lock:
+                    binding["conn"] = conn
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    with lock:
+                        binding.pop("conn", None)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, call)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with lock:
+                conn = binding.get("conn")
+                if conn is not None:
+                    conn.interrupt()
+            raise DBQueryTimeout(getattr(func, "__name__", "query"), timeout) from None
+
+    def __getattr__(self, name: str):
+        """将 DBService 的方法包装为协程：await db.get_task(task_id)"""
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+        return wrapper
+
+    def shutdown(self):
+        """关闭查询线程池"""
+        self._executor.shutdown(wait=False)
+
+
+# 全局异步数据库服务实例
+_async_db_service: Optional[AsyncDBService] = None
+
+
+def get_async_db_service() -> AsyncDBService:
+    """获取异步数据库服务实例（单例模式）"""
+    global _async_db_service
+    if _async_db_service is None:
+        _async_db_service = AsyncDBService(get_db_service())
+    return _async_db_service
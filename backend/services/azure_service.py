@@ -6,7 +6,7 @@ import os
 import json
 import asyncio
 from typing import Optional
-from openai import AzureOpenAI
+from openai import AzureOpenAI, APIError
 from .ai_base import (
     AIServiceBase,
     SummaryResult,
@@ -27,7 +27,8 @@ class AzureService(AIServiceBase):
         api_key: Optional[str] = None,
         endpoint: Optional[str] = None,
         deployment_name: Optional[str] = None,
-        api_version: str = "2024-02-01"
+        api_version: str = "2024-02-01",
+        max_retries: Optional[int] = None
     ):
         super().__init__(deployment_name or "gpt-35-turbo")
         
@@ -45,10 +46,13 @@ class AzureService(AIServiceBase):
             )
         
         # 初始化 Azure OpenAI 客户端
+        # max_retries: SDK 自动重试次数（默认 2）；批量分析传 0，由自适应并发控制处理 429
+        client_options = {} if max_retries is None else {"max_retries": max_retries}
         self.client = AzureOpenAI(
             api_key=self.api_key,
             api_version=api_version,
-            azure_endpoint=self.endpoint
+            azure_endpoint=self.endpoint,
+            **client_options
         )
     
     async def summarize(self, text: str, max_length: int = 150) -> SummaryResult:
@@ -243,6 +247,10 @@ class AzureService(AIServiceBase):
                 key_findings=result.get("key_findings", ""),
                 key_points=result.get("key_points", [])
             )
+        except APIError:
+            # API 错误（限流、连接失败、超时、5xx 等）交给调用方：批量分析据此调整并发并重试，
+            # 重试用尽计为失败，不把默认结果当作成功保存（SDK 自动重试已关闭）
+            raise
         except Exception as e:
             # 发生错误时返回一个安全的默认结果
             print(f"Azure analyze_email failed: {e}")
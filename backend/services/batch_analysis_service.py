@@ -11,6 +11,10 @@ import json
 
 from services.db_service import get_db_service
 from services.config_service import get_config_service
+from services.ai_base import EmailAnalysisResult
+from services.result_sink import AnalysisResultSink
+from services.progress_board import get_progress_board
+from services.concurrency_limiter import AdaptiveConcurrencyLimiter, is_rate_limited
 
 
 # 默认分析 Prompt 模板（涉密/合规分析 + 标签提取）
@@ -37,6 +41,11 @@ DEFAULT_FILTER_KEYWORDS = [
     "Undeliverable"
 ]
 
+# 批量分析队列容量（并行度的倍数），生产者每次最多读取同样数量的邮件
+PIPELINE_QUEUE_FACTOR = 2
+# 生产者每次查询扫描的邮件 id 窗口大小（窗口内待分析的邮件不足一批时移到下一个窗口）
+PIPELINE_SCAN_SPAN = 4096
+
 # 正在运行的任务存储
 _running_jobs: Dict[str, asyncio.Task] = {}
 
@@ -46,8 +55,6 @@ class BatchAnalysisService:
     
     def __init__(self):
         self.db = get_db_service()
-        # 任务级别的脱敏服务实例管理（确保同一任务中 Token 一致）
-        self.task_masking_services = {}  # task_id -> PIIMaskingService
         # 服务启动时清理僵尸任务
         self._cleanup_zombie_jobs()
     
@@ -108,7 +115,7 @@ class BatchAnalysisService:
         """
         恢复已中断或取消的任务
         本质是创建一个新任务，但使用旧任务的配置
-        由于 analyze process 会检查是否已分析，所以会自动跳过已完成的
+        新任务的待处理集合排除已有结果的邮件，只处理未完成的
         """
         old_job = self.db.get_batch_job(old_job_id)
         if not old_job:
@@ -128,10 +135,11 @@ class BatchAnalysisService:
     async def _run_job(self, job_id: str):
         """执行批量分析任务（后台运行）"""
         db = get_db_service()
+        board = get_progress_board()
         
         try:
             # 获取任务详情
-            job = db.get_batch_job(job_id)
+            job = await asyncio.to_thread(db.get_batch_job, job_id)
             if not job:
                 print(f"[BatchAnalysis] Job {job_id} not found")
                 return
@@ -139,165 +147,194 @@ class BatchAnalysisService:
             print(f"[BatchAnalysis] Starting job {job_id} with concurrency {job['concurrency']}")
             
             # 更新状态为运行中
-            db.update_batch_job_status(job_id, "RUNNING")
+            await asyncio.to_thread(db.update_batch_job_status, job_id, "RUNNING")
             
             analysis_type = job.get("analysis_type", "email")
             
+            filter_keywords = job.get("filter_keywords", [])
+            done_count = 0
             if analysis_type == "email":
                 # === 邮件分析逻辑 ===
-                emails, skipped_count = db.get_emails_for_batch_analysis(
-                    job["task_id"],
-                    job.get("filter_keywords", [])
+                # 一条语句统计待分析的邮件数（排除被过滤和已有结果的），邮件由生产者按 id 顺序分页读取；
+                # 恢复的任务只处理未完成的邮件
+                work_set = await asyncio.to_thread(
+                    db.get_batch_work_set, job["task_id"], filter_keywords
                 )
-                items_to_process = emails
+                item_count = work_set["pending"]
+                skipped_count = work_set["skipped"]
+                done_count = work_set["done"]
             else:
                 # === 聚类分析逻辑 ===
                 # 解析 cluster_type: "people_cluster" -> "people", "subject_cluster" -> "subjects"
                 cluster_type = "people" if analysis_type == "people_cluster" else "subjects"
-                clusters = db.get_clusters_for_batch_analysis(job["task_id"], cluster_type)
-                items_to_process = clusters
+                # 聚类列表只有聚类键和邮件数，一次读取
+                clusters = await asyncio.to_thread(
+                    db.get_clusters_for_batch_analysis, job["task_id"], cluster_type
+                )
+                item_count = len(clusters)
                 skipped_count = 0 # 聚类分析暂无过滤逻辑
 
-            total_count = len(items_to_process) + skipped_count
-            db.update_batch_job_total_count(job_id, total_count)
-            
-            print(f"[BatchAnalysis] Job {job_id} ({analysis_type}): {len(items_to_process)} items to process")
+            total_count = item_count + skipped_count + done_count
+            # 并发控制：从用户选择的并行度开始，按 LLM 的延迟和限流自动调整
+            limiter = AdaptiveConcurrencyLimiter(initial=job["concurrency"])
+            # 计数保存在进度看板中，定时写入数据库；已有结果的邮件计为已处理（成功）
+            progress = await board.start_job(job_id, total_count, skipped_count, done_count, limiter=limiter)
             
-            # 初始化计数器
-            processed = 0
-            success = 0
-            failed = 0
+            print(f"[BatchAnalysis] Job {job_id} ({analysis_type}): {item_count} items to process, {done_count} already analyzed")
             
             # 获取 AI 服务
             ai_service = self._get_ai_service(job["model_provider"])
             
-            # 并发控制
-            semaphore = asyncio.Semaphore(job["concurrency"])
+            # 消费者数为并发上限的最大值，实际同时发出的请求数由 limiter 控制；
+            # 队列有界，内存中的邮件数与并行度成正比，与任务规模无关
+            concurrency = limiter.max_limit
+            queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * PIPELINE_QUEUE_FACTOR)
+            
+            async def produce():
+                """生产者：按 id 顺序逐批读取待分析的邮件放入队列（队列满时等待），最后为每个消费者放入结束标记"""
+                if analysis_type == "email":
+                    after_id = work_set["first_id"] - 1
+                    while after_id < work_set["last_id"]:
+                        through_id = min(after_id + PIPELINE_SCAN_SPAN, work_set["last_id"])
+                        batch = await asyncio.to_thread(
+                            db.get_emails_for_analysis, job["task_id"], after_id, through_id,
+                            queue.maxsize, filter_keywords
+                        )
+                        # 读满一批时窗口内可能还有，从本批最后的 id 继续；否则窗口已读完
+                        after_id = batch[-1]["id"] if len(batch) == queue.maxsize else through_id
+                        for email in batch:
+                            await queue.put(email)
+                else:
+                    for cluster in clusters:
+                        await queue.put(cluster)
+                for _ in range(concurrency):
+                    await queue.put(None)
+            
+            async def consume():
+                """消费者：逐项取出处理，直到结束标记"""
+                while (item := await queue.get()) is not None:
+                    board.item_started(job_id)
+                    board.item_finished(job_id, await process_item(item))
             
             async def process_item(item):
-                async with semaphore:
-                    try:
-                        if analysis_type == "email":
-                            # === 邮件处理 ===
-                            email = item
-                            # 检查是否已有分析结果
-                            if db.has_email_analysis(email["id"], "batch_summary"):
-                                print(f"[BatchAnalysis] Email {email['id']}: Already analyzed, skipping")
-                                return "EXISTING"
-                            
-                            print(f"[BatchAnalysis] Processing email {email['id']}")
-                            
-                            # 执行分析（带重试）
-                            result = await self._analyze_with_retry(
-                                ai_service,
-                                email,
-                                job["prompt"],
-                                job["max_retries"],
-                                task_id=job["task_id"]  # 传递 task_id 确保脱敏 Token 一致性
+                try:
+                    if analysis_type == "email":
+                        # === 邮件处理 ===
+                        email = item
+                        print(f"[BatchAnalysis] Processing email {email['id']}")
+                        
+                        # 执行分析（带重试）
+                        result = await self._analyze_with_retry(
+                            ai_service,
+                            email,
+                            job["prompt"],
+                            job["max_retries"],
+                            task_id=job["task_id"],  # 传递 task_id 确保脱敏 Token 一致性
+                            limiter=limiter
+                        )
+                        
+                        # 保存结果（写入缓冲，批量写入数据库）
+                        if result:
+                            analysis_id = str(uuid.uuid4())
+                            sink.put(
+                                result_id=analysis_id,
+                                task_id=job["task_id"],
+                                email_id=email["id"],
+                                analysis_type="batch_summary",
+                                model_provider=job["model_provider"],
+                                result=result
                             )
-                            
-                            # 保存结果
-                            if result:
-                                analysis_id = str(uuid.uuid4())
-                                db.save_analysis_result(
-                                    result_id=analysis_id,
-                                    task_id=job["task_id"],
-                                    email_id=email["id"],
-                                    analysis_type="batch_summary",
-                                    model_provider=job["model_provider"],
-                                    result=result
+                            print(f"[BatchAnalysis] Email {email['id']}: Success")
+                            return "SUCCESS"
+                        else:
+                            print(f"[BatchAnalysis] Email {email['id']}: Failed (no result)")
+                            return "FAILED"
+
+                    else:
+                        # === 聚类处理 ===
+                        cluster = item
+                        cluster_key = cluster["key"]
+                        
+                        # 检查是否已有分析结果 (可选，目前聚类分析总是允许覆盖更新，或者我们可以检查 updated_at)
+                        # 这里暂不跳过，因为聚类内容可能变化
+                        
+                        print(f"[BatchAnalysis] Processing cluster {cluster_key}")
+                        
+                        # 执行分析
+                        cluster_type_short = "people" if analysis_type == "people_cluster" else "subjects"
+                        
+                         # 获取聚类邮件 (limit 20)
+                        if cluster_type_short == "people":
+                            parts = cluster_key.split(" ↔ ")
+                            if len(parts) == 2:
+                                emails = await asyncio.to_thread(
+                                    db.get_emails_by_participants,
+                                    job["task_id"], parts[0], parts[1], limit=20,
+                                    include_clean=True, include_masked=True
                                 )
-                                print(f"[BatchAnalysis] Email {email['id']}: Success")
-                                return "SUCCESS"
                             else:
-                                print(f"[BatchAnalysis] Email {email['id']}: Failed (no result)")
-                                return "FAILED"
-
+                                emails = []
                         else:
-                            # === 聚类处理 ===
-                            cluster = item
-                            cluster_key = cluster["key"]
-                            
-                            # 检查是否已有分析结果 (可选，目前聚类分析总是允许覆盖更新，或者我们可以检查 updated_at)
-                            # 这里暂不跳过，因为聚类内容可能变化
-                            
-                            print(f"[BatchAnalysis] Processing cluster {cluster_key}")
-                            
-                            # 执行分析
-                            cluster_type_short = "people" if analysis_type == "people_cluster" else "subjects"
-                            
-                             # 获取聚类邮件 (limit 20)
-                            if cluster_type_short == "people":
-                                parts = cluster_key.split(" ↔ ")
-                                if len(parts) == 2:
-                                    emails = db.get_emails_by_participants(job["task_id"], parts[0], parts[1], limit=20)
-                                else:
-                                    emails = []
-                            else:
-                                emails = db.get_emails_by_subject(job["task_id"], cluster_key, limit=20)
-                            
-                            if not emails:
-                                return "FAILED"
+                            emails = await asyncio.to_thread(
+                                db.get_emails_by_subject,
+                                job["task_id"], cluster_key, limit=20, include_clean=True, include_masked=True
+                            )
+                        
+                        if not emails:
+                            return "FAILED"
 
-                            # 执行分析（带重试）
-                            result = await self._analyze_cluster_with_retry(
-                                ai_service,
-                                emails,
-                                job["prompt"],  # 可以在这里根据 analysis_type 调整默认 prompt
-                                job["max_retries"],
-                                task_id=job["task_id"]  # 传递 task_id 确保脱敏 Token 一致性
+                        # 执行分析（带重试）
+                        result = await self._analyze_cluster_with_retry(
+                            ai_service,
+                            emails,
+                            job["prompt"],  # 可以在这里根据 analysis_type 调整默认 prompt
+                            job["max_retries"],
+                            task_id=job["task_id"],  # 传递 task_id 确保脱敏 Token 一致性
+                            limiter=limiter
+                        )
+                        
+                        if result:
+                            await asyncio.to_thread(
+                                db.save_cluster_insight,
+                                task_id=job["task_id"],
+                                cluster_type=cluster_type_short,
+                                cluster_key=cluster_key,
+                                ai_insight=result,
+                                model=job["model_provider"]
                             )
-                            
-                            if result:
-                                db.save_cluster_insight(
-                                    task_id=job["task_id"],
-                                    cluster_type=cluster_type_short,
-                                    cluster_key=cluster_key,
-                                    ai_insight=result,
-                                    model=job["model_provider"]
-                                )
-                                print(f"[BatchAnalysis] Cluster {cluster_key}: Success")
-                                return "SUCCESS"
-                            else:
-                                return "FAILED"
+                            print(f"[BatchAnalysis] Cluster {cluster_key}: Success")
+                            return "SUCCESS"
+                        else:
+                            return "FAILED"
 
-                    except Exception as e:
-                        print(f"[BatchAnalysis] Error processing item: {e}")
-                        return "FAILED"
+                except Exception as e:
+                    print(f"[BatchAnalysis] Error processing item: {e}")
+                    return "FAILED"
 
-            # 创建并执行所有任务
-            tasks = [process_item(item) for item in items_to_process]
-            
-            if tasks:
-                for future in asyncio.as_completed(tasks):
-                    status = await future
-                    
-                    if status == "SUCCESS":
-                        success += 1
-                    elif status == "FAILED":
-                        failed += 1
-                    elif status == "EXISTING":
-                        success += 1
-                        
-                    processed += 1
-                    
-                    # 实时更新进度
-                    db.update_batch_job_progress(
-                        job_id, processed, success, failed, skipped_count
-                    )
+            # 启动生产者和消费者；任一失败或任务被取消时停止其余协程，
+            # 退出时（完成、失败或取消）写入缓冲中的全部结果
+            async with AnalysisResultSink(db) as sink:
+                pipeline = [asyncio.create_task(produce())]
+                pipeline += [asyncio.create_task(consume()) for _ in range(concurrency)]
+                try:
+                    await asyncio.gather(*pipeline)
+                finally:
+                    for stage in pipeline:
+                        stage.cancel()
+                    await asyncio.gather(*pipeline, return_exceptions=True)
             
-            # 更新状态为完成
-            db.update_batch_job_status(job_id, "COMPLETED")
-            print(f"[BatchAnalysis] Job {job_id} completed: {success} success, {failed} failed")
+            # 更新状态为完成（同时写入最终计数）
+            await board.finish_job(job_id, "COMPLETED")
+            print(f"[BatchAnalysis] Job {job_id} completed: {progress.success} success, {progress.failed} failed")
             
         except asyncio.CancelledError:
              print(f"[BatchAnalysis] Job {job_id} cancelled")
-             db.update_batch_job_status(job_id, "CANCELLED")
+             await asyncio.shield(board.finish_job(job_id, "CANCELLED"))
              # 不需要 re-raise，否则外层会报错，这里已经处理了状态
              
         except Exception as e:
             print(f"[BatchAnalysis] Job {job_id} failed: {e}")
-            db.update_batch_job_status(job_id, "FAILED", str(e))
+            await asyncio.shield(board.finish_job(job_id, "FAILED", str(e)))
         
         finally:
             # 清理任务引用
@@ -310,26 +347,17 @@ class BatchAnalysisService:
         email: Dict[str, Any],
         prompt_template: str,
         max_retries: int,
-        task_id: str = None
-    ) -> Optional[Dict[str, Any]]:
-        """带重试的单封邮件分析"""
-        from services.pii_masking_service import PIIMaskingService
-        
-        # 获取或创建任务级别的脱敏服务实例
-        if task_id and task_id not in self.task_masking_services:
-            self.task_masking_services[task_id] = PIIMaskingService()
-        masking_service = self.task_masking_services.get(task_id) if task_id else PIIMaskingService()
-        
-        # 构建分析文本
-        raw_text = f"主题: {email.get('subject', '无主题')}\n\n{email.get('content', '')}"
+        task_id: str = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None
+    ) -> Optional[EmailAnalysisResult]:
+        """
+        带重试的单封邮件分析（返回模型，保存时直接序列化为 JSON，不先转为 dict）
         
+        每次调用占用 limiter 的一个并发名额；限流时由 limiter 按 Retry-After 暂停所有请求，不再各自退避
+        """
+        limiter = limiter or AdaptiveConcurrencyLimiter(initial=1)
         # 🔒 脱敏处理：将敏感信息替换为 Token
-        masked_text, token_map = masking_service.mask_text(raw_text)
-        
-        # 记录脱敏统计（调试用）
-        if token_map:
-            stats = masking_service.get_statistics()
-            print(f"[PII] Email {email.get('id')}: 脱敏统计 {stats}")
+        masked_text = await self.build_masked_email_text(email, task_id)
         
         for attempt in range(max_retries):
             try:
@@ -338,15 +366,14 @@ class BatchAnalysisService:
                 # 调用 AI 服务（增加 60秒 超时保护）
                 # 使用 asyncio.wait_for 防止 API 调用无限挂起
                 # ⚠️ 关键：使用脱敏后的文本，确保敏感信息不泄露给 LLM
-                result_model = await asyncio.wait_for(
-                    ai_service.analyze_email(masked_text, prompt_template),
+                result_model = await limiter.call(
+                    lambda: ai_service.analyze_email(masked_text, prompt_template),
                     timeout=60.0
                 )
                 
                 print(f"[BatchAnalysis] Email {email['id']}: API call success (PII masked)")
 
-                # 转换为字典
-                return result_model.model_dump()
+                return result_model
                 
             except asyncio.TimeoutError:
                 print(f"[BatchAnalysis] Email {email['id']}: Attempt {attempt + 1} TIMEOUT (60s)")
@@ -357,22 +384,51 @@ class BatchAnalysisService:
                 print(f"[BatchAnalysis] Attempt {attempt + 1}/{max_retries} failed: {e}")
                 
                 if attempt < max_retries - 1:
-                    # 指数退避
-                    wait_time = (2 ** attempt) + (0.1 * attempt)
-                    await asyncio.sleep(wait_time)
+                    # 指数退避（限流时 limiter 已暂停所有请求）
+                    if not is_rate_limited(e):
+                        wait_time = (2 ** attempt) + (0.1 * attempt)
+                        await asyncio.sleep(wait_time)
                 else:
                     return None
         
         return None
     
+    def get_masking_service(self, task_id: Optional[str] = None):
+        """
+        获取任务级别的脱敏服务实例（确保同一任务中 Token 一致）
+        以 pii_tokens 表中已持久化的映射为基础，与导入时预脱敏共用同一实例
+        """
+        from services.pii_masking_service import PIIMaskingService, get_task_masking_service
+        
+        if not task_id:
+            return PIIMaskingService()
+        return get_task_masking_service(task_id, lambda: self.db.get_pii_tokens(task_id))
+    
+    async def mask_for_task(self, text: str, task_id: Optional[str] = None) -> str:
+        """实时脱敏；新分配的 Token 写入 pii_tokens，之后的预脱敏沿用同一映射"""
+        masking_service = self.get_masking_service(task_id)
+        masked_text, new_tokens = masking_service.mask_text_with_new_tokens(text)
+        if task_id and new_tokens:
+            await asyncio.to_thread(self.db.save_pii_tokens, task_id, new_tokens)
+        return masked_text
+    
+    async def build_masked_email_text(self, email: Dict[str, Any], task_id: Optional[str] = None) -> str:
+        """构建发送给 LLM 的单封邮件文本（已预脱敏时直接读取，否则实时脱敏）"""
+        if email.get("masked_content") is not None:
+            return f"主题: {email.get('masked_subject', '无主题')}\n\n{email['masked_content']}"
+        
+        # 构建分析文本
+        raw_text = f"主题: {email.get('subject', '无主题')}\n\n{email.get('content', '')}"
+        return await self.mask_for_task(raw_text, task_id)
+    
     def _get_ai_service(self, model: str = "azure"):
-        """获取 AI 服务实例 (仅支持 Azure)"""
+        """获取 AI 服务实例 (仅支持 Azure)；关闭 SDK 自动重试，429 交给自适应并发控制"""
         from services.azure_service import AzureService
-        return AzureService()
+        return AzureService(max_retries=0)
     
     def get_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
-        """获取任务状态"""
-        return self.db.get_batch_job(job_id)
+        """获取任务状态（运行中的任务从进度看板读取）"""
+        return get_progress_board().snapshot(job_id) or self.db.get_batch_job(job_id)
     
     def get_jobs_by_task(self, task_id: str) -> List[Dict[str, Any]]:
         """获取指定任务的所有分析作业"""
@@ -382,6 +438,7 @@ class BatchAnalysisService:
         """取消任务"""
         # 更新数据库状态
         self.db.update_batch_job_status(job_id, "CANCELLED")
+        get_progress_board().set_status(job_id, "CANCELLED")
         
         # 尝试取消正在运行的任务
         if job_id in _running_jobs:
@@ -416,40 +473,44 @@ class BatchAnalysisService:
         emails: List[Dict[str, Any]],
         prompt_template: str,
         max_retries: int,
-        task_id: str = None
+        task_id: str = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None
     ) -> Optional[str]:
-        """带重试的聚类分析"""
-        import json as json_lib
+        """带重试的聚类分析（并发控制同 _analyze_with_retry）"""
+        limiter = limiter or AdaptiveConcurrencyLimiter(initial=1)
         from services.email_dedup_service import EmailDedupService
-        from services.pii_masking_service import PIIMaskingService
-        
-        # 获取或创建任务级别的脱敏服务实例
-        if task_id and task_id not in self.task_masking_services:
-            self.task_masking_services[task_id] = PIIMaskingService()
-        masking_service = self.task_masking_services.get(task_id) if task_id else PIIMaskingService()
-        
-        # 构建分析上下文
-        raw_context = EmailDedupService.build_deduped_context(emails)
         
-        # 🔒 脱敏处理：将敏感信息替换为 Token
-        masked_context, token_map = masking_service.mask_text(raw_context)
-        
-        # 记录脱敏统计（调试用）
-        if token_map:
-            stats = masking_service.get_statistics()
-            print(f"[PII] Cluster: 脱敏统计 {stats}")
+        if emails and all(email.get("masked_content") is not None for email in emails):
+            # 导入时已预脱敏：直接用脱敏后的字段构建上下文，无需再脱敏
+            masked_context = EmailDedupService.build_deduped_context([
+                {
+                    **email,
+                    "sender": email.get("masked_sender"),
+                    "receiver": email.get("masked_receiver"),
+                    "subject": email.get("masked_subject"),
+                    "content": email.get("masked_content"),
+                    "clean_content": email.get("masked_clean_content")
+                }
+                for email in emails
+            ])
+        else:
+            # 构建分析上下文
+            raw_context = EmailDedupService.build_deduped_context(emails)
+            
+            # 🔒 脱敏处理：将敏感信息替换为 Token
+            masked_context = await self.mask_for_task(raw_context, task_id)
         
         for attempt in range(max_retries):
             try:
                 # 调用 AI 服务
                 # ⚠️ 关键：使用脱敏后的上下文，确保敏感信息不泄露给 LLM
-                result_model = await asyncio.wait_for(
-                    ai_service.analyze_email(masked_context, prompt_template),
+                result_model = await limiter.call(
+                    lambda: ai_service.analyze_email(masked_context, prompt_template),
                     timeout=90.0  # 聚类文本较长，给予更多时间
                 )
                 
                 # 聚类分析目前期望返回 JSON 字符串
-                return json_lib.dumps(result_model.model_dump(), ensure_ascii=False)
+                return result_model.model_dump_json()
                 
             except asyncio.TimeoutError:
                 if attempt < max_retries - 1:
@@ -457,7 +518,8 @@ class BatchAnalysisService:
             except Exception as e:
                 # print(f"Cluster analysis failed: {e}") # Debug log
                 if attempt < max_retries - 1:
-                    await asyncio.sleep((2 ** attempt))
+                    if not is_rate_limited(e):
+                        await asyncio.sleep((2 ** attempt))
                 else:
                     return None
         
@@ -488,7 +550,7 @@ async def analyze_single_email(
     db = get_db_service()
     
     # 获取邮件
-    email = db.get_email_by_id(email_id)
+    email = db.get_email_by_id(email_id, include_masked=True)
     if not email:
         raise ValueError("邮件不存在")
     
@@ -514,18 +576,8 @@ async def analyze_single_email(
     from services.azure_service import AzureService
     ai_service = AzureService()
     
-    # 构建分析文本
-    raw_text = f"主题: {email.get('subject', '无主题')}\n\n{email.get('content', '')}"
-    
-    # 🔒 脱敏处理：防止敏感信息泄露给 LLM
-    from services.pii_masking_service import PIIMaskingService
-    masking_service = PIIMaskingService()
-    masked_text, token_map = masking_service.mask_text(raw_text)
-    
-    # 记录脱敏统计（调试用）
-    if token_map:
-        stats = masking_service.get_statistics()
-        print(f"[PII] Single Email {email_id}: 脱敏统计 {stats}")
+    # 🔒 脱敏处理：防止敏感信息泄露给 LLM（使用任务级 Token，与批量分析一致）
+    masked_text = await get_batch_analysis_service().build_masked_email_text(email, task_id)
     
     # 调用 AI
     # 使用 unified analyze_email
@@ -0,0 +1,188 @@
+"""
+自适应并发控制 - 批量分析的 LLM 请求并发数按 AIMD（加性增、乘性减）自动调整
+
+固定并行度太低浪费配额，太高会触发成片的 429。AdaptiveConcurrencyLimiter：
+- 从用户选择的并行度开始；请求成功、延迟不超过基线的 LATENCY_TOLERANCE 倍、
+  最近的错误率低于 ERROR_RATE_LIMIT，且并发已用满时，每完成约一个窗口的请求上限加 1
+- 429 或超时时上限减半（同一轮拥塞只减一次）；429 带 Retry-After 时所有请求暂停到该时刻
+- 上限变化记录在 history 中，随任务状态返回
+
+用法：
+    limiter = AdaptiveConcurrencyLimiter(initial=5)
+    result = await limiter.call(lambda: ai_service.analyze_email(text, prompt), timeout=60.0)
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+# 并发上限的最大值
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "20"))
+# 延迟超过基线（最低平滑延迟）的倍数时不再增加并发
+LATENCY_TOLERANCE = 2.0
+# 最近 ERROR_WINDOW 次请求的错误率超过该值时不再增加并发
+ERROR_RATE_LIMIT = 0.1
+ERROR_WINDOW = 50
+# 限流 / 超时时上限乘以该系数
+BACKOFF_FACTOR = 0.5
+# 429 未带 Retry-After 时的暂停时间（秒）
+DEFAULT_RETRY_AFTER = 1.0
+# 保留的上限变化记录数
+HISTORY_SIZE = 100
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """是否为限流错误（HTTP 429）"""
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """从错误响应的 retry-after-ms / Retry-After（秒数或 HTTP 日期）读取需要等待的秒数"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+    except (KeyError, TypeError, ValueError):
+        pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 并发控制（在事件循环中使用）"""
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: Optional[int] = None):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit or DEFAULT_MAX_CONCURRENCY, initial)
+        # 窗口为浮点数，每次成功加 1/窗口，约一个窗口的请求后上限加 1
+        self._window = float(max(min(initial, self.max_limit), min_limit))
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+        self._paused_until = 0.0
+        self._last_backoff = 0.0
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._outcomes: Deque[bool] = deque(maxlen=ERROR_WINDOW)
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+        self._record("start")
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return int(self._window)
+
+    @property
+    def error_rate(self) -> float:
+        """最近 ERROR_WINDOW 次请求的错误率"""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _record(self, reason: str):
+        self.history.append({
+            "at": datetime.now().isoformat(),
+            "limit": self.limit,
+            "reason": reason,
+        })
+
+    async def acquire(self):
+        """等待并占用一个并发名额；Retry-After 暂停期间不发出新请求"""
+        async with self._cond:
+            while True:
+                delay = self._paused_until - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                else:
+                    await self._cond.wait()
+
+    async def release(self):
+        """归还并发名额"""
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float):
+        """请求成功：更新延迟，健康且并发已用满时加性增加上限"""
+        self._outcomes.append(True)
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        self._baseline = self._latency if self._baseline is None else min(self._baseline, self._latency)
+        healthy = (
+            self._latency <= self._baseline * LATENCY_TOLERANCE
+            and self.error_rate < ERROR_RATE_LIMIT
+        )
+        if healthy and self.in_flight >= self.limit and self.limit < self.max_limit:
+            before = self.limit
+            self._window = min(self._window + 1 / self._window, float(self.max_limit))
+            if self.limit != before:
+                self._record("increase")
+
+    def on_throttle(self, reason: str, retry_after: Optional[float] = None):
+        """限流或超时：乘性减小上限（一轮拥塞只减一次），按 Retry-After 暂停"""
+        self._outcomes.append(False)
+        now = time.monotonic()
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        # 同一轮中已发出的请求陆续返回的 429 不再重复减半
+        if now - self._last_backoff >= max(self._latency or 0.0, 1.0):
+            self._last_backoff = now
+            before = self.limit
+            self._window = max(self._window * BACKOFF_FACTOR, float(self.min_limit))
+            if self.limit != before:
+                self._record(reason)
+
+    def on_error(self):
+        """其他错误：只计入错误率"""
+        self._outcomes.append(False)
+
+    async def call(self, make_call: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        """在并发名额内执行一次请求（带超时），根据结果调整上限；异常原样抛出"""
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(make_call(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.on_throttle("timeout")
+            raise
+        except Exception as e:
+            if is_rate_limited(e):
+                self.on_throttle("rate_limited", retry_after_seconds(e) or DEFAULT_RETRY_AFTER)
+            else:
+                self.on_error()
+            raise
+        else:
+            self.on_success(time.monotonic() - started)
+            return result
+        finally:
+            await asyncio.shield(self.release())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前上限与变化记录（任务状态使用）"""
+        paused = self._paused_until - time.monotonic()
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "paused_seconds": round(paused, 1) if paused > 0 else 0,
+            "history": list(self.history),
+        }
@@ -0,0 +1,120 @@
+"""
+数据库连接管理模块 - 为每个请求 / 工作线程分配独立的 DuckDB 游标
+
+同一个 duckdb.connect 句柄不能被多个线程同时使用，共用时所有查询串行执行；
+conn.cursor() 得到的游标共享同一个数据库实例，但可以在各自的线程中并行执行。
+
+- 读取：从有界游标池中借出独立游标，用完归还；池满时等待，限制并发查询数
+- 写入：专用写入通道（单个写游标 + 可重入锁），写操作按语句粒度串行，
+  大文件导入逐块提交时不会长时间独占，读取不受写入阻塞
+- 游标按线程调用栈绑定：嵌套调用复用外层游标；读取中发起写入时切换到写入通道
+"""
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import duckdb
+
+
+# 读游标池大小（同时执行的读查询上限）
+DEFAULT_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+
+class ConnectionManager:
+    """DuckDB 游标池 + 写入通道"""
+
+    def __init__(self, db_path: str, pool_size: Optional[int] = None):
+        self.db_path = db_path
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self._root = duckdb.connect(db_path)
+        self._idle: "queue.LifoQueue[duckdb.DuckDBPyConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._writer = self._root.cursor()
+        self._writer_lock = threading.RLock()
+        self._local = threading.local()
+        # 不在任何读写范围内访问时按线程创建的游标（兼容直接使用 DBService.conn 的代码）
+        self._adhoc: List[duckdb.DuckDBPyConnection] = []
+        self._adhoc_lock = threading.Lock()
+
+    def _stack(self) -> List[duckdb.DuckDBPyConnection]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def reader(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """借出读游标；当前线程已绑定游标时直接复用"""
+        stack = self._stack()
+        if stack:
+            yield stack[-1]
+            return
+
+        with self.checkout() as cursor:
+            stack.append(cursor)
+            try:
+                yield cursor
+            finally:
+                stack.pop()
+
+    @contextmanager
+    def writer(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """进入写入通道；同一线程内可重入"""
+        stack = self._stack()
+        if stack and stack[-1] is self._writer:
+            yield self._writer
+            return
+
+        with self._writer_lock:
+            stack.append(self._writer)
+            try:
+                yield self._writer
+            finally:
+                stack.pop()
+
+    @contextmanager
+    def checkout(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """
+        借出读游标但不绑定到当前线程，供跨线程迭代的生成器（流式导出）使用；
+        使用期间只能通过返回的游标访问数据库
+        """
+        self._slots.acquire()
+        try:
+            try:
+                cursor = self._idle.get_nowait()
+            except queue.Empty:
+                cursor = self._root.cursor()
+            try:
+                yield cursor
+            finally:
+                self._idle.put(cursor)
+        finally:
+            self._slots.release()
+
+    def current(self) -> duckdb.DuckDBPyConnection:
+        """当前线程绑定的游标；不在读写范围内时返回该线程专用的游标"""
+        stack = self._stack()
+        if stack:
+            return stack[-1]
+        cursor = getattr(self._local, "adhoc", None)
+        if cursor is None:
+            cursor = self._local.adhoc = self._root.cursor()
+            with self._adhoc_lock:
+                self._adhoc.append(cursor)
+        return cursor
+
+    def close(self):
+        """关闭所有游标和数据库连接"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._adhoc_lock:
+            for cursor in self._adhoc:
+                cursor.close()
+            self._adhoc.clear()
+        self._writer.close()
+        self._root.close()
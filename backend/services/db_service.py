@@ -1,24 +1,247 @@
 """
 数据库服务模块 - 使用 DuckDB 管理结构化数据
 """
+import base64
 import duckdb
+import functools
+import json
+import orjson
+import pyarrow as pa
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Union
 from datetime import datetime
 import os
 
+from services.connection_manager import ConnectionManager
+
+
+# emails 表对外返回的列（显式列出，避免 SELECT * 受新增列影响）
+EMAIL_COLUMNS = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp",
+                 "cc", "message_id", "in_reply_to"]
+EMAIL_SELECT = ", ".join(EMAIL_COLUMNS)
+# analysis_results 表对外返回的列
+ANALYSIS_RESULT_SELECT = "id, task_id, email_id, analysis_type, model_provider, result, created_at"
+_EMAIL_SELECT_E = ", ".join(f"e.{col}" for col in EMAIL_COLUMNS)
+
+# 构建 AI 上下文时额外读取的预计算列（清洗后的正文及其哈希，导入后由进程池计算）
+CLEAN_COLUMNS = ["clean_content", "clean_hash"]
+# 导入时预脱敏的列（Token 为任务级，映射持久化在 pii_tokens 表）；masked_content 非空即表示已脱敏
+MASKED_COLUMNS = ["masked_sender", "masked_receiver", "masked_subject", "masked_content", "masked_clean_content"]
+
+# 行内容哈希（发件人、收件人、主题、时间、正文），追加导入时据此去重；
+# to_json 区分 NULL 与空字符串，md5 结果与 DuckDB 版本无关
+CONTENT_HASH_SQL = "md5(to_json([sender, receiver, subject, CAST(timestamp AS VARCHAR), content]))"
+
+# 聚类物化表：聚类类型 -> (表, 聚类列, 分组表达式, 参与聚合的邮件条件)
+# 往来聚类为无序参与者组合（alice↔bob 与 bob↔alice 同组）；(task_id, 聚类列) 为唯一键，
+# 增量刷新按此键 upsert。列表按 (邮件数降序, 聚类列) 排序，分页游标记录上一页最后一个聚类的这两项
+_CLUSTER_TABLES = {
+    "people": (
+        "people_clusters", ["participant1", "participant2"],
+        ["LEAST(sender, receiver)", "GREATEST(sender, receiver)"],
+        "sender IS NOT NULL AND receiver IS NOT NULL",
+    ),
+    "subjects": ("subject_clusters", ["subject"], ["subject"], "subject IS NOT NULL"),
+}
+
+
+# Dashboard 统计汇总的维度：维度 -> 分组表达式（对 emails 行求值，统一为 VARCHAR）
+# 一次 GROUPING SETS 扫描同时得到全部维度及总数（维度 total）
+_STATS_DIMENSIONS = {
+    "day": "CAST(CAST(timestamp AS DATE) AS VARCHAR)",
+    "hour": "CAST(hour(timestamp) AS VARCHAR)",
+    "sender": "sender",
+    "receiver": "receiver",
+    "domain": "NULLIF(lower(regexp_extract(sender, '@([^@>\\s]+)', 1)), '')",
+}
+
+
+def _cluster_key_sql(cluster_type: str, alias: str) -> str:
+    """聚类键表达式，与 save_cluster_insight 保存的 cluster_key 一致"""
+    if cluster_type == "people":
+        return f"{alias}.participant1 || ' ↔ ' || {alias}.participant2"
+    return f"{alias}.subject"
+
+
+# analysis_results 的唯一键：同一邮件、分析类型、模型只保留一条结果，批量写入按此键 upsert
+ANALYSIS_RESULT_KEY = ("email_id", "analysis_type", "model_provider")
+_ANALYSIS_RESULT_KEY_INDEX = "uq_analysis_results_key"
+# email_clusters 的唯一键：每个聚类只保存一条洞察，保存时按此键 upsert
+CLUSTER_INSIGHT_KEY = ("task_id", "cluster_type", "cluster_key")
+
+# 热点查询使用的 ART 索引：索引名 -> (表, 列, 是否唯一)
+# DuckDB（1.5）只对单列索引做索引扫描，且要求表的过滤条件全部落在该列上；多列索引不参与扫描，
+# 只用于唯一约束和 ON CONFLICT 冲突检测。因此多条件点查先用 MATERIALIZED CTE 按单列索引
+# 取出候选行（只取需要的列），再过滤 task_id 等其余条件（见 get_emails_by_sender 等；
+# 去掉 CTE 时计划退化为全表扫描，5M 行实测慢约 40 倍，见 benchmarks/bench_indexes.py）。
+# emails.task_id 选择性低（一个任务通常占大部分行），按导入顺序连续存储，由 zonemap 裁剪即可
+INDEXES = {
+    "idx_emails_sender": ("emails", ("sender",), False),
+    "idx_emails_subject": ("emails", ("subject",), False),
+    "idx_analysis_results_email_id": ("analysis_results", ("email_id",), False),
+    _ANALYSIS_RESULT_KEY_INDEX: ("analysis_results", ANALYSIS_RESULT_KEY, True),
+    "uq_email_clusters_key": ("email_clusters", CLUSTER_INSIGHT_KEY, True),
+    "uq_people_clusters_key": ("people_clusters", ("task_id", "participant1", "participant2"), True),
+    "uq_subject_clusters_key": ("subject_clusters", ("task_id", "subject"), True),
+}
+# 已不再使用的索引，ensure_indexes 时删除（聚类洞察改为按唯一键 upsert）
+_RETIRED_INDEXES = ["idx_email_clusters_cluster_key"]
+# 建唯一索引前去重（旧版本数据库可能存在重复行）：表 -> 保留最新一条所依据的时间列；
+# 聚类物化表总是按键分组写入，不需要去重
+_UNIQUE_KEEP_LATEST = {"analysis_results": "created_at", "email_clusters": "analyzed_at"}
+
+# 批量写入分析结果时的 Arrow 表结构
+_ANALYSIS_RESULT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("task_id", pa.string()),
+    ("email_id", pa.int32()),
+    ("analysis_type", pa.string()),
+    ("model_provider", pa.string()),
+    ("result", pa.string()),
+    ("created_at", pa.timestamp("us")),
+])
+
+
+def _reads(method):
+    """读方法：在调用期间从游标池借出独立游标（self.conn 指向该游标）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.connections.reader():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _writes(method):
+    """写方法：在调用期间进入写入通道，写操作按方法粒度串行"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.connections.writer():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# 按 Arrow 列批次读取查询结果时每批的行数
+ARROW_BATCH_ROWS = 10000
+
+
+def _load_json(value: Optional[str]) -> Any:
+    """解析 JSON 文本，无法解析时保留原始字符串"""
+    if not value:
+        return value
+    try:
+        return orjson.loads(value)
+    except orjson.JSONDecodeError:
+        return value
+
+
+def iter_record_batches(
+    cursor: duckdb.DuckDBPyConnection,
+    json_columns: Tuple[str, ...] = (),
+    batch_size: int = ARROW_BATCH_ROWS,
+    raw_json: bool = False
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    以 Arrow 列批次读取查询结果，逐批产出字典列表
+    
+    每列整体由 pyarrow 转换为 Python 值，不再逐行构造元组再 dict(zip)；
+    时间列整列转为 ISO 字符串，json_columns 中的列用 orjson 解析。
+    raw_json=True 时 json_columns 不解析，以 orjson.Fragment 包装数据库中的 JSON 字节，
+    由 FastJSONResponse 原样拼接进响应（只用于直接返回给前端的结果）
+    """
+    # DuckDB 1.4 起 fetch_record_batch 更名为 to_arrow_reader
+    to_reader = getattr(cursor, "to_arrow_reader", None) or cursor.fetch_record_batch
+    for batch in to_reader(batch_size):
+        columns = []
+        for field, column in zip(batch.schema, batch.columns):
+            values = column.to_pylist()
+            if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+                values = [v.isoformat() if v else None for v in values]
+            elif field.name in json_columns and raw_json:
+                values = [None if v is None else orjson.Fragment(v) for v in column.cast(pa.binary()).to_pylist()]
+            elif field.name in json_columns:
+                values = [_load_json(v) for v in values]
+            columns.append(values)
+        names = batch.schema.names
+        yield [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def fetch_records(
+    cursor: duckdb.DuckDBPyConnection, json_columns: Tuple[str, ...] = (), raw_json: bool = False
+) -> List[Dict[str, Any]]:
+    """以 Arrow 列批次读取全部查询结果（见 iter_record_batches）"""
+    records: List[Dict[str, Any]] = []
+    for batch in iter_record_batches(cursor, json_columns, raw_json=raw_json):
+        records.extend(batch)
+    return records
+
+
+def dump_result_json(result: Union[BaseModel, Dict[str, Any], str]) -> str:
+    """
+    将分析结果序列化为 JSON 文本（只序列化一次）
+    
+    pydantic 模型直接由 model_dump_json 生成 JSON，不先转为 dict；已是 JSON 文本时原样返回。
+    返回 str：DuckDB 会把 bytes 参数当作 BLOB 写入 JSON 列
+    """
+    if isinstance(result, BaseModel):
+        return result.model_dump_json()
+    if isinstance(result, str):
+        return result
+    return orjson.dumps(result, default=str).decode()
+
+
+def encode_email_cursor(last_id: int) -> str:
+    """生成邮件分页游标（不透明的 URL 安全字符串）"""
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_email_cursor(cursor: str) -> int:
+    """解析邮件分页游标，格式不正确时抛出 ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(data["after"])
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+def encode_cluster_cursor(email_count: int, key: List[str]) -> str:
+    """生成聚类分页游标（记录上一页最后一个聚类的邮件数与聚类列）"""
+    return base64.urlsafe_b64encode(json.dumps({"count": email_count, "key": key}).encode()).decode().rstrip("=")
+
+
+def decode_cluster_cursor(cursor: str, key_size: int) -> Tuple[int, List[str]]:
+    """解析聚类分页游标，格式不正确或聚类列数不符时抛出 ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        email_count, key = int(data["count"]), [str(value) for value in data["key"]]
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if len(key) != key_size:
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return email_count, key
+
 
 class DBService:
     """DuckDB 数据库服务"""
     
+    # 导入时由字段映射生成的列
+    EMAIL_IMPORT_COLUMNS = ["sender", "receiver", "subject", "content", "timestamp"]
+    
     def __init__(self, db_path: str = "./data/student_c.duckdb"):
         """初始化数据库连接"""
         self.db_path = db_path
         # 确保数据目录存在
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-        self.conn = duckdb.connect(db_path)
+        # 每个请求 / 工作线程使用独立游标，写入走专用通道
+        self.connections = ConnectionManager(db_path)
         self._init_schema()
     
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        """当前线程绑定的游标（读写方法内为借出的游标，其他情况为线程专用游标）"""
+        return self.connections.current()
+    
+    @_writes
     def _init_schema(self):
         """初始化数据库 Schema"""
         # 创建 tasks 表
@@ -42,10 +265,26 @@ class DBService:
                 subject VARCHAR,
                 content TEXT,
                 timestamp TIMESTAMP,
+                cc VARCHAR,
+                message_id VARCHAR,
+                in_reply_to VARCHAR,
+                content_hash VARCHAR,
+                clean_content TEXT,
+                clean_hash VARCHAR,
+                masked_sender VARCHAR,
+                masked_receiver VARCHAR,
+                masked_subject VARCHAR,
+                masked_content TEXT,
+                masked_clean_content TEXT,
                 FOREIGN KEY (task_id) REFERENCES tasks(id)
             )
         """)
         
+        # 旧库升级：补充邮箱格式导入、追加导入、正文预清洗和预脱敏所需的列
+        for column in ("cc", "message_id", "in_reply_to", "content_hash", "clean_content", "clean_hash",
+                       *MASKED_COLUMNS):
+            self.conn.execute(f"ALTER TABLE emails ADD COLUMN IF NOT EXISTS {column} VARCHAR")
+        
         # 创建 email_id 序列（用于自增 ID）
         self.conn.execute("""
             CREATE SEQUENCE IF NOT EXISTS email_id_seq START 1
@@ -90,7 +329,141 @@ class DBService:
                 FOREIGN KEY (task_id) REFERENCES tasks(id)
             )
         """)
+        
+        # 创建 ingest_progress 表（文件导入进度）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_progress (
+                task_id VARCHAR PRIMARY KEY,
+                status VARCHAR NOT NULL,
+                total_bytes BIGINT,
+                bytes_read BIGINT NOT NULL DEFAULT 0,
+                rows_read BIGINT NOT NULL DEFAULT 0,
+                rows_inserted BIGINT NOT NULL DEFAULT 0,
+                rows_duplicate BIGINT NOT NULL DEFAULT 0,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                chunks_total INTEGER,
+                rows_per_second DOUBLE,
+                failed_chunk INTEGER,
+                error_message TEXT,
+                started_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                FOREIGN KEY (task_id) REFERENCES tasks(id)
+            )
+        """)
+        self.conn.execute(
+            "ALTER TABLE ingest_progress ADD COLUMN IF NOT EXISTS rows_duplicate BIGINT DEFAULT 0"
+        )
+        
+        # 创建 pii_tokens 表（任务级脱敏 Token 映射，导入时预脱敏和 LLM 调用共用）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pii_tokens (
+                task_id VARCHAR NOT NULL,
+                token VARCHAR NOT NULL,
+                value VARCHAR NOT NULL,
+                PRIMARY KEY (task_id, token)
+            )
+        """)
+        
+        # 创建 email_clusters 表（聚类的 AI 洞察，聚类列表按聚类键 LEFT JOIN）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS email_clusters (
+                id VARCHAR PRIMARY KEY,
+                task_id VARCHAR NOT NULL,
+                cluster_type VARCHAR NOT NULL,
+                cluster_key VARCHAR NOT NULL,
+                ai_insight TEXT,
+                model_provider VARCHAR,
+                analyzed_at TIMESTAMP,
+                FOREIGN KEY (task_id) REFERENCES tasks(id)
+            )
+        """)
+        
+        # 创建往来 / 主题聚类物化表（导入结束时刷新，按 (邮件数, 聚类列) 游标分页）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS people_clusters (
+                task_id VARCHAR NOT NULL,
+                participant1 VARCHAR NOT NULL,
+                participant2 VARCHAR NOT NULL,
+                email_count BIGINT NOT NULL,
+                latest_activity TIMESTAMP
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS subject_clusters (
+                task_id VARCHAR NOT NULL,
+                subject VARCHAR NOT NULL,
+                email_count BIGINT NOT NULL,
+                latest_activity TIMESTAMP
+            )
+        """)
+        # 聚类总数及已聚合到的最大邮件 id（增量刷新的起点）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cluster_totals (
+                task_id VARCHAR NOT NULL,
+                cluster_type VARCHAR NOT NULL,
+                total BIGINT NOT NULL,
+                emails_through BIGINT NOT NULL,
+                PRIMARY KEY (task_id, cluster_type)
+            )
+        """)
+        
+        # Dashboard 统计汇总表（导入结束时刷新）：每个维度值一行，维度 total 为全任务汇总
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_stats (
+                task_id VARCHAR NOT NULL,
+                dimension VARCHAR NOT NULL,
+                stat_key VARCHAR,
+                email_count BIGINT NOT NULL,
+                first_at TIMESTAMP,
+                last_at TIMESTAMP
+            )
+        """)
+        # 统计汇总已聚合到的最大邮件 id（增量刷新的起点）
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_stats_state (
+                task_id VARCHAR PRIMARY KEY,
+                emails_through BIGINT NOT NULL
+            )
+        """)
+        
+        self.ensure_indexes()
+    
+    @_writes
+    def ensure_indexes(self) -> List[str]:
+        """
+        创建缺失的索引（表不存在时跳过），返回新建的索引名
+        
+        导入时索引随插入维护（实测比导入前删除、导入后重建更快），导入完成后再调用一次，
+        补齐旧版本数据库或被手动删除的索引
+        """
+        tables = {row[0] for row in self.conn.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+        existing = {row[0] for row in self.conn.execute("SELECT index_name FROM duckdb_indexes()").fetchall()}
+        for name in _RETIRED_INDEXES:
+            if name in existing:
+                self.conn.execute(f"DROP INDEX {name}")
+        created = []
+        for name, (table, columns, unique) in INDEXES.items():
+            if table in tables and name not in existing:
+                if unique and table in _UNIQUE_KEEP_LATEST:
+                    self._dedup_for_unique_key(table, columns)
+                self.conn.execute(
+                    f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+                )
+                created.append(name)
+        return created
+    
+    def _dedup_for_unique_key(self, table: str, columns: Tuple[str, ...]):
+        """建唯一索引前去重：旧版本数据库可能因并发写入存在重复行，每个键只保留最新的一条"""
+        self.conn.execute(f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM {table}
+                QUALIFY ROW_NUMBER() OVER (
+                    PARTITION BY {", ".join(columns)} ORDER BY {_UNIQUE_KEEP_LATEST[table]} DESC, id
+                ) > 1
+            )
+        """)
     
+    @_writes
     def create_task(self, task_id: str, name: str, file_path: Optional[str] = None) -> Dict[str, Any]:
         """创建新任务"""
         created_at = datetime.now()
@@ -106,6 +479,7 @@ class DBService:
             "file_path": file_path
         }
     
+    @_reads
     def get_tasks(self) -> List[Dict[str, Any]]:
         """获取所有任务"""
         result = self.conn.execute("SELECT * FROM tasks ORDER BY created_at DESC").fetchall()
@@ -119,6 +493,7 @@ class DBService:
             tasks.append(task)
         return tasks
     
+    @_reads
     def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
         """获取单个任务"""
         result = self.conn.execute("SELECT * FROM tasks WHERE id = ?", [task_id]).fetchone()
@@ -131,14 +506,24 @@ class DBService:
             return task
         return None
     
+    @_writes
     def update_task_status(self, task_id: str, status: str):
         """更新任务状态"""
         self.conn.execute("UPDATE tasks SET status = ? WHERE id = ?", [status, task_id])
     
+    @_writes
     def delete_task(self, task_id: str):
-        """删除任务及其关联的所有数据（邮件记录 + 分析结果）"""
-        # 先删除关联的分析结果
+        """删除任务及其关联的所有数据（邮件记录 + 分析结果 + 聚类洞察 + 导入进度）"""
+        # 先删除关联的分析结果和聚类洞察
         self.conn.execute("DELETE FROM analysis_results WHERE task_id = ?", [task_id])
+        self.conn.execute("DELETE FROM email_clusters WHERE task_id = ?", [task_id])
+        self.drop_clusters(task_id)
+        self.drop_stats(task_id)
+        # 删除导入进度和脱敏映射
+        self.conn.execute("DELETE FROM ingest_progress WHERE task_id = ?", [task_id])
+        self.conn.execute("DELETE FROM pii_tokens WHERE task_id = ?", [task_id])
+        from services.pii_masking_service import forget_task_masking_service
+        forget_task_masking_service(task_id)
         # 再删除关联的邮件记录
         self.conn.execute("DELETE FROM emails WHERE task_id = ?", [task_id])
         # 最后删除任务记录
@@ -147,78 +532,43 @@ class DBService:
     def ingest_file(self, task_id: str, file_path: str, file_type: str = "csv"):
         """
         从文件导入数据到 emails 表
-        利用 DuckDB 的高效 CSV 导入能力
+        自动匹配列名后，交给分块导入引擎处理
         """
-        # 更新任务状态为处理中
-        self.update_task_status(task_id, "PROCESSING")
+        from services.ingest_service import (
+            file_source_sql, resolve_file_type, PARQUET_FILE_TYPES, NDJSON_FILE_TYPES
+        )
         
-        try:
-            if file_type.lower() == "csv":
-                # 首先读取 CSV 的列信息
-                columns_query = f"SELECT * FROM read_csv_auto('{file_path}') LIMIT 0"
-                result = self.conn.execute(columns_query)
-                available_columns = [desc[0].lower() for desc in result.description]
-                
-                # 智能映射列名
-                sender_col = None
-                receiver_col = None
-                subject_col = None
-                content_col = None
-                timestamp_col = None
-                
-                # 尝试匹配发件人
-                for col in ['sender', 'from', 'from_email', 'from_addr']:
-                    if col in available_columns:
-                        sender_col = col
-                        break
-                
-                # 尝试匹配收件人        
-                for col in ['receiver', 'recipient', 'to', 'to_email', 'to_addr']:
-                    if col in available_columns:
-                        receiver_col = col
-                        break
-                
-                # 尝试匹配主题
-                for col in ['subject', 'title']:
-                    if col in available_columns:
-                        subject_col = col
-                        break
-                
-                # 尝试匹配内容
-                for col in ['content', 'body', 'text', 'message']:
-                    if col in available_columns:
-                        content_col = col
-                        break
-                
-                # 尝试匹配时间
-                for col in ['timestamp', 'date', 'datetime', 'time', 'created_at']:
-                    if col in available_columns:
-                        timestamp_col = col
-                        break
-                
-                # 构建 SELECT 语句
-                self.conn.execute(f"""
-                    INSERT INTO emails (id, task_id, sender, receiver, subject, content, timestamp)
-                    SELECT 
-                        nextval('email_id_seq') as id,
-                        '{task_id}' as task_id,
-                        {f'"{sender_col}"' if sender_col else 'NULL'} as sender,
-                        {f'"{receiver_col}"' if receiver_col else 'NULL'} as receiver,
-                        {f'"{subject_col}"' if subject_col else 'NULL'} as subject,
-                        {f'"{content_col}"' if content_col else 'NULL'} as content,
-                        {f'TRY_CAST("{timestamp_col}" AS TIMESTAMP)' if timestamp_col else 'NULL'} as timestamp
-                    FROM read_csv_auto('{file_path}')
-                """)
+        # emails.csv.gz 等压缩文件按被压缩的文件类型处理
+        file_type = resolve_file_type(file_path, file_type)
+        mapping = None
+        if file_type.lower() in {"csv"} | PARQUET_FILE_TYPES | NDJSON_FILE_TYPES:
+            try:
+                # 首先读取文件的列信息
+                columns_query = f"SELECT * FROM {file_source_sql(file_path, file_type)} LIMIT 0"
+                with self.connections.reader() as conn:
+                    result = conn.execute(columns_query)
+                    available_columns = [desc[0] for desc in result.description]
+            except Exception as e:
+                self.update_task_status(task_id, "FAILED")
+                print(f"Error importing file for task {task_id}: {e}")
+                raise e
             
-            # 更新任务状态为完成
-            self.update_task_status(task_id, "DONE")
-            
-        except Exception as e:
-            # 如果导入失败，更新任务状态为失败
-            self.update_task_status(task_id, "FAILED")
-            # 记录错误信息（在生产环境应该使用 logging）
-            print(f"Error importing file for task {task_id}: {e}")
-            raise e
+            # 智能映射列名
+            candidates = {
+                "sender": ['sender', 'from', 'from_email', 'from_addr'],
+                "receiver": ['receiver', 'recipient', 'to', 'to_email', 'to_addr'],
+                "subject": ['subject', 'title'],
+                "content": ['content', 'body', 'text', 'message'],
+                "timestamp": ['timestamp', 'date', 'datetime', 'time', 'created_at'],
+            }
+            # 按小写匹配，映射值保留原始列名（Parquet / JSON 列名区分大小写）
+            lower_columns = {col.lower(): col for col in available_columns}
+            mapping = {
+                field: next((lower_columns[name] for name in names if name in lower_columns), None)
+                for field, names in candidates.items()
+            }
+        
+        self.ingest_file_with_config(task_id, file_path, file_type, mapping)
     
     def ingest_file_with_config(
         self, 
@@ -226,59 +576,427 @@ class DBService:
         file_path: str, 
         file_type: str = "csv",
         mapping: Optional[Dict[str, Any]] = None,
-        filter_config: Optional[Dict[str, Any]] = None
+        filter_config: Optional[Dict[str, Any]] = None,
+        append: bool = False,
+        mask_pii: bool = False
     ):
         """
         使用用户配置从文件导入数据到 emails 表
         
+        存在上传时生成的暂存副本（Parquet）时从副本导入；否则
+        CSV / NDJSON 文件（可为 gzip / zstd 压缩）按记录边界分块、Parquet 文件按行组，并行解析、逐块提交，
+        进度实时写入 ingest_progress 表；失败时保留已提交的块。
+        
         Args:
             task_id: 任务 ID
             file_path: 文件路径
             file_type: 文件类型
             mapping: 字段映射配置，格式 {"sender": "col1", "receiver": "col2", ...}
             filter_config: 过滤配置，格式 {"logic": "AND/OR", "conditions": [...]}
+            append: 追加到已有任务，只插入任务中尚不存在（按内容哈希）的行；
+                新增行数和重复行数记录在 ingest_progress 的 rows_inserted / rows_duplicate
+            mask_pii: 导入后预脱敏（masked_* 列）；追加到已脱敏的任务时总是脱敏新增的行
+        
+        失败时任务状态为 FAILED（追加导入恢复为导入前的状态），错误记录在 ingest_progress
         """
-        # 更新任务状态为处理中
+        from services.ingest_service import IngestService, ChunkIngestError
+        
+        # 更新任务状态为处理中；追加导入失败时恢复原状态，已有数据集不因新文件出错而变为失败
+        previous_status = (self.get_task(task_id) or {}).get("status") if append else None
         self.update_task_status(task_id, "PROCESSING")
         
+        from services.mailbox_service import MAILBOX_FILE_TYPES
+        from services.ingest_service import resolve_file_type, PARQUET_FILE_TYPES, NDJSON_FILE_TYPES
+        
+        from services.staging_service import get_staged_path
+        
+        file_type = resolve_file_type(file_path, file_type)
+        staged_path = get_staged_path(file_path)
+        ingest = IngestService(self, append=append)
         try:
-            if file_type.lower() == "csv":
-                # 使用用户指定的映射
-                sender_col = mapping.get("sender") if mapping else None
-                receiver_col = mapping.get("receiver") if mapping else None
-                subject_col = mapping.get("subject") if mapping else None
-                content_col = mapping.get("content") if mapping else None
-                timestamp_col = mapping.get("timestamp") if mapping else None
-                
-                # 构建 WHERE 子句（过滤条件）
-                where_sql = DBService.build_filter_where_clause(filter_config)
-                
-                # 构建 SELECT 语句
-                sql = f"""
-                    INSERT INTO emails (id, task_id, sender, receiver, subject, content, timestamp)
-                    SELECT 
-                        nextval('email_id_seq') as id,
-                        '{task_id}' as task_id,
-                        {f'"{sender_col}"' if sender_col else 'NULL'} as sender,
-                        {f'"{receiver_col}"' if receiver_col else 'NULL'} as receiver,
-                        {f'"{subject_col}"' if subject_col else 'NULL'} as subject,
-                        {f'"{content_col}"' if content_col else 'NULL'} as content,
-                        {f'TRY_CAST("{timestamp_col}" AS TIMESTAMP)' if timestamp_col else 'NULL'} as timestamp
-                    FROM read_csv_auto('{file_path}')
-                    {where_sql}
-                """
-                
-                self.conn.execute(sql)
+            if append:
+                # 旧版本导入的行没有内容哈希，先补齐
+                self.backfill_content_hash(task_id)
+            if staged_path:
+                # 上传时已生成列式暂存副本，直接从副本导入
+                ingest.ingest_staged(task_id, file_path, staged_path, mapping, filter_config)
+            elif file_type.lower() == "csv":
+                ingest.ingest_csv(task_id, file_path, mapping, filter_config)
+            elif file_type.lower() in PARQUET_FILE_TYPES:
+                ingest.ingest_parquet(task_id, file_path, mapping, filter_config)
+            elif file_type.lower() in NDJSON_FILE_TYPES:
+                ingest.ingest_ndjson(task_id, file_path, mapping, filter_config)
+            elif file_type.lower() in MAILBOX_FILE_TYPES or os.path.isdir(file_path):
+                # mbox / .eml 压缩包 / Maildir 目录
+                ingest.ingest_mailbox(task_id, file_path, mapping, filter_config)
+            
+            # 预计算清洗后的正文（失败不影响导入，构建上下文时回退为实时清洗）
+            try:
+                ingest.precompute_clean_content(task_id)
+            except Exception as e:
+                print(f"Error precomputing clean content for task {task_id}: {e}")
+            
+            # 预脱敏（失败不影响导入，调用 LLM 时回退为实时脱敏）
+            if mask_pii or self.has_masked_content(task_id):
+                try:
+                    ingest.precompute_masked_content(task_id)
+                except Exception as e:
+                    print(f"Error masking PII for task {task_id}: {e}")
+            
+            # 刷新聚类物化表和 Dashboard 统计汇总（只聚合新增的邮件）
+            self._refresh_rollups(task_id)
+            
+            # 补齐索引（新导入的行已在插入时写入索引）
+            self.ensure_indexes()
             
             # 更新任务状态为完成
             self.update_task_status(task_id, "DONE")
             
         except Exception as e:
-            # 如果导入失败，更新任务状态为失败
-            self.update_task_status(task_id, "FAILED")
+            # 如果导入失败，更新任务状态为失败（已提交的块保留）
+            if not isinstance(e, ChunkIngestError):
+                self.fail_ingest_progress(task_id, None, str(e))
+            # 已提交的块改变了聚类和统计，同样增量刷新
+            self._refresh_rollups(task_id)
+            # 追加失败只记录在 ingest_progress（error_message），任务恢复原状态
+            self.update_task_status(task_id, previous_status or "FAILED")
             print(f"Error importing file with config for task {task_id}: {e}")
             raise e
     
+    def _refresh_rollups(self, task_id: str, missing_only: bool = False):
+        """
+        刷新聚类物化表和 Dashboard 统计汇总（missing_only 时只构建尚不存在的）；
+        失败时删除，读取时回退为直接聚合，下次导入或回填时全量重建
+        """
+        rollups = [
+            ("clusters", "cluster_totals", self.refresh_clusters, self.drop_clusters),
+            ("stats", "task_stats_state", self.refresh_stats, self.drop_stats),
+        ]
+        for name, state_table, refresh, drop in rollups:
+            if missing_only:
+                with self.connections.reader() as conn:
+                    if conn.execute(f"SELECT 1 FROM {state_table} WHERE task_id = ?", [task_id]).fetchone():
+                        continue
+            try:
+                refresh(task_id)
+            except Exception as e:
+                print(f"Error refreshing {name} for task {task_id}: {e}")
+                drop(task_id)
+    
+    def backfill_rollups(self) -> List[str]:
+        """
+        为尚未构建聚类物化表或统计汇总的已完成任务（旧版本导入或刷新失败）全量构建，返回处理的任务 ID
+        
+        服务启动时在后台线程中调用；读取方从不触发构建，构建前读取回退为直接聚合
+        """
+        with self.connections.reader() as conn:
+            task_ids = [row[0] for row in conn.execute("""
+                SELECT id FROM tasks t
+                WHERE status = 'DONE'
+                  AND (NOT EXISTS (SELECT 1 FROM cluster_totals c WHERE c.task_id = t.id)
+                       OR NOT EXISTS (SELECT 1 FROM task_stats_state s WHERE s.task_id = t.id))
+                ORDER BY created_at
+            """).fetchall()]
+        for task_id in task_ids:
+            self._refresh_rollups(task_id, missing_only=True)
+        return task_ids
+    
+    @_writes
+    def insert_email_chunk(
+        self,
+        task_id: str,
+        chunk: Any,
+        select_list: str,
+        where_sql: str = "",
+        columns: Optional[List[str]] = None,
+        append: bool = False
+    ) -> Tuple[int, int]:
+        """
+        将一个数据块插入 emails 表（每行同时写入内容哈希）
+        
+        Args:
+            task_id: 任务 ID
+            chunk: Arrow 表，或 SQL 数据源表达式（如 read_csv_auto(...)）
+            select_list: 映射后的 SELECT 列表
+            where_sql: 过滤 WHERE 子句
+            columns: select_list 对应的目标列，默认 EMAIL_IMPORT_COLUMNS
+            append: 追加模式，按内容哈希与任务已有行做反连接，只插入未出现过的行
+                （块内重复的行只保留第一行）
+            
+        Returns:
+            (实际插入的行数, 因重复跳过的行数)
+        """
+        columns = columns or self.EMAIL_IMPORT_COLUMNS
+        target_columns = ", ".join(columns)
+        if isinstance(chunk, str):
+            source = chunk
+        else:
+            source = "_ingest_chunk"
+            self.conn.register(source, chunk)
+        mapped = f"""
+            SELECT t.*, {CONTENT_HASH_SQL} AS content_hash
+            FROM (SELECT {select_list} FROM {source} {where_sql}) AS t({target_columns})
+        """
+        try:
+            if not append:
+                result = self.conn.execute(f"""
+                    INSERT INTO emails (id, task_id, {target_columns}, content_hash)
+                    SELECT nextval('email_id_seq') as id, ? as task_id, m.*
+                    FROM ({mapped}) AS m
+                """, [task_id]).fetchone()
+                return (result[0] if result else 0), 0
+            
+            # 先物化映射后的块（只读一次源数据），再统计候选行数并反连接插入
+            self.conn.execute(f"CREATE OR REPLACE TEMP TABLE _append_chunk AS {mapped}")
+            try:
+                candidates = self.conn.execute("SELECT COUNT(*) FROM _append_chunk").fetchone()[0]
+                result = self.conn.execute(f"""
+                    INSERT INTO emails (id, task_id, {target_columns}, content_hash)
+                    SELECT nextval('email_id_seq') as id, ? as task_id, {target_columns}, content_hash
+                    FROM (
+                        SELECT c.*, c.rowid AS _row
+                        FROM _append_chunk c
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM emails e
+                            WHERE e.task_id = ? AND e.content_hash = c.content_hash
+                        )
+                        QUALIFY ROW_NUMBER() OVER (PARTITION BY c.content_hash ORDER BY c.rowid) = 1
+                    )
+                    ORDER BY _row
+                """, [task_id, task_id]).fetchone()
+            finally:
+                self.conn.execute("DROP TABLE IF EXISTS _append_chunk")
+            inserted = result[0] if result else 0
+            return inserted, candidates - inserted
+        finally:
+            if source == "_ingest_chunk":
+                self.conn.unregister(source)
+    
+    @_reads
+    def count_source_rows(self, source: str) -> int:
+        """统计导入源（read_csv_auto(...) 等表函数）的行数"""
+        return self.conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+    
+    @_writes
+    def backfill_content_hash(self, task_id: str) -> int:
+        """为任务中缺少内容哈希的行（旧版本导入）补齐哈希，返回更新行数"""
+        result = self.conn.execute(f"""
+            UPDATE emails SET content_hash = {CONTENT_HASH_SQL}
+            WHERE task_id = ? AND content_hash IS NULL
+        """, [task_id]).fetchone()
+        return result[0] if result else 0
+    
+    @_reads
+    def get_uncleaned_emails(self, task_id: str, after_id: int, limit: int) -> List[Tuple[int, Optional[str]]]:
+        """按 id 顺序获取尚未预计算清洗正文的邮件 [(id, content), ...]（id > after_id）"""
+        return self.conn.execute(
+            """SELECT id, content FROM emails
+               WHERE task_id = ? AND clean_hash IS NULL AND id > ?
+               ORDER BY id
+               LIMIT ?""",
+            [task_id, after_id, limit]
+        ).fetchall()
+    
+    @_writes
+    def update_clean_content(self, rows: List[Tuple[int, str, str]]) -> int:
+        """批量写入清洗后的正文和哈希 [(id, clean_content, clean_hash), ...]"""
+        if not rows:
+            return 0
+        ids, contents, hashes = zip(*rows)
+        table = pa.table({
+            "id": pa.array(ids, pa.int32()),
+            "clean_content": pa.array(contents, pa.string()),
+            "clean_hash": pa.array(hashes, pa.string())
+        })
+        self.conn.register("_clean_chunk", table)
+        try:
+            result = self.conn.execute("""
+                UPDATE emails SET clean_content = c.clean_content, clean_hash = c.clean_hash
+                FROM _clean_chunk c
+                WHERE emails.id = c.id
+            """).fetchone()
+        finally:
+            self.conn.unregister("_clean_chunk")
+        return result[0] if result else 0
+    
+    @_reads
+    def get_unmasked_emails(self, task_id: str, after_id: int, limit: int) -> List[Tuple[Any, ...]]:
+        """
+        按 id 顺序获取尚未预脱敏的邮件（id > after_id）
+        
+        Returns:
+            [(id, sender, receiver, subject, content, clean_content), ...]
+        """
+        return self.conn.execute(
+            """SELECT id, sender, receiver, subject, COALESCE(content, ''), clean_content FROM emails
+               WHERE task_id = ? AND masked_content IS NULL AND id > ?
+               ORDER BY id
+               LIMIT ?""",
+            [task_id, after_id, limit]
+        ).fetchall()
+    
+    @_writes
+    def update_masked_content(self, rows: List[Tuple[Any, ...]]) -> int:
+        """批量写入脱敏结果，行格式与 get_unmasked_emails 一致（各字段为脱敏后的值）"""
+        if not rows:
+            return 0
+        ids, *fields = zip(*rows)
+        table = pa.table(
+            {"id": pa.array(ids, pa.int32()),
+             **{column: pa.array(values, pa.string()) for column, values in zip(MASKED_COLUMNS, fields)}}
+        )
+        assignments = ", ".join(f"{column} = m.{column}" for column in MASKED_COLUMNS)
+        self.conn.register("_masked_chunk", table)
+        try:
+            result = self.conn.execute(f"""
+                UPDATE emails SET {assignments}
+                FROM _masked_chunk m
+                WHERE emails.id = m.id
+            """).fetchone()
+        finally:
+            self.conn.unregister("_masked_chunk")
+        return result[0] if result else 0
+    
+    @_reads
+    def has_masked_content(self, task_id: str) -> bool:
+        """任务是否已有预脱敏的邮件"""
+        result = self.conn.execute(
+            "SELECT 1 FROM emails WHERE task_id = ? AND masked_content IS NOT NULL LIMIT 1",
+            [task_id]
+        ).fetchone()
+        return result is not None
+    
+    @_reads
+    def get_pii_tokens(self, task_id: str) -> Dict[str, str]:
+        """获取任务的脱敏映射（原始值 -> Token）"""
+        result = self.conn.execute(
+            "SELECT value, token FROM pii_tokens WHERE task_id = ?",
+            [task_id]
+        ).fetchall()
+        return dict(result)
+    
+    @_writes
+    def save_pii_tokens(self, task_id: str, token_map: Dict[str, str]):
+        """保存新分配的 Token（原始值 -> Token），已存在的 Token 不覆盖"""
+        if not token_map:
+            return
+        table = pa.table({
+            "token": pa.array(list(token_map.values()), pa.string()),
+            "value": pa.array(list(token_map.keys()), pa.string())
+        })
+        self.conn.register("_pii_tokens", table)
+        try:
+            self.conn.execute(
+                """INSERT INTO pii_tokens (task_id, token, value)
+                   SELECT ?, token, value FROM _pii_tokens
+                   ON CONFLICT DO NOTHING""",
+                [task_id]
+            )
+        finally:
+            self.conn.unregister("_pii_tokens")
+    
+    # ==================== 导入进度方法 ====================
+    
+    @_writes
+    def start_ingest_progress(self, task_id: str, total_bytes: Optional[int]):
+        """初始化（或重置）任务的导入进度"""
+        now = datetime.now()
+        self.conn.execute("DELETE FROM ingest_progress WHERE task_id = ?", [task_id])
+        self.conn.execute(
+            """INSERT INTO ingest_progress 
+               (task_id, status, total_bytes, started_at, updated_at)
+               VALUES (?, 'RUNNING', ?, ?, ?)""",
+            [task_id, total_bytes, now, now]
+        )
+    
+    @_writes
+    def update_ingest_progress(
+        self,
+        task_id: str,
+        bytes_read: int,
+        rows_read: int,
+        rows_inserted: int,
+        chunks_done: int,
+        rows_per_second: float,
+        rows_duplicate: int = 0
+    ):
+        """更新导入进度（每提交一块调用一次）"""
+        self.conn.execute(
+            """UPDATE ingest_progress 
+               SET bytes_read = ?, rows_read = ?, rows_inserted = ?, rows_duplicate = ?,
+                   chunks_done = ?, rows_per_second = ?, updated_at = ?
+               WHERE task_id = ?""",
+            [bytes_read, rows_read, rows_inserted, rows_duplicate, chunks_done, rows_per_second,
+             datetime.now(), task_id]
+        )
+    
+    @_writes
+    def finish_ingest_progress(self, task_id: str, chunks_total: int):
+        """标记导入完成"""
+        self.conn.execute(
+            """UPDATE ingest_progress 
+               SET status = 'DONE', chunks_total = ?, updated_at = ?
+               WHERE task_id = ?""",
+            [chunks_total, datetime.now(), task_id]
+        )
+    
+    @_writes
+    def fail_ingest_progress(self, task_id: str, failed_chunk: Optional[int], error_message: str):
+        """标记导入失败，记录失败的块序号"""
+        self.conn.execute(
+            """UPDATE ingest_progress 
+               SET status = 'FAILED', failed_chunk = ?, error_message = ?, updated_at = ?
+               WHERE task_id = ?""",
+            [failed_chunk, error_message, datetime.now(), task_id]
+        )
+    
+    @_reads
+    def get_ingest_progress(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务的导入进度"""
+        columns = ["task_id", "status", "total_bytes", "bytes_read", "rows_read", 
+                   "rows_inserted", "rows_duplicate", "chunks_done", "chunks_total", "rows_per_second", 
+                   "failed_chunk", "error_message", "started_at", "updated_at"]
+        result = self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM ingest_progress WHERE task_id = ?",
+            [task_id]
+        ).fetchone()
+        if not result:
+            return None
+        
+        progress = dict(zip(columns, result))
+        for field in ["started_at", "updated_at"]:
+            if progress.get(field):
+                progress[field] = progress[field].isoformat()
+        if progress.get("total_bytes"):
+            progress["percent"] = round(progress["bytes_read"] / progress["total_bytes"] * 100, 1)
+        return progress
+    
+    @staticmethod
+    def build_filter_condition(cond: Dict[str, Any]) -> str:
+        """
+        构建单个过滤条件的保留表达式（不满足排除条件的记录为真，结果不会为 NULL）
+        
+        Returns:
+            表达式字符串；字段或值为空、匹配类型未知时返回空字符串
+        """
+        field = cond.get("field", "")
+        match_type = cond.get("match_type", "exact")
+        value = cond.get("value", "")
+        
+        if not field or not value:
+            return ""
+        
+        # 对值进行转义，防止 SQL 注入
+        escaped_value = value.replace("'", "''")
+        
+        if match_type == "exact":
+            # 精确匹配：排除等于该值的记录
+            return f'("{field}" != \'{escaped_value}\' OR "{field}" IS NULL)'
+        if match_type == "contains":
+            # 包含匹配：排除包含该值的记录
+            return f'("{field}" NOT LIKE \'%{escaped_value}%\' OR "{field}" IS NULL)'
+        return ""
+    
     @staticmethod
     def build_filter_where_clause(filter_config: Optional[Dict[str, Any]]) -> str:
         """
@@ -301,24 +1019,7 @@ class DBService:
         if logic not in ("AND", "OR"):
             logic = "AND"
         
-        where_parts = []
-        for cond in conditions:
-            field = cond.get("field", "")
-            match_type = cond.get("match_type", "exact")
-            value = cond.get("value", "")
-            
-            if not field or not value:
-                continue
-            
-            # 对值进行转义，防止 SQL 注入
-            escaped_value = value.replace("'", "''")
-            
-            if match_type == "exact":
-                # 精确匹配：排除等于该值的记录
-                where_parts.append(f'("{field}" != \'{escaped_value}\' OR "{field}" IS NULL)')
-            elif match_type == "contains":
-                # 包含匹配：排除包含该值的记录
-                where_parts.append(f'("{field}" NOT LIKE \'%{escaped_value}%\' OR "{field}" IS NULL)')
+        where_parts = [part for part in map(DBService.build_filter_condition, conditions) if part]
         
         if not where_parts:
             return ""
@@ -338,53 +1039,181 @@ class DBService:
         
         return f"WHERE ({combined})"
     
-    def get_emails_by_task(self, task_id: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
-        """获取任务的邮件记录，包含批量分析结果"""
-        import json
+    def _email_listing(
+        self,
+        task_id: str,
+        limit: int,
+        after_id: Optional[int] = None,
+        offset: int = 0,
+        sender: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        has_analysis: Optional[bool] = None,
+        include_clean: bool = False,
+        raw_json: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        按 id 顺序列出任务的邮件，附带分析结果（优先 batch_summary，其次 summary，同类型取最新）
         
-        # 使用 LEFT JOIN 获取邮件及其对应的分析结果 (优先 batch_summary，其次 summary)
-        query = """
-            SELECT e.*, 
-                   COALESCE(ar_batch.result, ar_summary.result) as analysis_result
-            FROM emails e
-            LEFT JOIN analysis_results ar_batch ON e.id = ar_batch.email_id 
-                AND ar_batch.analysis_type = 'batch_summary'
-            LEFT JOIN analysis_results ar_summary ON e.id = ar_summary.email_id 
-                AND ar_summary.analysis_type = 'summary'
-            WHERE e.task_id = ? 
-            LIMIT ? OFFSET ?
+        先按过滤条件和 id 截取当前页，再只为当前页的邮件关联分析结果；
+        raw_json=True 时分析结果为 orjson.Fragment，不解析（见 iter_record_batches）
         """
+        clean_columns = CLEAN_COLUMNS if include_clean else []
+        conditions = ["e.task_id = ?"]
+        params: List[Any] = [task_id]
+        if after_id is not None:
+            conditions.append("e.id > ?")
+            params.append(after_id)
+        if sender:
+            conditions.append("e.sender = ?")
+            params.append(sender)
+        if start:
+            conditions.append("e.timestamp >= ?")
+            params.append(start)
+        if end:
+            conditions.append("e.timestamp < ?")
+            params.append(end)
+        if has_analysis is not None:
+            conditions.append(f"""{"" if has_analysis else "NOT "}EXISTS (
+                SELECT 1 FROM analysis_results a
+                WHERE a.email_id = e.id AND a.analysis_type IN ('batch_summary', 'summary')
+            )""")
+        params += [limit, offset]
         
-        result = self.conn.execute(query, [task_id, limit, offset]).fetchall()
+        query = f"""
+            WITH page AS (
+                SELECT {", ".join(f"e.{col}" for col in EMAIL_COLUMNS + clean_columns)}
+                FROM emails e
+                WHERE {" AND ".join(conditions)}
+                ORDER BY e.id
+                LIMIT ? OFFSET ?
+            ),
+            analysis AS (
+                SELECT email_id,
+                       arg_max(result, (analysis_type = 'batch_summary', created_at)) AS result
+                FROM analysis_results
+                WHERE email_id IN (SELECT id FROM page)
+                  AND analysis_type IN ('batch_summary', 'summary')
+                GROUP BY email_id
+            )
+            SELECT page.*, analysis.result AS batch_analysis_result
+            FROM page
+            LEFT JOIN analysis ON analysis.email_id = page.id
+            ORDER BY page.id
+        """
+        return fetch_records(self.conn.execute(query, params), json_columns=("batch_analysis_result",), raw_json=raw_json)
+    
+    @_reads
+    def get_emails_by_task(
+        self,
+        task_id: str,
+        limit: int = 100,
+        offset: int = 0,
+        include_clean: bool = False,
+        raw_json: bool = False
+    ) -> List[Dict[str, Any]]:
+        """获取任务的邮件记录（按 id 顺序），包含批量分析结果（include_clean 时附带预计算的清洗正文，用于构建上下文）"""
+        return self._email_listing(task_id, limit, offset=offset, include_clean=include_clean, raw_json=raw_json)
+    
+    @_reads
+    def get_emails_page(
+        self,
+        task_id: str,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        sender: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        has_analysis: Optional[bool] = None,
+        raw_json: bool = False
+    ) -> Dict[str, Any]:
+        """
+        按游标分页获取任务的邮件（按 id 顺序）
         
-        columns = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp", "batch_analysis_result"]
-        emails = []
-        for row in result:
-            email = dict(zip(columns, row))
-            # 转换 timestamp 为字符串
-            if email.get("timestamp"):
-                email["timestamp"] = email["timestamp"].isoformat()
-            
-            # 尝试解析 batch_analysis_result
-            if email.get("batch_analysis_result"):
-                try:
-                    email["batch_analysis_result"] = json.loads(email["batch_analysis_result"])
-                except:
-                    pass
-            
-            emails.append(email)
+        游标记录上一页最后一封邮件的 id，下一页从其后读取（WHERE id > ? ORDER BY id LIMIT ?），
+        id 按导入顺序递增、存储有序，任何一页的开销都相同
+        
+        Args:
+            cursor: 上一页返回的 next_cursor，为空时从头读取
+            sender: 按发件人过滤
+            start / end: 按时间范围 [start, end) 过滤（ISO 格式）
+            has_analysis: True 只返回已有分析结果的邮件，False 只返回尚未分析的邮件
+            raw_json: 分析结果以 orjson.Fragment 原样返回（API 响应使用）
+        
+        Returns:
+            {"emails": [...], "next_cursor": 下一页游标，没有更多数据时为 None}
+        """
+        after_id = decode_email_cursor(cursor) if cursor else None
+        try:
+            start_at = datetime.fromisoformat(start) if start else None
+            end_at = datetime.fromisoformat(end) if end else None
+        except ValueError as e:
+            raise ValueError(f"无效的时间范围: {e}") from e
+        emails = self._email_listing(
+            task_id, limit + 1, after_id=after_id, sender=sender, start=start_at, end=end_at,
+            has_analysis=has_analysis, raw_json=raw_json
+        )
+        next_cursor = None
+        if len(emails) > limit:
+            emails = emails[:limit]
+            next_cursor = encode_email_cursor(emails[-1]["id"])
+        return {"emails": emails, "next_cursor": next_cursor}
+    
+    @_reads
+    def export_task(self, task_id: str, output_path: str, file_format: str = "parquet") -> int:
+        """
+        导出任务的邮件及每封邮件最新的一条分析结果
+        
+        由 DuckDB 直接写出文件（COPY），不经过 Python 逐行处理。
+        
+        Args:
+            task_id: 任务 ID
+            output_path: 输出文件路径
+            file_format: parquet 或 ndjson
             
-        return emails
+        Returns:
+            导出的行数
+        """
+        copy_options = {
+            "parquet": "FORMAT PARQUET, COMPRESSION ZSTD",
+            "ndjson": "FORMAT JSON"
+        }
+        if file_format not in copy_options:
+            raise ValueError(f"不支持的导出格式: {file_format}")
+        
+        escaped_task_id = task_id.replace("'", "''")
+        escaped_path = output_path.replace("'", "''")
+        query = f"""
+            SELECT {_EMAIL_SELECT_E},
+                   ar.analysis_type,
+                   ar.model_provider,
+                   CAST(ar.result AS VARCHAR) as analysis_result,
+                   ar.created_at as analyzed_at
+            FROM emails e
+            LEFT JOIN (
+                SELECT email_id, analysis_type, model_provider, result, created_at
+                FROM analysis_results
+                WHERE task_id = '{escaped_task_id}'
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY email_id ORDER BY created_at DESC) = 1
+            ) ar ON e.id = ar.email_id
+            WHERE e.task_id = '{escaped_task_id}'
+            ORDER BY e.id
+        """
+        result = self.conn.execute(
+            f"COPY ({query}) TO '{escaped_path}' ({copy_options[file_format]})"
+        ).fetchone()
+        return result[0] if result else 0
     
-    def get_email_by_id(self, email_id: int) -> Optional[Dict[str, Any]]:
-        """根据 ID 获取单封邮件"""
+    @_reads
+    def get_email_by_id(self, email_id: int, include_masked: bool = False) -> Optional[Dict[str, Any]]:
+        """根据 ID 获取单封邮件（include_masked 时附带预脱敏的列，用于调用 LLM）"""
+        columns = EMAIL_COLUMNS + (MASKED_COLUMNS if include_masked else [])
         result = self.conn.execute(
-            "SELECT * FROM emails WHERE id = ?",
+            f"SELECT {', '.join(columns)} FROM emails WHERE id = ?",
             [email_id]
         ).fetchone()
         
         if result:
-            columns = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp"]
             email = dict(zip(columns, result))
             # 转换 timestamp 为字符串
             if email.get("timestamp"):
@@ -392,6 +1221,7 @@ class DBService:
             return email
         return None
     
+    @_writes
     def save_analysis_result(
         self, 
         result_id: str,
@@ -399,133 +1229,227 @@ class DBService:
         email_id: int, 
         analysis_type: str, 
         model_provider: str, 
-        result: Dict[str, Any]
+        result: Union[BaseModel, Dict[str, Any], str]
     ):
-        """保存 AI 分析结果"""
-        import json
-        created_at = datetime.now()
+        """保存 AI 分析结果（result 为 pydantic 模型、dict 或 JSON 文本，见 dump_result_json）；已存在时覆盖"""
+        self.upsert_analysis_results([
+            (result_id, task_id, email_id, analysis_type, model_provider, dump_result_json(result), datetime.now())
+        ])
+    
+    @_writes
+    def upsert_analysis_results(self, rows: List[Tuple[Any, ...]]) -> int:
+        """
+        批量写入分析结果，一条 INSERT ... ON CONFLICT DO UPDATE 语句（单个事务）
         
-        # 检查是否已存在相同的分析结果
-        existing = self.conn.execute(
-            """SELECT id FROM analysis_results 
-               WHERE email_id = ? AND analysis_type = ? AND model_provider = ?""",
-            [email_id, analysis_type, model_provider]
-        ).fetchone()
+        Args:
+            rows: (id, task_id, email_id, analysis_type, model_provider, result JSON 文本, created_at)；
+                  同一唯一键（email_id, analysis_type, model_provider）出现多次时保留最后一条
         
-        if existing:
-            # 更新已有结果
-            self.conn.execute(
-                """UPDATE analysis_results 
-                   SET result = ?, created_at = ? 
-                   WHERE id = ?""",
-                [json.dumps(result), created_at, existing[0]]
-            )
-        else:
-            # 插入新结果
-            self.conn.execute(
-                """INSERT INTO analysis_results 
-                   (id, task_id, email_id, analysis_type, model_provider, result, created_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                [result_id, task_id, email_id, analysis_type, model_provider, json.dumps(result), created_at]
-            )
+        Returns:
+            写入的行数
+        """
+        latest = {(row[2], row[3], row[4]): row for row in rows}
+        if not latest:
+            return 0
+        batch = pa.Table.from_pylist(
+            [dict(zip(_ANALYSIS_RESULT_SCHEMA.names, row)) for row in latest.values()],
+            schema=_ANALYSIS_RESULT_SCHEMA
+        )
+        self.conn.register("_analysis_result_batch", batch)
+        try:
+            self.conn.execute(f"""
+                INSERT INTO analysis_results
+                    (id, task_id, email_id, analysis_type, model_provider, result, created_at)
+                SELECT id, task_id, email_id, analysis_type, model_provider, result::JSON, created_at
+                FROM _analysis_result_batch
+                ON CONFLICT ({", ".join(ANALYSIS_RESULT_KEY)}) DO UPDATE
+                SET result = excluded.result, created_at = excluded.created_at
+            """)
+        finally:
+            self.conn.unregister("_analysis_result_batch")
+        return len(latest)
     
+    @_reads
     def get_analysis_results(
         self, 
         email_id: int, 
-        analysis_type: Optional[str] = None
+        analysis_type: Optional[str] = None,
+        raw_json: bool = False
     ) -> List[Dict[str, Any]]:
-        """获取邮件的分析结果"""
-        import json
-        
+        """获取邮件的分析结果（raw_json=True 时 result 为 orjson.Fragment，不解析）"""
         if analysis_type:
-            query = """
-                SELECT * FROM analysis_results 
-                WHERE email_id = ? AND analysis_type = ?
+            # 按 email_id 索引取出候选行，再过滤分析类型（见 INDEXES）
+            query = f"""
+                WITH hits AS MATERIALIZED (SELECT {ANALYSIS_RESULT_SELECT} FROM analysis_results WHERE email_id = ?)
+                SELECT * FROM hits
+                WHERE analysis_type = ?
                 ORDER BY created_at DESC
             """
-            result = self.conn.execute(query, [email_id, analysis_type]).fetchall()
+            cursor = self.conn.execute(query, [email_id, analysis_type])
         else:
-            query = """
-                SELECT * FROM analysis_results 
+            query = f"""
+                SELECT {ANALYSIS_RESULT_SELECT} FROM analysis_results 
                 WHERE email_id = ?
                 ORDER BY created_at DESC
             """
-            result = self.conn.execute(query, [email_id]).fetchall()
+            cursor = self.conn.execute(query, [email_id])
         
-        columns = ["id", "task_id", "email_id", "analysis_type", "model_provider", "result", "created_at"]
-        results = []
-        for row in result:
-            analysis = dict(zip(columns, row))
-            # 解析 JSON 结果
-            analysis["result"] = json.loads(analysis["result"])
-            # 转换 datetime 为字符串
-            if analysis.get("created_at"):
-                analysis["created_at"] = analysis["created_at"].isoformat()
-            results.append(analysis)
-        
-        return results
+        return fetch_records(cursor, json_columns=("result",), raw_json=raw_json)
     
     # ==================== Dashboard 统计方法 ====================
     
-    def get_task_stats(self, task_id: str) -> Dict[str, Any]:
-        """获取任务的统计信息"""
-        # 邮件总数
-        total_result = self.conn.execute(
-            "SELECT COUNT(*) FROM emails WHERE task_id = ?",
-            [task_id]
-        ).fetchone()
-        total_emails = total_result[0] if total_result else 0
+    @staticmethod
+    def _stats_aggregate_sql(dimensions: List[str], id_range: bool) -> str:
+        """
+        对任务邮件做一次 GROUPING SETS 扫描，得到 dimensions 中各维度（total 为全任务汇总）的汇总行
+        (dimension, stat_key, email_count, first_at, last_at)；参数为 task_id，id_range 时另加 id 范围 (after, through]
+        """
+        keys = [d for d in dimensions if d != "total"]
+        grouping_sets = (["()"] if "total" in dimensions else []) + [f"({d})" for d in keys]
+        dimension_case = " ".join(f"WHEN GROUPING({d}) = 0 THEN '{d}'" for d in keys)
+        return f"""
+            SELECT {f"CASE {dimension_case} ELSE 'total' END" if keys else "'total'"} AS dimension,
+                   {f"COALESCE({', '.join(keys)})" if keys else "NULL"} AS stat_key,
+                   COUNT(*) AS email_count, MIN(timestamp) AS first_at, MAX(timestamp) AS last_at
+            FROM (
+                SELECT timestamp{"".join(f", {_STATS_DIMENSIONS[d]} AS {d}" for d in keys)}
+                FROM emails
+                WHERE task_id = ?{" AND id > ? AND id <= ?" if id_range else ""}
+            )
+            GROUP BY GROUPING SETS ({", ".join(grouping_sets)})
+        """
+    
+    @_writes
+    def refresh_stats(self, task_id: str, full: bool = False):
+        """
+        刷新任务的 Dashboard 统计汇总（导入结束时调用）
         
-        # 时间范围
-        date_range_result = self.conn.execute(
-            """SELECT MIN(timestamp), MAX(timestamp) 
-               FROM emails 
-               WHERE task_id = ? AND timestamp IS NOT NULL""",
-            [task_id]
-        ).fetchone()
+        一次 GROUPING SETS 扫描上次刷新后新增的邮件（id 大于 task_stats_state.emails_through），
+        得到总数、时间范围及按日 / 按小时 / 发件人 / 收件人 / 发件域名的邮件数，与已有汇总合并；
+        从未构建过或 full=True 时全量扫描。在一个事务中替换，读取方不会看到中间状态
+        """
+        max_id = self.conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM emails WHERE task_id = ?", [task_id]
+        ).fetchone()[0]
         
-        date_range = {
-            "start": date_range_result[0].isoformat() if date_range_result and date_range_result[0] else None,
-            "end": date_range_result[1].isoformat() if date_range_result and date_range_result[1] else None
-        }
+        watermark = None
+        if not full:
+            row = self.conn.execute(
+                "SELECT emails_through FROM task_stats_state WHERE task_id = ?", [task_id]
+            ).fetchone()
+            watermark = row[0] if row else None
         
-        return {
-            "total_emails": total_emails,
-            "date_range": date_range
-        }
-    
-    def get_top_senders(self, task_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """获取发件人 Top N"""
-        result = self.conn.execute(
-            """SELECT sender, COUNT(*) as count 
-               FROM emails 
-               WHERE task_id = ? AND sender IS NOT NULL
-               GROUP BY sender 
-               ORDER BY count DESC 
-               LIMIT ?""",
-            [task_id, limit]
-        ).fetchall()
+        delta = self._stats_aggregate_sql(["total", *_STATS_DIMENSIONS], id_range=True)
+        params = [task_id, watermark or 0, max_id]
+        if watermark is not None:
+            delta += """
+                UNION ALL
+                SELECT dimension, stat_key, email_count, first_at, last_at FROM task_stats WHERE task_id = ?
+            """
+            params.append(task_id)
         
-        return [{"sender": row[0], "count": row[1]} for row in result]
+        self.conn.begin()
+        try:
+            # 维度值为 NULL 的行（无时间 / 无发件人等）不参与统计，只保留总数行
+            self.conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _stats AS
+                SELECT dimension, stat_key, SUM(email_count) AS email_count,
+                       MIN(first_at) AS first_at, MAX(last_at) AS last_at
+                FROM ({delta})
+                WHERE dimension = 'total' OR stat_key IS NOT NULL
+                GROUP BY dimension, stat_key
+            """, params)
+            self.conn.execute("DELETE FROM task_stats WHERE task_id = ?", [task_id])
+            self.conn.execute("""
+                INSERT INTO task_stats (task_id, dimension, stat_key, email_count, first_at, last_at)
+                SELECT ?, dimension, stat_key, email_count, first_at, last_at FROM _stats
+                ORDER BY dimension, email_count DESC
+            """, [task_id])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO task_stats_state (task_id, emails_through) VALUES (?, ?)",
+                [task_id, max_id]
+            )
+            self.conn.execute("DROP TABLE IF EXISTS _stats")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
     
-    def get_email_trend(self, task_id: str) -> List[Dict[str, Any]]:
-        """获取邮件趋势（按日期分组）"""
-        result = self.conn.execute(
-            """SELECT DATE(timestamp) as date, COUNT(*) as count 
-               FROM emails 
-               WHERE task_id = ? AND timestamp IS NOT NULL
-               GROUP BY DATE(timestamp) 
-               ORDER BY date""",
-            [task_id]
-        ).fetchall()
+    @_writes
+    def drop_stats(self, task_id: str):
+        """删除任务的统计汇总（读取时回退为直接聚合，下次导入或回填时全量重建）"""
+        self.conn.execute("DELETE FROM task_stats WHERE task_id = ?", [task_id])
+        self.conn.execute("DELETE FROM task_stats_state WHERE task_id = ?", [task_id])
+    
+    def _stats_rows(self, task_id: str, dimensions: List[str], limit: Optional[int] = None) -> List[tuple]:
+        """
+        读取统计汇总行 (dimension, stat_key, email_count, first_at, last_at)；
+        limit 为每个维度按邮件数取前 N 个（同数时按维度值排序）。
+        只读汇总表；汇总尚未构建（旧版本导入且尚未回填的任务）时直接聚合 emails 中所需的维度
+        """
+        if self.conn.execute("SELECT 1 FROM task_stats_state WHERE task_id = ?", [task_id]).fetchone() is None:
+            source = f"""(
+                SELECT * FROM ({self._stats_aggregate_sql(dimensions, id_range=False)})
+                WHERE dimension = 'total' OR stat_key IS NOT NULL
+            )"""
+        else:
+            source = "(SELECT dimension, stat_key, email_count, first_at, last_at FROM task_stats WHERE task_id = ?)"
         
-        return [
-            {"date": row[0].isoformat() if row[0] else None, "count": row[1]} 
-            for row in result
-        ]
+        query = f"""
+            SELECT dimension, stat_key, email_count, first_at, last_at
+            FROM {source}
+            WHERE dimension IN ({", ".join("?" for _ in dimensions)})
+        """
+        params = [task_id, *dimensions]
+        if limit is not None:
+            query += " QUALIFY ROW_NUMBER() OVER (PARTITION BY dimension ORDER BY email_count DESC, stat_key) <= ?"
+            params.append(limit)
+        return self.conn.execute(query, params).fetchall()
+    
+    @staticmethod
+    def _ranked(rows: List[tuple], dimension: str, label: str) -> List[Dict[str, Any]]:
+        """某一维度的前 N 个值，按邮件数降序"""
+        ranked = sorted((r for r in rows if r[0] == dimension), key=lambda r: (-r[2], r[1]))
+        return [{label: r[1], "count": r[2]} for r in ranked]
+    
+    @_reads
+    def get_dashboard_stats(self, task_id: str, limit: int = 10) -> Dict[str, Any]:
+        """
+        Dashboard 全部统计，只读取统计汇总表：
+        邮件总数、时间范围、按日趋势、按小时（0-23）分布、发件人 / 收件人 / 发件域名 Top N
+        """
+        rows = self._stats_rows(task_id, ["day", "hour"])
+        rows += self._stats_rows(task_id, ["sender", "receiver", "domain"], limit)
+        return {
+            **self.get_task_stats(task_id),
+            "top_senders": self._ranked(rows, "sender", "sender"),
+            "top_receivers": self._ranked(rows, "receiver", "receiver"),
+            "top_domains": self._ranked(rows, "domain", "domain"),
+            "email_trend": [
+                {"date": r[1], "count": r[2]} for r in sorted(r for r in rows if r[0] == "day")
+            ],
+            "hourly_distribution": [
+                {"hour": int(r[1]), "count": r[2]}
+                for r in sorted((r for r in rows if r[0] == "hour"), key=lambda r: int(r[1]))
+            ],
+        }
+    
+    @_reads
+    def get_task_stats(self, task_id: str) -> Dict[str, Any]:
+        """获取任务的统计信息（邮件总数、时间范围）"""
+        rows = self._stats_rows(task_id, ["total"])
+        total = rows[0] if rows else ("total", None, 0, None, None)
+        return {
+            "total_emails": total[2],
+            "date_range": {
+                "start": total[3].isoformat() if total[3] else None,
+                "end": total[4].isoformat() if total[4] else None
+            }
+        }
     
     # ==================== 人员名录方法 ====================
     
+    @_reads
     def get_people_by_task(self, task_id: str) -> List[Dict[str, Any]]:
         """获取任务的联系人列表（按发件人聚合）"""
         result = self.conn.execute(
@@ -538,285 +1462,300 @@ class DBService:
                GROUP BY sender 
                ORDER BY email_count DESC""",
             [task_id]
-        ).fetchall()
-        
-        return [
-            {
-                "sender": row[0],
-                "email_count": row[1],
-                "last_contact": row[2].isoformat() if row[2] else None
-            }
-            for row in result
-        ]
+        )
+        return fetch_records(result)
     
+    @_reads
     def get_emails_by_sender(self, task_id: str, sender: str, limit: int = 50) -> List[Dict[str, Any]]:
         """获取指定发件人的邮件"""
         result = self.conn.execute(
-            """SELECT * FROM emails 
-               WHERE task_id = ? AND sender = ?
+            f"""WITH hits AS MATERIALIZED (SELECT {EMAIL_SELECT} FROM emails WHERE sender = ?)
+               SELECT * FROM hits
+               WHERE task_id = ?
                ORDER BY timestamp DESC
                LIMIT ?""",
-            [task_id, sender, limit]
-        ).fetchall()
-        
-        columns = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp"]
-        emails = []
-        for row in result:
-            email = dict(zip(columns, row))
-            if email.get("timestamp"):
-                email["timestamp"] = email["timestamp"].isoformat()
-            emails.append(email)
-        return emails
+            [sender, task_id, limit]
+        )
+        return fetch_records(result)
     
     # ==================== 聚类分析方法 ====================
     
-    def get_people_clusters(self, task_id: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
+    @_writes
+    def refresh_clusters(self, task_id: str, full: bool = False):
         """
-        获取往来聚类（按参与者组合聚合）
-        使用无序组合：alice↔bob 和 bob↔alice 视为同一群组
+        刷新任务的往来 / 主题聚类物化表（导入结束时调用）
+        
+        只聚合上次刷新后新增的邮件（id 大于 cluster_totals.emails_through），按 (task_id, 聚类列)
+        upsert 受影响的聚类（邮件数累加），其余行不改写；
+        从未构建过或 full=True 时删除后按列表顺序全量写入。在一个事务中完成，读取方不会看到中间状态
         """
-        offset = (page - 1) * page_size
+        max_id = self.conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM emails WHERE task_id = ?", [task_id]
+        ).fetchone()[0]
         
-        # 使用 LEAST 和 GREATEST 实现无序组合
-        result = self.conn.execute(
-            """SELECT 
-                   LEAST(sender, receiver) as participant1,
-                   GREATEST(sender, receiver) as participant2,
-                   COUNT(*) as email_count,
-                   MAX(timestamp) as latest_activity
-               FROM emails 
-               WHERE task_id = ? AND sender IS NOT NULL AND receiver IS NOT NULL
-               GROUP BY LEAST(sender, receiver), GREATEST(sender, receiver)
-               ORDER BY email_count DESC
-               LIMIT ? OFFSET ?""",
-            [task_id, page_size, offset]
-        ).fetchall()
+        self.conn.begin()
+        try:
+            for cluster_type, (table, columns, group_by, where) in _CLUSTER_TABLES.items():
+                watermark = None
+                if not full:
+                    row = self.conn.execute(
+                        "SELECT emails_through FROM cluster_totals WHERE task_id = ? AND cluster_type = ?",
+                        [task_id, cluster_type]
+                    ).fetchone()
+                    watermark = row[0] if row else None
+                
+                key_list = ", ".join(columns)
+                delta = f"""
+                    SELECT {", ".join(f"{expr} AS {col}" for expr, col in zip(group_by, columns))},
+                           COUNT(*) AS email_count, MAX(timestamp) AS latest_activity
+                    FROM emails
+                    WHERE task_id = ? AND id > ? AND id <= ? AND {where}
+                    GROUP BY {", ".join(group_by)}
+                """
+                params = [task_id, task_id, watermark or 0, max_id]
+                insert = f"""
+                    INSERT INTO {table} (task_id, {key_list}, email_count, latest_activity)
+                    SELECT ?, {key_list}, email_count, latest_activity
+                    FROM ({delta})
+                """
+                if watermark is None:
+                    self.conn.execute(f"DELETE FROM {table} WHERE task_id = ?", [task_id])
+                    self.conn.execute(f"{insert} ORDER BY email_count DESC, {key_list}", params)
+                else:
+                    self.conn.execute(f"""
+                        {insert}
+                        ON CONFLICT (task_id, {key_list}) DO UPDATE
+                        SET email_count = email_count + excluded.email_count,
+                            latest_activity = GREATEST(latest_activity, excluded.latest_activity)
+                    """, params)
+                
+                total = self.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE task_id = ?", [task_id]).fetchone()[0]
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cluster_totals (task_id, cluster_type, total, emails_through) VALUES (?, ?, ?, ?)",
+                    [task_id, cluster_type, total, max_id]
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+    
+    @_writes
+    def drop_clusters(self, task_id: str):
+        """删除任务的聚类物化结果（读取时回退为直接聚合，下次导入或回填时全量重建）"""
+        for table, *_ in _CLUSTER_TABLES.values():
+            self.conn.execute(f"DELETE FROM {table} WHERE task_id = ?", [task_id])
+        self.conn.execute("DELETE FROM cluster_totals WHERE task_id = ?", [task_id])
+    
+    def _cluster_source(self, task_id: str, cluster_type: str) -> Tuple[str, List[Any], Optional[int]]:
+        """
+        聚类来源子查询（列与物化表一致）、其参数及聚类总数
         
-        # 获取总数
-        total_result = self.conn.execute(
-            """SELECT COUNT(DISTINCT (LEAST(sender, receiver) || '↔' || GREATEST(sender, receiver)))
-               FROM emails 
-               WHERE task_id = ? AND sender IS NOT NULL AND receiver IS NOT NULL""",
-            [task_id]
+        读取方只读物化表；物化表尚未构建（旧版本导入且尚未回填的任务）时直接聚合 emails，
+        总数返回 None，由调用方按需计数
+        """
+        table, columns, group_by, where = _CLUSTER_TABLES[cluster_type]
+        row = self.conn.execute(
+            "SELECT total FROM cluster_totals WHERE task_id = ? AND cluster_type = ?", [task_id, cluster_type]
         ).fetchone()
-        total = total_result[0] if total_result else 0
+        if row is not None:
+            return f"(SELECT * FROM {table} WHERE task_id = ?)", [task_id], row[0]
         
-        clusters = []
-        for row in result:
-            cluster_key = f"{row[0]} ↔ {row[1]}"
-            # 尝试获取已保存的 AI 洞察
-            insight = self._get_cluster_insight(task_id, "people", cluster_key)
-            clusters.append({
-                "participants": cluster_key,
-                "participant1": row[0],
-                "participant2": row[1],
-                "email_count": row[2],
-                "latest_activity": row[3].isoformat() if row[3] else None,
-                "ai_insight": insight
-            })
-        
-        return {
-            "clusters": clusters,
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size if page_size > 0 else 0
-        }
+        source = f"""(
+            SELECT ? AS task_id,
+                   {", ".join(f"{expr} AS {col}" for expr, col in zip(group_by, columns))},
+                   COUNT(*) AS email_count, MAX(timestamp) AS latest_activity
+            FROM emails
+            WHERE task_id = ? AND {where}
+            GROUP BY {", ".join(group_by)}
+        )"""
+        return source, [task_id, task_id], None
     
-    def get_subject_clusters(self, task_id: str, page: int = 1, page_size: int = 20) -> Dict[str, Any]:
-        """获取主题聚类（按邮件主题聚合）"""
-        offset = (page - 1) * page_size
-        
-        result = self.conn.execute(
-            """SELECT 
-                   subject,
-                   COUNT(*) as email_count,
-                   MAX(timestamp) as latest_activity
-               FROM emails 
-               WHERE task_id = ? AND subject IS NOT NULL
-               GROUP BY subject
-               ORDER BY email_count DESC
-               LIMIT ? OFFSET ?""",
-            [task_id, page_size, offset]
-        ).fetchall()
+    @staticmethod
+    def _cluster_order_sql(cluster_type: str, alias: str) -> str:
+        """聚类列表顺序：邮件数降序，邮件数相同时按聚类列"""
+        columns = _CLUSTER_TABLES[cluster_type][1]
+        return ", ".join([f"{alias}.email_count DESC", *(f"{alias}.{col}" for col in columns)])
+    
+    @classmethod
+    def _cluster_listing_sql(cls, cluster_type: str, source: str, after: bool = False, limit: bool = False) -> str:
+        """
+        按列表顺序读取聚类，LEFT JOIN email_clusters 取已保存的 AI 洞察
         
-        # 获取总数
-        total_result = self.conn.execute(
-            """SELECT COUNT(DISTINCT subject)
-               FROM emails 
-               WHERE task_id = ? AND subject IS NOT NULL""",
-            [task_id]
-        ).fetchone()
-        total = total_result[0] if total_result else 0
+        after 时只读游标之后的聚类（参数：邮件数、邮件数、聚类列），limit 时追加 LIMIT ? OFFSET ?
+        """
+        cluster_key = _cluster_key_sql(cluster_type, "c")
+        key_list = ", ".join(f"c.{col}" for col in _CLUSTER_TABLES[cluster_type][1])
+        key_params = ", ".join("?" for _ in _CLUSTER_TABLES[cluster_type][1])
+        return f"""
+            SELECT c.*, {cluster_key} AS cluster_key, i.ai_insight
+            FROM {source} c
+            LEFT JOIN email_clusters i
+              ON i.task_id = c.task_id AND i.cluster_type = ? AND i.cluster_key = {cluster_key}
+            {f"WHERE c.email_count < ? OR (c.email_count = ? AND ({key_list}) > ({key_params}))" if after else ""}
+            ORDER BY {cls._cluster_order_sql(cluster_type, "c")}
+            {"LIMIT ? OFFSET ?" if limit else ""}
+        """
+    
+    def _cluster_page(
+        self, task_id: str, cluster_type: str, page: int, page_size: int, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        按页获取聚类及其 AI 洞察
         
-        clusters = []
-        for row in result:
-            subject = row[0]
-            # 尝试获取已保存的 AI 洞察
-            insight = self._get_cluster_insight(task_id, "subjects", subject)
-            clusters.append({
-                "subject": subject,
-                "email_count": row[1],
-                "latest_activity": row[2].isoformat() if row[2] else None,
-                "ai_insight": insight
-            })
+        指定 cursor（上一页返回的 next_cursor）时从游标之后读取，不跳过前面的行；
+        否则按页码偏移读取（旧版分页，第一页两者相同）
+        """
+        columns = _CLUSTER_TABLES[cluster_type][1]
+        source, params, total = self._cluster_source(task_id, cluster_type)
+        if total is None:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM {source}", params).fetchone()[0]
+        args = [*params, cluster_type]
+        if cursor:
+            email_count, key = decode_cluster_cursor(cursor, len(columns))
+            args += [email_count, email_count, *key]
+            offset = 0
+        else:
+            offset = (page - 1) * page_size
+        rows = fetch_records(self.conn.execute(
+            self._cluster_listing_sql(cluster_type, source, after=bool(cursor), limit=True),
+            [*args, page_size + 1, offset]
+        ))
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cluster_cursor(rows[-1]["email_count"], [rows[-1][col] for col in columns])
         
         return {
-            "clusters": clusters,
+            "rows": rows,
             "total": total,
             "page": page,
             "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size if page_size > 0 else 0
+            "total_pages": (total + page_size - 1) // page_size if page_size > 0 else 0,
+            "next_cursor": next_cursor
         }
     
-    def get_emails_by_participants(self, task_id: str, participant1: str, participant2: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """获取两个参与者之间的往来邮件"""
+    @_reads
+    def get_people_clusters(
+        self, task_id: str, page: int = 1, page_size: int = 20, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        获取往来聚类（按参与者组合聚合）
+        使用无序组合：alice↔bob 和 bob↔alice 视为同一群组
+        """
+        result = self._cluster_page(task_id, "people", page, page_size, cursor)
+        clusters = [{
+            "participants": row["cluster_key"],
+            "participant1": row["participant1"],
+            "participant2": row["participant2"],
+            "email_count": row["email_count"],
+            "latest_activity": row["latest_activity"],
+            "ai_insight": row["ai_insight"]
+        } for row in result.pop("rows")]
+        return {"clusters": clusters, **result}
+    
+    @_reads
+    def get_subject_clusters(
+        self, task_id: str, page: int = 1, page_size: int = 20, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """获取主题聚类（按邮件主题聚合）"""
+        result = self._cluster_page(task_id, "subjects", page, page_size, cursor)
+        clusters = [{
+            "subject": row["subject"],
+            "email_count": row["email_count"],
+            "latest_activity": row["latest_activity"],
+            "ai_insight": row["ai_insight"]
+        } for row in result.pop("rows")]
+        return {"clusters": clusters, **result}
+    
+    @_reads
+    def get_emails_by_participants(
+        self,
+        task_id: str,
+        participant1: str,
+        participant2: str,
+        limit: int = 50,
+        include_clean: bool = False,
+        include_masked: bool = False
+    ) -> List[Dict[str, Any]]:
+        """获取两个参与者之间的往来邮件（include_clean / include_masked 时附带预计算的清洗正文 / 脱敏列）"""
+        columns = (EMAIL_COLUMNS + (CLEAN_COLUMNS if include_clean else [])
+                   + (MASKED_COLUMNS if include_masked else []))
         result = self.conn.execute(
-            """SELECT * FROM emails 
+            f"""WITH hits AS MATERIALIZED (SELECT {", ".join(columns)} FROM emails WHERE sender IN (?, ?))
+               SELECT * FROM hits
                WHERE task_id = ? 
                  AND ((sender = ? AND receiver = ?) OR (sender = ? AND receiver = ?))
                ORDER BY timestamp DESC
                LIMIT ?""",
-            [task_id, participant1, participant2, participant2, participant1, limit]
-        ).fetchall()
-        
-        columns = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp"]
-        emails = []
-        for row in result:
-            email = dict(zip(columns, row))
-            if email.get("timestamp"):
-                email["timestamp"] = email["timestamp"].isoformat()
-            emails.append(email)
-        return emails
+            [participant1, participant2, task_id, participant1, participant2, participant2, participant1, limit]
+        )
+        return fetch_records(result)
     
-    def get_emails_by_subject(self, task_id: str, subject: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """获取指定主题的邮件"""
+    @_reads
+    def get_emails_by_subject(
+        self,
+        task_id: str,
+        subject: str,
+        limit: int = 50,
+        include_clean: bool = False,
+        include_masked: bool = False
+    ) -> List[Dict[str, Any]]:
+        """获取指定主题的邮件（include_clean / include_masked 时附带预计算的清洗正文 / 脱敏列）"""
+        columns = (EMAIL_COLUMNS + (CLEAN_COLUMNS if include_clean else [])
+                   + (MASKED_COLUMNS if include_masked else []))
         result = self.conn.execute(
-            """SELECT * FROM emails 
-               WHERE task_id = ? AND subject = ?
+            f"""WITH hits AS MATERIALIZED (SELECT {", ".join(columns)} FROM emails WHERE subject = ?)
+               SELECT * FROM hits
+               WHERE task_id = ?
                ORDER BY timestamp DESC
                LIMIT ?""",
-            [task_id, subject, limit]
-        ).fetchall()
-        
-        columns = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp"]
-        emails = []
-        for row in result:
-            email = dict(zip(columns, row))
-            if email.get("timestamp"):
-                email["timestamp"] = email["timestamp"].isoformat()
-            emails.append(email)
-        return emails
+            [subject, task_id, limit]
+        )
+        return fetch_records(result)
     
+    @_writes
     def save_cluster_insight(self, task_id: str, cluster_type: str, cluster_key: str, ai_insight: str, model: str):
-        """保存聚类的 AI 洞察结果"""
-        import json
+        """保存聚类的 AI 洞察结果；已存在时覆盖（按唯一键 CLUSTER_INSIGHT_KEY upsert）"""
         import uuid
-        created_at = datetime.now()
-        
-        # 确保 email_clusters 表存在
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS email_clusters (
-                id VARCHAR PRIMARY KEY,
-                task_id VARCHAR NOT NULL,
-                cluster_type VARCHAR NOT NULL,
-                cluster_key VARCHAR NOT NULL,
-                ai_insight TEXT,
-                model_provider VARCHAR,
-                analyzed_at TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks(id)
-            )
-        """)
-        
-        # 检查是否已存在
-        existing = self.conn.execute(
-            """SELECT id FROM email_clusters 
-               WHERE task_id = ? AND cluster_type = ? AND cluster_key = ?""",
-            [task_id, cluster_type, cluster_key]
-        ).fetchone()
+        self.conn.execute(
+            f"""INSERT INTO email_clusters 
+               (id, task_id, cluster_type, cluster_key, ai_insight, model_provider, analyzed_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT ({", ".join(CLUSTER_INSIGHT_KEY)}) DO UPDATE
+               SET ai_insight = excluded.ai_insight, model_provider = excluded.model_provider,
+                   analyzed_at = excluded.analyzed_at""",
+            [str(uuid.uuid4()), task_id, cluster_type, cluster_key, ai_insight, model, datetime.now()]
+        )
+    
+    def iter_clusters_for_export(
+        self, task_id: str, cluster_type: str, batch_size: int = 2000
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        逐行产出全部聚类及其 AI 洞察（用于导出）
         
-        if existing:
-            self.conn.execute(
-                """UPDATE email_clusters 
-                   SET ai_insight = ?, model_provider = ?, analyzed_at = ?
-                   WHERE id = ?""",
-                [ai_insight, model, created_at, existing[0]]
-            )
-        else:
-            cluster_id = str(uuid.uuid4())
-            self.conn.execute(
-                """INSERT INTO email_clusters 
-                   (id, task_id, cluster_type, cluster_key, ai_insight, model_provider, analyzed_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                [cluster_id, task_id, cluster_type, cluster_key, ai_insight, model, created_at]
+        按列表顺序读取物化表（尚未构建时直接聚合），结果从游标按批读取；生成器期间独占一个读游标，
+        可在不同线程中迭代（StreamingResponse），关闭生成器时归还游标
+        """
+        key_field = "participants" if cluster_type == "people" else "subject"
+        with self.connections.reader():
+            source, params, _ = self._cluster_source(task_id, cluster_type)
+        with self.connections.checkout() as conn:
+            cursor = conn.execute(
+                self._cluster_listing_sql(cluster_type, source),
+                [*params, cluster_type]
             )
-    
-    def _get_cluster_insight(self, task_id: str, cluster_type: str, cluster_key: str) -> Optional[str]:
-        """获取聚类的 AI 洞察（内部方法）"""
-        try:
-            result = self.conn.execute(
-                """SELECT ai_insight FROM email_clusters 
-                   WHERE task_id = ? AND cluster_type = ? AND cluster_key = ?""",
-                [task_id, cluster_type, cluster_key]
-            ).fetchone()
-            return result[0] if result else None
-        except:
-            # 表可能不存在
-            return None
-    
-    def get_all_clusters_for_export(self, task_id: str, cluster_type: str) -> List[Dict[str, Any]]:
-        """获取所有聚类数据用于导出"""
-        if cluster_type == "people":
-            result = self.conn.execute(
-                """SELECT 
-                       LEAST(sender, receiver) as participant1,
-                       GREATEST(sender, receiver) as participant2,
-                       COUNT(*) as email_count,
-                       MAX(timestamp) as latest_activity
-                   FROM emails 
-                   WHERE task_id = ? AND sender IS NOT NULL AND receiver IS NOT NULL
-                   GROUP BY LEAST(sender, receiver), GREATEST(sender, receiver)
-                   ORDER BY email_count DESC""",
-                [task_id]
-            ).fetchall()
-            
-            clusters = []
-            for row in result:
-                cluster_key = f"{row[0]} ↔ {row[1]}"
-                insight = self._get_cluster_insight(task_id, "people", cluster_key)
-                clusters.append({
-                    "participants": cluster_key,
-                    "email_count": row[2],
-                    "latest_activity": row[3].isoformat() if row[3] else None,
-                    "ai_insight": insight or ""
-                })
-            return clusters
-        else:
-            result = self.conn.execute(
-                """SELECT 
-                       subject,
-                       COUNT(*) as email_count,
-                       MAX(timestamp) as latest_activity
-                   FROM emails 
-                   WHERE task_id = ? AND subject IS NOT NULL
-                   GROUP BY subject
-                   ORDER BY email_count DESC""",
-                [task_id]
-            ).fetchall()
-            
-            clusters = []
-            for row in result:
-                insight = self._get_cluster_insight(task_id, "subjects", row[0])
-                clusters.append({
-                    "subject": row[0],
-                    "email_count": row[1],
-                    "latest_activity": row[2].isoformat() if row[2] else None,
-                    "ai_insight": insight or ""
-                })
-            return clusters
+            for rows in iter_record_batches(cursor, batch_size=batch_size):
+                for row in rows:
+                    yield {
+                        key_field: row["cluster_key"],
+                        "email_count": row["email_count"],
+                        "latest_activity": row["latest_activity"],
+                        "ai_insight": row["ai_insight"] or ""
+                    }
     
     # ==================== 批量分析任务方法 ====================
     
+    @_writes
     def create_batch_job(
         self,
         job_id: str,
@@ -865,6 +1804,7 @@ class DBService:
             "created_at": created_at.isoformat()
         }
     
+    @_reads
     def get_batch_job(self, job_id: str) -> Optional[Dict[str, Any]]:
         """获取批量分析任务详情"""
         import json
@@ -912,6 +1852,7 @@ class DBService:
             return job
         return None
     
+    @_reads
     def get_batch_jobs_by_task(self, task_id: str) -> List[Dict[str, Any]]:
         """获取指定任务的所有批量分析作业"""
         import json
@@ -954,6 +1895,7 @@ class DBService:
         
         return jobs
     
+    @_writes
     def update_batch_job_status(
         self, 
         job_id: str, 
@@ -981,6 +1923,7 @@ class DBService:
                 [status, job_id]
             )
     
+    @_writes
     def update_batch_job_progress(
         self, 
         job_id: str, 
@@ -998,6 +1941,7 @@ class DBService:
             [processed_count, success_count, failed_count, skipped_count, job_id]
         )
     
+    @_writes
     def update_batch_job_total_count(self, job_id: str, total_count: int):
         """更新批量分析任务的总数"""
         self.conn.execute(
@@ -1005,94 +1949,98 @@ class DBService:
             [total_count, job_id]
         )
     
-    def get_emails_for_batch_analysis(
-        self, 
-        task_id: str, 
+    @staticmethod
+    def _batch_filter_sql(filter_keywords: Optional[List[str]]) -> str:
+        """批量分析的主题关键词过滤条件（以 AND 开头，无关键词时为空）"""
+        if not filter_keywords:
+            return ""
+        conditions = []
+        for keyword in filter_keywords:
+            escaped = keyword.replace("'", "''")
+            conditions.append(f"subject NOT LIKE '%{escaped}%'")
+        return " AND " + " AND ".join(conditions)
+    
+    @_reads
+    def get_batch_work_set(
+        self,
+        task_id: str,
         filter_keywords: List[str] = None,
-        limit: int = None,
-        offset: int = 0
-    ) -> tuple:
+        analysis_type: str = "batch_summary"
+    ) -> Dict[str, Any]:
         """
-        获取用于批量分析的邮件
-        返回: (邮件列表, 被过滤的数量)
+        批量分析的待处理集合计数（一条语句）：按关键词过滤，反连接 analysis_results 排除已有该类型结果的邮件
+        
+        返回:
+            total: 任务邮件总数
+            skipped: 被关键词过滤的数量
+            done: 未被过滤且已有结果的数量
+            pending: 待分析的数量
+            first_id / last_id: 任务邮件 id 范围（生产者按此范围分页读取，无邮件时为 0）
         """
-        # 构建过滤条件
-        filter_sql = ""
-        if filter_keywords:
-            conditions = []
-            for keyword in filter_keywords:
-                escaped = keyword.replace("'", "''")
-                conditions.append(f"subject NOT LIKE '%{escaped}%'")
-            filter_sql = " AND " + " AND ".join(conditions)
-        
-        # 查询符合条件的邮件
-        query = f"""
-            SELECT * FROM emails 
-            WHERE task_id = ? {filter_sql}
-            ORDER BY id
+        condition = f"COALESCE(TRUE {self._batch_filter_sql(filter_keywords)}, FALSE)"
+        total, selected, done, first_id, last_id = self.conn.execute(
+            f"""SELECT COUNT(*), COUNT(*) FILTER (WHERE selected), COUNT(*) FILTER (WHERE selected AND done),
+                       COALESCE(MIN(id), 0), COALESCE(MAX(id), 0)
+                FROM (
+                    SELECT id, {condition} AS selected,
+                           id IN (SELECT email_id FROM analysis_results WHERE analysis_type = ?) AS done
+                    FROM emails
+                    WHERE task_id = ?
+                )""",
+            [analysis_type, task_id]
+        ).fetchone()
+        return {
+            "total": total, "skipped": total - selected, "done": done, "pending": selected - done,
+            "first_id": first_id, "last_id": last_id
+        }
+    
+    @_reads
+    def get_emails_for_analysis(
+        self,
+        task_id: str,
+        after_id: int,
+        through_id: int,
+        limit: int,
+        filter_keywords: List[str] = None,
+        analysis_type: str = "batch_summary"
+    ) -> List[Dict[str, Any]]:
         """
-        if limit:
-            query += f" LIMIT {limit} OFFSET {offset}"
+        按 id 顺序读取下一批待分析的邮件（附带预脱敏的列）：id 在 (after_id, through_id] 内、
+        未被过滤且没有该类型结果的前 limit 封
         
-        result = self.conn.execute(query, [task_id]).fetchall()
-        columns = ["id", "task_id", "sender", "receiver", "subject", "content", "timestamp"]
-        emails = [dict(zip(columns, row)) for row in result]
-        
-        # 计算被过滤的数量
-        total_query = "SELECT COUNT(*) FROM emails WHERE task_id = ?"
-        total_result = self.conn.execute(total_query, [task_id]).fetchone()
-        total_count = total_result[0] if total_result else 0
-        
-        filtered_query = f"SELECT COUNT(*) FROM emails WHERE task_id = ? {filter_sql}"
-        filtered_result = self.conn.execute(filtered_query, [task_id]).fetchone()
-        filtered_count = filtered_result[0] if filtered_result else 0
-        
-        skipped_count = total_count - filtered_count
-        
-        return emails, skipped_count
+        批量分析任务的生产者以上一批最后的 id 作为 after_id 逐批调用（keyset 分页），不在内存中保存 id 列表；
+        through_id 限定本次扫描的 id 窗口，邮件表和 analysis_results 两侧都只读取窗口内的行
+        （不加上限时每批都要对 after_id 之后的全部邮件做反连接，200 万封邮件时每批约 0.7 秒，加上限后约 10 毫秒）
+        """
+        columns = EMAIL_COLUMNS + MASKED_COLUMNS
+        result = self.conn.execute(
+            f"""SELECT {', '.join(columns)} FROM emails e
+                WHERE task_id = ? AND id > ? AND id <= ? {self._batch_filter_sql(filter_keywords)}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM analysis_results r
+                      WHERE r.email_id = e.id AND r.email_id > ? AND r.email_id <= ? AND r.analysis_type = ?
+                  )
+                ORDER BY id
+                LIMIT ?""",
+            [task_id, after_id, through_id, after_id, through_id, analysis_type, limit]
+        ).fetchall()
+        return [dict(zip(columns, row)) for row in result]
     
+    @_reads
     def get_clusters_for_batch_analysis(self, task_id: str, cluster_type: str) -> List[Dict[str, Any]]:
-        """获取用于批量分析的聚类列表"""
-        if cluster_type == "people":
-            result = self.conn.execute(
-                """SELECT 
-                       LEAST(sender, receiver) as participant1,
-                       GREATEST(sender, receiver) as participant2,
-                       COUNT(*) as email_count
-                   FROM emails 
-                   WHERE task_id = ? AND sender IS NOT NULL AND receiver IS NOT NULL
-                   GROUP BY LEAST(sender, receiver), GREATEST(sender, receiver)
-                   ORDER BY email_count DESC""",
-                [task_id]
-            ).fetchall()
-            
-            return [{"id": f"{row[0]} ↔ {row[1]}", "key": f"{row[0]} ↔ {row[1]}", "count": row[2]} for row in result]
-        else:
-            result = self.conn.execute(
-                """SELECT 
-                       subject,
-                       COUNT(*) as email_count
-                   FROM emails 
-                   WHERE task_id = ? AND subject IS NOT NULL
-                   GROUP BY subject
-                   ORDER BY email_count DESC""",
-                [task_id]
-            ).fetchall()
-            
-            return [{"id": row[0], "key": row[0], "count": row[1]} for row in result]
-    
-    def has_email_analysis(self, email_id: int, analysis_type: str = "batch_summary") -> bool:
-        """检查邮件是否已有指定类型的分析结果"""
+        """获取用于批量分析的聚类列表（按邮件数降序）"""
+        source, params, _ = self._cluster_source(task_id, cluster_type)
         result = self.conn.execute(
-            """SELECT COUNT(*) FROM analysis_results 
-               WHERE email_id = ? AND analysis_type = ?""",
-            [email_id, analysis_type]
-        ).fetchone()
-        return result[0] > 0 if result else False
+            f"""SELECT {_cluster_key_sql(cluster_type, "c")}, c.email_count
+                FROM {source} c
+                ORDER BY {self._cluster_order_sql(cluster_type, "c")}""",
+            params
+        ).fetchall()
+        return [{"id": row[0], "key": row[0], "count": row[1]} for row in result]
     
     def close(self):
         """关闭数据库连接"""
-        self.conn.close()
+        self.connections.close()
 
 
 # 全局数据库服务实例
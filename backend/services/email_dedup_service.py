@@ -2,10 +2,26 @@
 邮件去重服务
 - 使用 email-reply-parser 去除引用和签名
 - 提供智能上下文构建
+- 清洗结果在导入时预计算（emails.clean_content / clean_hash），上下文构建时直接读取
 """
-from typing import List, Dict, Any, Set
+import hashlib
+from typing import List, Dict, Any, Set, Tuple, Optional
 from email_reply_parser import EmailReplyParser
 
+
+def clean_content_batch(rows: List[Tuple[int, Optional[str]]]) -> List[Tuple[int, str, str]]:
+    """
+    批量清洗邮件正文（模块级函数，供导入时的进程池调用）
+    
+    Args:
+        rows: [(email_id, content), ...]
+    
+    Returns:
+        [(email_id, clean_content, clean_hash), ...]
+    """
+    return [(email_id, *EmailDedupService.clean_and_hash(content)) for email_id, content in rows]
+
+
 class EmailDedupService:
     @staticmethod
     def clean_content(content: str) -> str:
@@ -27,6 +43,12 @@ class EmailDedupService:
             print(f"Error parsing email content: {e}")
             return content
     
+    @staticmethod
+    def clean_and_hash(content: Optional[str]) -> Tuple[str, str]:
+        """清洗正文并计算去重用的哈希（清洗后去除首尾空白的文本的 md5）"""
+        clean_text = EmailDedupService.clean_content(content or "").strip()
+        return clean_text, hashlib.md5(clean_text.encode("utf-8")).hexdigest()
+    
     @staticmethod
     def build_deduped_context(
         emails: List[Dict[str, Any]], 
@@ -36,8 +58,8 @@ class EmailDedupService:
         构建去重后的上下文
         
         策略：
-        1. 对每封邮件进行内容清洗（去引用/签名）
-        2. 去除完全重复的内容
+        1. 对每封邮件进行内容清洗（去引用/签名）；优先使用导入时预计算的 clean_content
+        2. 按清洗后内容的哈希去除完全重复的内容
         3. 拼接邮件直到达到长度限制
         """
         if not emails:
@@ -45,15 +67,15 @@ class EmailDedupService:
             
         context_parts = []
         current_length = 0
-        seen_contents: Set[str] = set()
+        seen_hashes: Set[str] = set()
         
         # 遍历所有提供的邮件（建议调用方传入尽量多的邮件，例如 20+ 封）
         for i, email in enumerate(emails, 1):
-            raw_content = email.get('content', '') or ''
-            
-            # 清洗内容
-            clean_text = EmailDedupService.clean_content(raw_content)
-            clean_text = clean_text.strip()
+            clean_text = email.get('clean_content')
+            clean_hash = email.get('clean_hash')
+            if clean_text is None or clean_hash is None:
+                # 未预计算（如导入后清洗尚未完成）时实时清洗
+                clean_text, clean_hash = EmailDedupService.clean_and_hash(email.get('content', ''))
             
             # 跳过空内容
             if not clean_text:
@@ -61,9 +83,9 @@ class EmailDedupService:
             
             # 跳过重复内容 (简单哈希去重)
             # 有时候不同只有标点符号，这里做严格去重，避免为了去重丢失细微差别
-            if clean_text in seen_contents:
+            if clean_hash in seen_hashes:
                 continue
-            seen_contents.add(clean_text)
+            seen_hashes.add(clean_hash)
             
             # 构建邮件块
             email_block = f"""
@@ -0,0 +1,776 @@
+"""
+导入引擎模块 - 大文件分块并行导入
+
+- 按记录边界（感知引号内换行）把文件切分为字节块
+- 使用线程池并行解析字节块（pyarrow 解析时释放 GIL）
+- mbox / .eml 压缩包 / Maildir 按邮件批次在进程池中解析
+- Parquet 按行组、NDJSON 按行块读取，只读取映射和过滤用到的列
+- gzip / zstd 压缩的 CSV / NDJSON 流式解压后直接切块，不解压到磁盘
+- 按块顺序逐块提交到 emails 表，每块一个事务
+- 每提交一块即更新 ingest_progress 表（行数、字节数、速率）
+- 失败时保留已提交的块，并记录失败的块序号
+- 导入完成后在进程池中按批预计算清洗后的正文（clean_content / clean_hash），可选预脱敏（masked_*）
+"""
+import os
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+import duckdb
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+# 每个块的目标大小（按记录边界对齐，实际略大）
+DEFAULT_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE_MB", "32")) * 1024 * 1024
+# 并行解析线程数
+DEFAULT_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 扫描记录边界时每次读取的大小
+_SCAN_BLOCK_SIZE = 8 * 1024 * 1024
+# 预计算清洗正文时每批的邮件数
+CLEAN_BATCH_ROWS = int(os.getenv("INGEST_CLEAN_BATCH_ROWS", "2000"))
+
+# 列式 / JSON 文件类型（按扩展名）
+PARQUET_FILE_TYPES = {"parquet"}
+NDJSON_FILE_TYPES = {"ndjson", "jsonl"}
+# 压缩扩展名 -> pyarrow 解压编码（DuckDB 按扩展名自动识别同样的压缩格式）
+COMPRESSION_CODECS = {"gz": "gzip", "gzip": "gzip", "zst": "zstd", "zstd": "zstd"}
+
+
+class ChunkIngestError(Exception):
+    """某个数据块导入失败"""
+
+    def __init__(self, chunk_index: int, cause: Exception):
+        super().__init__(f"第 {chunk_index} 块导入失败: {cause}")
+        self.chunk_index = chunk_index
+        self.cause = cause
+
+
+def _quote_parity(block: bytes, quote: Optional[bytes], start: int, end: int) -> int:
+    """统计区间内引号数量的奇偶性"""
+    if not quote or start >= end:
+        return 0
+    return block.count(quote, start, end) & 1
+
+
+def iter_record_chunks(
+    stream,
+    quote: Optional[str],
+    chunk_size: int,
+    first_chunk_size: Optional[int] = None
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    按记录边界切分字节流
+
+    只有在引号外的换行符才是记录边界（RFC 4180 中转义引号 "" 不改变奇偶性），
+    因此邮件正文中的多行内容不会被切断。
+
+    Args:
+        stream: 二进制流（支持 read）
+        quote: 引号字符，None 表示无引号
+        chunk_size: 每块目标字节数
+        first_chunk_size: 第一块的目标字节数（传 1 可单独切出表头行）
+
+    Yields:
+        (块起始偏移, 块字节内容)
+    """
+    q = quote.encode() if quote else None
+    parity = 0
+    pending: List[bytes] = []
+    pending_len = 0
+    start = 0
+    target = first_chunk_size if first_chunk_size is not None else chunk_size
+
+    while True:
+        block = stream.read(_SCAN_BLOCK_SIZE)
+        if not block:
+            break
+        n = len(block)
+        seg = 0  # 当前块中尚未归入 pending 的起始位置
+        i = 0    # 当前块中已统计引号的位置
+
+        while True:
+            cut = seg + max(0, target - pending_len)
+            if cut >= n:
+                parity ^= _quote_parity(block, q, i, n)
+                break
+            if cut > i:
+                parity ^= _quote_parity(block, q, i, cut)
+                i = cut
+            nl = block.find(b"\n", i)
+            if nl == -1:
+                parity ^= _quote_parity(block, q, i, n)
+                break
+            parity ^= _quote_parity(block, q, i, nl)
+            i = nl + 1
+            if parity == 0:
+                pending.append(block[seg:i])
+                data = b"".join(pending)
+                yield start, data
+                start += len(data)
+                pending = []
+                pending_len = 0
+                seg = i
+                target = chunk_size
+
+        if seg < n:
+            pending.append(block[seg:])
+            pending_len += n - seg
+
+    if pending_len:
+        yield start, b"".join(pending)
+
+
+def sniff_csv_dialect(file_path: str) -> Dict[str, Any]:
+    """
+    使用 DuckDB 嗅探 CSV 方言
+
+    Returns:
+        包含 delimiter/quote/escape/has_header/skip_rows/columns/formats 的字典
+    """
+    conn = duckdb.connect(":memory:")
+    try:
+        escaped_path = file_path.replace("'", "''")
+        row = conn.execute(f"SELECT * FROM sniff_csv('{escaped_path}')").fetchone()
+        cols = [desc[0] for desc in conn.description]
+        info = dict(zip(cols, row))
+    finally:
+        conn.close()
+
+    def _normalize(value):
+        if value in (None, "", "(empty)", "\\0"):
+            return None
+        return value
+
+    columns = [c["name"] for c in info["Columns"]]
+    return {
+        "delimiter": info["Delimiter"],
+        "quote": _normalize(info["Quote"]),
+        "escape": _normalize(info["Escape"]),
+        "comment": _normalize(info.get("Comment")),
+        "has_header": bool(info["HasHeader"]),
+        "skip_rows": info.get("SkipRows") or 0,
+        "columns": columns,
+        "column_types": {c["name"]: c["type"] for c in info["Columns"]},
+        "date_format": _normalize(info.get("DateFormat")),
+        "timestamp_format": _normalize(info.get("TimestampFormat")),
+    }
+
+
+def supports_chunked_read(dialect: Dict[str, Any]) -> bool:
+    """判断方言是否能按引号奇偶性安全切分"""
+    if dialect["skip_rows"] or dialect["comment"]:
+        return False
+    escape = dialect["escape"]
+    if escape and escape != dialect["quote"]:
+        return False
+    return len(dialect["delimiter"]) == 1
+
+
+def parse_csv_chunk(data: bytes, dialect: Dict[str, Any]) -> pa.Table:
+    """
+    解析一个 CSV 字节块为 Arrow 表（所有列按字符串读取，类型转换交给 SQL）
+    """
+    columns = dialect["columns"]
+    return pa_csv.read_csv(
+        pa.py_buffer(data),
+        read_options=pa_csv.ReadOptions(column_names=columns, use_threads=False),
+        parse_options=pa_csv.ParseOptions(
+            delimiter=dialect["delimiter"],
+            quote_char=dialect["quote"] or False,
+            double_quote=True,
+            escape_char=False,
+            newlines_in_values=True
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in columns},
+            strings_can_be_null=True,
+            null_values=[""],
+            quoted_strings_can_be_null=False
+        )
+    )
+
+
+def split_compression(file_path: str) -> Tuple[str, Optional[str]]:
+    """
+    识别文件类型和压缩编码，如 emails.csv.gz -> ("csv", "gzip")
+    """
+    base, ext = os.path.splitext(file_path)
+    ext = ext.lstrip(".").lower()
+    codec = COMPRESSION_CODECS.get(ext)
+    if codec:
+        return os.path.splitext(base)[1].lstrip(".").lower() or "csv", codec
+    return ext, None
+
+
+def resolve_file_type(file_path: str, file_type: Optional[str] = None) -> str:
+    """上传时按最后一个扩展名得到的类型为压缩扩展名（gz / zst）时，取被压缩文件的类型"""
+    if not file_type or file_type.lower() in COMPRESSION_CODECS:
+        return split_compression(file_path)[0]
+    return file_type.lower()
+
+
+@contextmanager
+def open_source_stream(file_path: str):
+    """
+    打开源文件的字节流，压缩文件返回流式解压流
+
+    Yields:
+        (读取用的流, 原始文件)，原始文件的 tell() 为已读取的源文件字节数
+    """
+    codec = split_compression(file_path)[1]
+    raw = pa.OSFile(file_path, "rb")
+    try:
+        if codec:
+            with pa.CompressedInputStream(raw, codec) as stream:
+                yield stream, raw
+        else:
+            yield raw, raw
+    finally:
+        raw.close()
+
+
+def _iter_sized_chunks(
+    chunks: Iterator[Tuple[int, bytes]],
+    raw,
+    compressed: bool,
+    consumed: int = 0
+) -> Iterator[Tuple[int, bytes]]:
+    """为每块附上对应的源文件字节数（压缩文件按已读取的压缩字节数计算）"""
+    for _, data in chunks:
+        if compressed:
+            position = raw.tell()
+            yield position - consumed, data
+            consumed = position
+        else:
+            yield len(data), data
+
+
+def file_source_sql(file_path: str, file_type: Optional[str] = None) -> str:
+    """
+    返回 DuckDB 读取该文件的表函数表达式（按扩展名选择 read_parquet / read_json / read_csv_auto）
+    """
+    file_type = resolve_file_type(file_path, file_type)
+    escaped_path = file_path.replace("'", "''")
+    if file_type in PARQUET_FILE_TYPES:
+        return f"read_parquet('{escaped_path}')"
+    if file_type in NDJSON_FILE_TYPES:
+        return f"read_json_auto('{escaped_path}', format = 'newline_delimited')"
+    return f"read_csv_auto('{escaped_path}')"
+
+
+def projected_columns(
+    mapping: Optional[Dict[str, Any]],
+    filter_config: Optional[Dict[str, Any]] = None
+) -> List[str]:
+    """导入时实际需要读取的列：字段映射和过滤条件用到的列"""
+    columns = [col for col in (mapping or {}).values() if col]
+    if filter_config:
+        columns += [c.get("field") for c in filter_config.get("conditions", []) if c.get("field")]
+    return list(dict.fromkeys(columns))
+
+
+def read_parquet_row_group(file_path: str, index: int, columns: List[str]) -> pa.Table:
+    """读取 Parquet 文件的一个行组（只读取投影列）"""
+    return pq.ParquetFile(file_path).read_row_group(index, columns=columns)
+
+
+def _to_string_array(array) -> pa.Array:
+    """将 JSON 解析出的任意类型列转换为字符串列（嵌套值序列化为 JSON）"""
+    if pa.types.is_string(array.type):
+        return array
+    if pa.types.is_nested(array.type):
+        values = [None if v is None else json.dumps(v, ensure_ascii=False, default=str) for v in array.to_pylist()]
+        return pa.array(values, pa.string())
+    return pc.cast(array, pa.string())
+
+
+def _json_value_to_str(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def parse_ndjson_chunk(data: bytes, columns: List[str]) -> pa.Table:
+    """
+    解析一个 NDJSON 字节块为 Arrow 表（只保留投影列，统一转为字符串，类型转换交给 SQL）
+    """
+    try:
+        table = pa_json.read_json(
+            pa.py_buffer(data),
+            # 整块作为一个解析单元，单条记录再长也不会跨越解析边界
+            read_options=pa_json.ReadOptions(use_threads=False, block_size=len(data) + 1)
+        )
+        arrays = [
+            _to_string_array(table.column(col)) if col in table.column_names
+            else pa.nulls(table.num_rows, pa.string())
+            for col in columns
+        ]
+    except pa.ArrowInvalid:
+        # 同一字段在不同记录中类型不一致时，退回逐行解析
+        records = [json.loads(line) for line in data.splitlines() if line.strip()]
+        arrays = [
+            pa.array([_json_value_to_str(r.get(col)) for r in records], pa.string())
+            for col in columns
+        ]
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+class IngestService:
+    """分块并行导入服务"""
+
+    # 邮箱格式额外写入的列（cc / Message-ID / In-Reply-To 原样写入扩展列）
+    _MAILBOX_EXTRA_COLUMNS = ["cc", "message_id", "in_reply_to"]
+
+    def __init__(
+        self,
+        db,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        append: bool = False
+    ):
+        """
+        Args:
+            db: DBService 实例
+            chunk_size: 每块目标字节数
+            workers: 并行解析线程数
+            append: 追加模式，跳过任务中已存在（内容哈希相同）的行
+        """
+        self.db = db
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.append = append
+
+    @staticmethod
+    def build_select_list(
+        mapping: Optional[Dict[str, Any]],
+        timestamp_formats: Optional[List[str]] = None
+    ) -> str:
+        """
+        根据字段映射构建 SELECT 列表（sender, receiver, subject, content, timestamp）
+        """
+        mapping = mapping or {}
+        parts = []
+        for field in ("sender", "receiver", "subject", "content"):
+            col = mapping.get(field)
+            parts.append(f'"{col}" as {field}' if col else f"NULL as {field}")
+
+        timestamp_col = mapping.get("timestamp")
+        if timestamp_col:
+            candidates = [
+                f"TRY_STRPTIME(CAST(\"{timestamp_col}\" AS VARCHAR), '{fmt.replace(chr(39), chr(39) * 2)}')"
+                for fmt in (timestamp_formats or [])
+            ]
+            candidates.append(f'TRY_CAST("{timestamp_col}" AS TIMESTAMP)')
+            expr = candidates[0] if len(candidates) == 1 else f"COALESCE({', '.join(candidates)})"
+            parts.append(f"{expr} as timestamp")
+        else:
+            parts.append("NULL as timestamp")
+        return ",\n                        ".join(parts)
+
+    def ingest_csv(
+        self,
+        task_id: str,
+        file_path: str,
+        mapping: Optional[Dict[str, Any]] = None,
+        filter_config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        分块并行导入 CSV 文件（gzip / zstd 压缩文件边读边解压）
+
+        Returns:
+            最终的导入进度记录
+        """
+        total_bytes = os.path.getsize(file_path)
+        self.db.start_ingest_progress(task_id, total_bytes)
+
+        dialect = sniff_csv_dialect(file_path)
+        formats = [f for f in (dialect["timestamp_format"], dialect["date_format"]) if f]
+        select_list = self.build_select_list(mapping, formats)
+        where_sql = self.db.build_filter_where_clause(filter_config)
+
+        if not supports_chunked_read(dialect):
+            # 无法安全切分的方言（如反斜杠转义），退化为单块整体导入
+            return self._ingest_whole_file(task_id, file_path, total_bytes, select_list, where_sql)
+
+        compressed = split_compression(file_path)[1] is not None
+        with open_source_stream(file_path) as (stream, raw):
+            chunks = iter_record_chunks(stream, dialect["quote"], self.chunk_size, first_chunk_size=1)
+            if dialect["has_header"]:
+                _, header = next(chunks, (0, b""))
+                header_bytes = raw.tell() if compressed else len(header)
+            else:
+                header_bytes = 0
+            return self._ingest_chunks(
+                task_id,
+                _iter_sized_chunks(chunks, raw, compressed, header_bytes),
+                lambda data: parse_csv_chunk(data, dialect),
+                select_list,
+                where_sql,
+                base_bytes=header_bytes
+            )
+
+    def ingest_mailbox(
+        self,
+        task_id: str,
+        file_path: str,
+        mapping: Optional[Dict[str, Any]] = None,
+        filter_config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        导入 mbox 文件、.eml 压缩包或 Maildir 目录
+
+        邮件按批在进程池中解析为 Arrow 表，再按批顺序写入 emails 表。
+        未提供映射时使用解析出的标准列（sender/receiver/subject/content/timestamp）。
+        """
+        from services.mailbox_service import (
+            detect_mailbox_format, iter_message_batches, parse_message_batch, total_source_bytes
+        )
+
+        fmt = detect_mailbox_format(file_path)
+        self.db.start_ingest_progress(task_id, total_source_bytes(file_path, fmt))
+
+        _, select_list, columns = self._mailbox_select(mapping)
+        where_sql = self.db.build_filter_where_clause(filter_config)
+
+        return self._ingest_chunks(
+            task_id,
+            iter_message_batches(file_path, fmt),
+            parse_message_batch,
+            select_list,
+            where_sql,
+            use_processes=True,
+            columns=columns
+        )
+
+    def _mailbox_select(self, mapping: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], str, List[str]]:
+        """
+        邮箱格式的 SELECT 列表：未提供映射时使用解析出的标准列
+
+        Returns:
+            (实际使用的映射, SELECT 列表, 目标列)
+        """
+        mapping = {k: v for k, v in (mapping or {}).items() if v} or {
+            field: field for field in ("sender", "receiver", "subject", "content", "timestamp")
+        }
+        extra = self._MAILBOX_EXTRA_COLUMNS
+        select_list = self.build_select_list(mapping) + "".join(
+            f',\n                        "{col}" as {col}' for col in extra
+        )
+        return mapping, select_list, self.db.EMAIL_IMPORT_COLUMNS + extra
+
+    def ingest_staged(
+        self,
+        task_id: str,
+        file_path: str,
+        staged_path: str,
+        mapping: Optional[Dict[str, Any]] = None,
+        filter_config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        从上传时生成的暂存副本（Parquet）导入，不再解析源文件
+
+        Args:
+            file_path: 源文件路径（用于识别格式和时间格式）
+            staged_path: 暂存副本路径
+        """
+        from services.mailbox_service import detect_mailbox_format
+
+        where_sql = self.db.build_filter_where_clause(filter_config)
+        if detect_mailbox_format(file_path):
+            mapping, select_list, columns = self._mailbox_select(mapping)
+            projection = projected_columns(
+                {**mapping, **{col: col for col in self._MAILBOX_EXTRA_COLUMNS}}, filter_config
+            )
+            return self._ingest_row_groups(task_id, staged_path, projection, select_list, where_sql, columns)
+
+        # 暂存副本中 CSV 各列均为字符串，时间列按嗅探出的格式解析
+        dialect = sniff_csv_dialect(file_path)
+        formats = [f for f in (dialect["timestamp_format"], dialect["date_format"]) if f]
+        return self._ingest_row_groups(
+            task_id,
+            staged_path,
+            projected_columns(mapping, filter_config),
+            self.build_select_list(mapping, formats),
+            where_sql
+        )
+
+    def ingest_parquet(
+        self,
+        task_id: str,
+        file_path: str,
+        mapping: Optional[Dict[str, Any]] = None,
+        filter_config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        按行组并行导入 Parquet 文件（只读取映射和过滤用到的列）
+
+        进度按行组的压缩字节数统计。
+        """
+        return self._ingest_row_groups(
+            task_id,
+            file_path,
+            projected_columns(mapping, filter_config),
+            self.build_select_list(mapping),
+            self.db.build_filter_where_clause(filter_config)
+        )
+
+    def _ingest_row_groups(
+        self,
+        task_id: str,
+        file_path: str,
+        projection: List[str],
+        select_list: str,
+        where_sql: str,
+        columns: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """以 Parquet 行组为块并行读取（只读取投影列）、按序提交"""
+        metadata = pq.ParquetFile(file_path).metadata
+        sizes = [
+            sum(rg.column(j).total_compressed_size for j in range(rg.num_columns))
+            for rg in (metadata.row_group(i) for i in range(metadata.num_row_groups))
+        ]
+        self.db.start_ingest_progress(task_id, sum(sizes))
+
+        return self._ingest_chunks(
+            task_id,
+            ((size, index) for index, size in enumerate(sizes)),
+            lambda index: read_parquet_row_group(file_path, index, projection),
+            select_list,
+            where_sql,
+            columns=columns
+        )
+
+    def ingest_ndjson(
+        self,
+        task_id: str,
+        file_path: str,
+        mapping: Optional[Dict[str, Any]] = None,
+        filter_config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        分块并行导入 NDJSON 文件（每行一条 JSON 记录，只保留映射和过滤用到的字段，支持 gzip / zstd 压缩）
+        """
+        self.db.start_ingest_progress(task_id, os.path.getsize(file_path))
+
+        columns = projected_columns(mapping, filter_config)
+        compressed = split_compression(file_path)[1] is not None
+        with open_source_stream(file_path) as (stream, raw):
+            # JSON 字符串中不允许出现未转义的换行，每个换行都是记录边界
+            chunks = iter_record_chunks(stream, None, self.chunk_size)
+            return self._ingest_chunks(
+                task_id,
+                _iter_sized_chunks(chunks, raw, compressed),
+                lambda data: parse_ndjson_chunk(data, columns),
+                self.build_select_list(mapping),
+                self.db.build_filter_where_clause(filter_config)
+            )
+
+    def _ingest_chunks(
+        self,
+        task_id: str,
+        chunks: Iterator[Tuple[int, bytes]],
+        parse_chunk,
+        select_list: str,
+        where_sql: str,
+        base_bytes: int = 0,
+        use_processes: bool = False,
+        columns: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        并行解析、按序提交
+
+        解析在线程池（或进程池）中进行，提交始终按块序号顺序执行，
+        因此已提交的块总是源文件的一个连续前缀。
+
+        Args:
+            chunks: 迭代器，yield (源字节数, 待解析数据)
+            parse_chunk: 解析函数，返回 Arrow 表（使用进程池时须为模块级函数）
+        """
+        started = time.monotonic()
+        stats = {"bytes_read": base_bytes, "rows_read": 0, "rows_inserted": 0, "rows_duplicate": 0, "chunks_done": 0}
+        in_flight = deque()
+        chunk_index = 0
+
+        def commit():
+            self._commit_next(task_id, in_flight, select_list, where_sql, stats, started, columns)
+
+        if use_processes:
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        with pool:
+            try:
+                for size, data in chunks:
+                    in_flight.append((chunk_index, size, pool.submit(parse_chunk, data)))
+                    chunk_index += 1
+                    # 限制在途块数，内存占用与并行度成正比
+                    if len(in_flight) > self.workers:
+                        commit()
+                while in_flight:
+                    commit()
+            except ChunkIngestError as e:
+                for _, _, future in in_flight:
+                    future.cancel()
+                self.db.fail_ingest_progress(task_id, e.chunk_index, str(e.cause))
+                raise
+
+        self.db.finish_ingest_progress(task_id, chunks_total=chunk_index)
+        return self.db.get_ingest_progress(task_id)
+
+    def _commit_next(
+        self,
+        task_id: str,
+        in_flight: deque,
+        select_list: str,
+        where_sql: str,
+        stats: Dict[str, int],
+        started: float,
+        columns: Optional[List[str]] = None
+    ):
+        """等待最早的块解析完成并提交"""
+        index, size, future = in_flight.popleft()
+        try:
+            table = future.result()
+            inserted, duplicates = self.db.insert_email_chunk(
+                task_id, table, select_list, where_sql, columns, append=self.append
+            )
+        except Exception as e:
+            raise ChunkIngestError(index, e) from e
+
+        stats["bytes_read"] += size
+        stats["rows_read"] += table.num_rows
+        stats["rows_inserted"] += inserted
+        stats["rows_duplicate"] += duplicates
+        stats["chunks_done"] += 1
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.db.update_ingest_progress(
+            task_id,
+            bytes_read=stats["bytes_read"],
+            rows_read=stats["rows_read"],
+            rows_inserted=stats["rows_inserted"],
+            chunks_done=stats["chunks_done"],
+            rows_per_second=stats["rows_read"] / elapsed,
+            rows_duplicate=stats["rows_duplicate"]
+        )
+
+    def precompute_clean_content(self, task_id: str, batch_rows: int = CLEAN_BATCH_ROWS) -> int:
+        """
+        为任务中尚未清洗的邮件预计算 clean_content / clean_hash
+        （email-reply-parser 为纯 Python，在进程池中并行解析）
+
+        Returns:
+            写入的行数
+        """
+        from services.email_dedup_service import clean_content_batch
+
+        return self._map_id_batches(
+            lambda after_id: self.db.get_uncleaned_emails(task_id, after_id, batch_rows),
+            clean_content_batch,
+            self.db.update_clean_content,
+            batch_rows
+        )
+
+    def precompute_masked_content(self, task_id: str, batch_rows: int = CLEAN_BATCH_ROWS) -> int:
+        """
+        为任务中尚未脱敏的邮件预计算 masked_* 列
+
+        各进程用本地 Token 脱敏，按批顺序把本地 Token 重映射为任务级 Token
+        （同一值在整个任务中始终对应同一 Token，与批量分析的运行时脱敏共用任务级实例），
+        新 Token 先于脱敏结果写入 pii_tokens。
+
+        Returns:
+            写入的行数
+        """
+        from services.pii_masking_service import get_task_masking_service, mask_email_batch
+
+        # 与批量分析的运行时脱敏共用任务级实例，Token 编号不会冲突
+        masking = get_task_masking_service(task_id, lambda: self.db.get_pii_tokens(task_id))
+
+        def commit(result) -> int:
+            rows, local_reverse_map = result
+            with masking.lock:
+                known = len(masking.token_map)
+                remapped = [
+                    (row[0], *(masking.remap_tokens(value, local_reverse_map) for value in row[1:]))
+                    for row in rows
+                ]
+                new_tokens = masking.tokens_since(known)
+            self.db.save_pii_tokens(task_id, new_tokens)
+            return self.db.update_masked_content(remapped)
+
+        return self._map_id_batches(
+            lambda after_id: self.db.get_unmasked_emails(task_id, after_id, batch_rows),
+            mask_email_batch,
+            commit,
+            batch_rows
+        )
+
+    def _map_id_batches(self, fetch, work, commit, batch_rows: int) -> int:
+        """
+        按 id 分批读取 → 进程池处理 → 按批顺序写回
+
+        Args:
+            fetch: fetch(after_id) 返回 id 大于 after_id 的下一批行（按 id 排序，首列为 id）
+            work: 模块级处理函数（在进程池中执行）
+            commit: 写回函数，返回写入的行数
+            batch_rows: 每批行数；只有一批时直接在当前进程处理，省去启动进程池的开销
+        """
+        rows = fetch(0)
+        if len(rows) < batch_rows:
+            return commit(work(rows)) if rows else 0
+
+        written = 0
+        in_flight = deque()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while rows:
+                in_flight.append(pool.submit(work, rows))
+                # 限制在途批数，内存占用与并行度成正比
+                if len(in_flight) > self.workers:
+                    written += commit(in_flight.popleft().result())
+                rows = fetch(rows[-1][0])
+            while in_flight:
+                written += commit(in_flight.popleft().result())
+        return written
+
+    def _ingest_whole_file(
+        self,
+        task_id: str,
+        file_path: str,
+        total_bytes: int,
+        select_list: str,
+        where_sql: str
+    ) -> Dict[str, Any]:
+        """单块导入（DuckDB 直接读取整个文件）"""
+        started = time.monotonic()
+        source = f"read_csv_auto('{file_path.replace(chr(39), chr(39) * 2)}')"
+        try:
+            inserted, duplicates = self.db.insert_email_chunk(
+                task_id, source, select_list, where_sql, append=self.append
+            )
+            # 有过滤条件时需要单独统计读取行数
+            rows_read = inserted + duplicates
+            if where_sql:
+                rows_read = self.db.count_source_rows(source)
+        except Exception as e:
+            self.db.fail_ingest_progress(task_id, 0, str(e))
+            raise ChunkIngestError(0, e) from e
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.db.update_ingest_progress(
+            task_id,
+            bytes_read=total_bytes,
+            rows_read=rows_read,
+            rows_inserted=inserted,
+            chunks_done=1,
+            rows_per_second=rows_read / elapsed,
+            rows_duplicate=duplicates
+        )
+        self.db.finish_ingest_progress(task_id, chunks_total=1)
+        return self.db.get_ingest_progress(task_id)
@@ -0,0 +1,344 @@
+"""
+邮箱原始格式解析模块 - 支持 mbox、.eml 压缩包（zip）和 Maildir 目录
+
+- 流式切分原始邮件，不需要先转换为 CSV
+- 邮件解析在进程池中进行（email 标准库解析为纯 Python，受 GIL 限制）
+- 每批解析结果直接构建为 Arrow 表，交给导入引擎批量写入 emails 表
+"""
+import os
+import re
+import html
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email import policy
+from email.parser import BytesParser
+from email.utils import getaddresses, parseaddr, parsedate_to_datetime
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+import pyarrow as pa
+
+
+# 解析后的标准列（上传预览时作为"列名"返回，供字段映射使用）
+MAILBOX_COLUMNS = [
+    "sender", "receiver", "cc", "subject", "content",
+    "timestamp", "message_id", "in_reply_to"
+]
+
+MAILBOX_SCHEMA = pa.schema([
+    ("sender", pa.string()),
+    ("receiver", pa.string()),
+    ("cc", pa.string()),
+    ("subject", pa.string()),
+    ("content", pa.string()),
+    ("timestamp", pa.timestamp("us")),
+    ("message_id", pa.string()),
+    ("in_reply_to", pa.string()),
+])
+
+# 支持的文件类型（按扩展名）
+MAILBOX_FILE_TYPES = {"mbox", "mbx", "eml", "zip"}
+
+# 每批交给进程池解析的邮件原始字节数上限
+BATCH_BYTES = 8 * 1024 * 1024
+# 每批邮件数上限
+BATCH_MESSAGES = 2000
+
+_READ_BLOCK_SIZE = 8 * 1024 * 1024
+_MBOX_SEPARATOR = b"\nFrom "
+_MBOXRD_ESCAPE = re.compile(rb"^>(>*From )", re.MULTILINE)
+_HTML_TAG = re.compile(r"<[^>]+>")
+
+
+def detect_mailbox_format(file_path: str) -> Optional[str]:
+    """
+    识别邮箱格式
+
+    Returns:
+        "maildir" / "mbox" / "eml" / "zip"，不是邮箱格式时返回 None
+    """
+    if os.path.isdir(file_path):
+        return "maildir"
+
+    ext = os.path.splitext(file_path)[1].lower().lstrip(".")
+    if ext in ("mbox", "mbx"):
+        return "mbox"
+    if ext == "eml":
+        return "eml"
+    if ext == "zip":
+        return "zip"
+
+    # 无扩展名的 mbox 文件（如 Thunderbird 导出）以 "From " 开头
+    try:
+        with open(file_path, "rb") as f:
+            if f.read(5) == b"From ":
+                return "mbox"
+    except OSError:
+        pass
+    return None
+
+
+def _is_message_member(name: str) -> bool:
+    """判断 zip 成员是否为邮件（.eml 文件或 Maildir 的 cur/new 目录下的文件）"""
+    if name.endswith("/"):
+        return False
+    if name.lower().endswith(".eml"):
+        return True
+    parts = name.split("/")
+    return len(parts) >= 2 and parts[-2] in ("cur", "new")
+
+
+def _iter_mbox_messages(file_path: str) -> Iterator[Tuple[int, bytes]]:
+    """按 "From " 分隔行流式切分 mbox 文件，yield (字节数, 原始邮件)"""
+    with open(file_path, "rb") as f:
+        buffer = b""
+        while True:
+            block = f.read(_READ_BLOCK_SIZE)
+            if not block:
+                break
+            buffer += block
+            start = 0
+            while True:
+                pos = buffer.find(_MBOX_SEPARATOR, start)
+                if pos == -1:
+                    break
+                message = buffer[start:pos + 1]
+                if message.strip():
+                    yield len(message), message
+                start = pos + 1
+            buffer = buffer[start:]
+        if buffer.strip():
+            yield len(buffer), buffer
+
+
+def _iter_zip_messages(file_path: str) -> Iterator[Tuple[int, bytes]]:
+    """逐个读取 zip 中的邮件文件，yield (压缩后字节数, 原始邮件)"""
+    with zipfile.ZipFile(file_path) as zf:
+        for info in zf.infolist():
+            if _is_message_member(info.filename):
+                yield info.compress_size, zf.read(info)
+
+
+def _iter_maildir_files(dir_path: str) -> Iterator[str]:
+    """遍历 Maildir 目录树中 cur/new 下的邮件文件路径"""
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        if os.path.basename(root) not in ("cur", "new"):
+            continue
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+
+def _iter_maildir_messages(dir_path: str) -> Iterator[Tuple[int, bytes]]:
+    """遍历 Maildir 目录树（cur/new 子目录），yield (字节数, 原始邮件)"""
+    for path in _iter_maildir_files(dir_path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        yield len(raw), raw
+
+
+def iter_raw_messages(file_path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, bytes]]:
+    """
+    流式读取原始邮件
+
+    Yields:
+        (该邮件占用的源文件字节数, 原始邮件字节)
+    """
+    fmt = fmt or detect_mailbox_format(file_path)
+    if fmt == "mbox":
+        return _iter_mbox_messages(file_path)
+    if fmt == "zip":
+        return _iter_zip_messages(file_path)
+    if fmt == "maildir":
+        return _iter_maildir_messages(file_path)
+    if fmt == "eml":
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            return iter([(size, f.read())])
+    raise ValueError(f"不支持的邮箱格式: {file_path}")
+
+
+def iter_message_batches(file_path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, List[bytes]]]:
+    """
+    将原始邮件按字节数/数量分批
+
+    Yields:
+        (本批源文件字节数, 原始邮件列表)
+    """
+    batch: List[bytes] = []
+    batch_bytes = 0
+    source_bytes = 0
+    for size, raw in iter_raw_messages(file_path, fmt):
+        batch.append(raw)
+        batch_bytes += len(raw)
+        source_bytes += size
+        if batch_bytes >= BATCH_BYTES or len(batch) >= BATCH_MESSAGES:
+            yield source_bytes, batch
+            batch, batch_bytes, source_bytes = [], 0, 0
+    if batch:
+        yield source_bytes, batch
+
+
+def total_source_bytes(file_path: str, fmt: Optional[str] = None) -> int:
+    """计算进度统计使用的总字节数"""
+    fmt = fmt or detect_mailbox_format(file_path)
+    if fmt == "maildir":
+        return sum(os.path.getsize(path) for path in _iter_maildir_files(file_path))
+    if fmt == "zip":
+        with zipfile.ZipFile(file_path) as zf:
+            return sum(i.compress_size for i in zf.infolist() if _is_message_member(i.filename))
+    return os.path.getsize(file_path)
+
+
+def count_messages(file_path: str, fmt: Optional[str] = None) -> int:
+    """统计邮件数量（不解析邮件内容）"""
+    fmt = fmt or detect_mailbox_format(file_path)
+    if fmt == "maildir":
+        return sum(1 for _ in _iter_maildir_files(file_path))
+    if fmt == "zip":
+        with zipfile.ZipFile(file_path) as zf:
+            return sum(1 for i in zf.infolist() if _is_message_member(i.filename))
+    if fmt == "eml":
+        return 1
+
+    count = 0
+    tail = b""
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(_READ_BLOCK_SIZE)
+            if not block:
+                break
+            if not tail and block.startswith(b"From "):
+                count += 1
+            # 拼接上一块末尾的字节，跨块的分隔符也能被统计（且不会重复计数）
+            data = tail + block
+            count += data.count(_MBOX_SEPARATOR)
+            tail = data[-(len(_MBOX_SEPARATOR) - 1):]
+    return count
+
+
+def estimate_message_count(file_path: str, fmt: Optional[str] = None,
+                           head_bytes: int = _READ_BLOCK_SIZE) -> Tuple[int, bool]:
+    """
+    快速统计邮件数量（预览使用）：mbox 只读取开头 head_bytes 字节，按字节比例估算；
+    zip 只读取中央目录、Maildir 只列目录，直接返回精确值
+
+    Returns:
+        (邮件数量, 是否为估算值)
+    """
+    fmt = fmt or detect_mailbox_format(file_path)
+    if fmt != "mbox":
+        return count_messages(file_path, fmt), False
+
+    total = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(head_bytes)
+    count = head.count(_MBOX_SEPARATOR) + (1 if head.startswith(b"From ") else 0)
+    if len(head) >= total:
+        return count, False
+    return int(count * total / max(len(head), 1)), True
+
+
+def _join_addresses(values: List[str]) -> Optional[str]:
+    """将地址头解析为逗号分隔的邮箱地址"""
+    addresses = [addr for _, addr in getaddresses([str(v) for v in values]) if addr]
+    return ", ".join(addresses) if addresses else None
+
+
+def _extract_body(message) -> str:
+    """提取正文：优先 text/plain，其次去除标签的 text/html"""
+    try:
+        part = message.get_body(preferencelist=("plain", "html"))
+        if part is None:
+            return ""
+        text = part.get_content()
+        if part.get_content_subtype() == "html":
+            text = html.unescape(_HTML_TAG.sub(" ", text))
+        return text
+    except Exception:
+        payload = message.get_payload(decode=True)
+        if isinstance(payload, bytes):
+            return payload.decode("utf-8", errors="replace")
+        return ""
+
+
+def parse_message(raw: bytes) -> Dict[str, Any]:
+    """
+    解析单封原始邮件
+
+    Returns:
+        包含 MAILBOX_COLUMNS 所有字段的字典
+    """
+    # 去掉 mbox 分隔行，并还原 mboxrd 的 ">From " 转义
+    if raw.startswith(b"From "):
+        newline = raw.find(b"\n")
+        raw = raw[newline + 1:] if newline != -1 else b""
+        raw = _MBOXRD_ESCAPE.sub(rb"\1", raw)
+
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+
+    def header(name: str) -> Optional[str]:
+        try:
+            value = message.get(name)
+            return str(value).strip() if value is not None else None
+        except Exception:
+            return None
+
+    timestamp = None
+    date_header = header("Date")
+    if date_header:
+        try:
+            # 保留邮件头中的本地时间（与 CSV 导入的时间语义一致）
+            timestamp = parsedate_to_datetime(date_header).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            timestamp = None
+
+    sender = header("From")
+    return {
+        "sender": (parseaddr(sender)[1] or sender) if sender else None,
+        "receiver": _join_addresses(message.get_all("To", [])),
+        "cc": _join_addresses(message.get_all("Cc", [])),
+        "subject": header("Subject"),
+        "content": _extract_body(message),
+        "timestamp": timestamp,
+        "message_id": header("Message-ID"),
+        "in_reply_to": header("In-Reply-To"),
+    }
+
+
+def parse_message_batch(raws: List[bytes]) -> pa.Table:
+    """
+    解析一批原始邮件为 Arrow 表（在进程池中执行）
+    """
+    rows = []
+    for raw in raws:
+        try:
+            rows.append(parse_message(raw))
+        except Exception as e:
+            print(f"Error parsing message: {e}")
+    return pa.Table.from_pylist(rows, schema=MAILBOX_SCHEMA)
+
+
+def iter_parsed_batches(file_path: str, workers: int = None) -> Iterator[pa.Table]:
+    """
+    在进程池中按批解析整个邮箱，按原顺序 yield Arrow 表（在途批次数有上限）
+    """
+    workers = workers or min(4, os.cpu_count() or 1)
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for _, batch in iter_message_batches(file_path):
+            in_flight.append(pool.submit(parse_message_batch, batch))
+            if len(in_flight) > workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def get_sample_messages(file_path: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """解析前 N 封邮件用于预览"""
+    samples = []
+    for _, raw in iter_raw_messages(file_path):
+        samples.append(parse_message(raw))
+        if len(samples) >= limit:
+            break
+    return samples
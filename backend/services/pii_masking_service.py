@@ -6,20 +6,48 @@
 - 支持 Token 映射管理（双向映射）
 - 支持部分掩码还原（如 z***n@company.com）
 - 确保同一任务中相同值使用相同 Token
+- 导入时可在进程池中批量脱敏：各进程使用本地 Token，按批顺序重映射为任务级 Token 后持久化
+- 任务级实例在进程内共享：运行时脱敏与导入时预脱敏从同一实例分配 Token，新 Token 均写入 pii_tokens
 
 使用场景：
 - 邮件内容发送给 LLM 前进行脱敏
 - 防止敏感信息泄露到外部 AI 服务
 """
 import re
-from typing import Dict, Tuple, Optional
+import threading
+from typing import Dict, Tuple, Optional, List, Any, Callable
+
+
+# Token 格式：<EMAIL_001>、<PHONE_012>、<IP_003>（超过 999 时位数自动增加）
+_TOKEN_PATTERN = re.compile(r'<(EMAIL|PHONE|IP)_(\d+)>')
+
+
+def mask_email_batch(rows: List[Tuple[Any, ...]]) -> Tuple[List[Tuple[Any, ...]], Dict[str, str]]:
+    """
+    批量脱敏（模块级函数，供导入时的进程池调用）
+    
+    Args:
+        rows: [(email_id, 字段1, 字段2, ...), ...]
+    
+    Returns:
+        (脱敏后的行, 本批使用的本地 Token -> 原始值)；
+        本地 Token 只在本批内一致，需由 PIIMaskingService.remap_tokens 映射为任务级 Token
+    """
+    service = PIIMaskingService()
+    masked = [(row[0], *(service._mask(value) if value else value for value in row[1:])) for row in rows]
+    return masked, service.reverse_map
 
 
 class PIIMaskingService:
     """PII 脱敏服务"""
     
-    def __init__(self):
-        """初始化脱敏服务"""
+    def __init__(self, token_map: Optional[Dict[str, str]] = None):
+        """
+        初始化脱敏服务
+        
+        Args:
+            token_map: 已持久化的任务级映射（原始值 -> Token），新 Token 从已有编号之后继续分配
+        """
         # Token 映射表：原始值 -> Token
         self.token_map: Dict[str, str] = {}
         # 反向映射表：Token -> 原始值
@@ -31,6 +59,15 @@ class PIIMaskingService:
             "id_card": 0,
             "ip": 0
         }
+        # 任务级实例在进程内共享，分配 Token 时加锁
+        self.lock = threading.RLock()
+        for value, token in (token_map or {}).items():
+            self.token_map[value] = token
+            self.reverse_map[token] = value
+            match = _TOKEN_PATTERN.fullmatch(token)
+            if match:
+                kind = match.group(1).lower()
+                self.counters[kind] = max(self.counters[kind], int(match.group(2)))
     
     def mask_text(self, text: str) -> Tuple[str, Dict[str, str]]:
         """
@@ -49,6 +86,23 @@ class PIIMaskingService:
         if not text:
             return text, {}
         
+        return self._mask(text), self.token_map.copy()
+    
+    def mask_text_with_new_tokens(self, text: str) -> Tuple[str, Dict[str, str]]:
+        """
+        脱敏文本，并返回本次新分配的 Token（原始值 -> Token），供调用方写入 pii_tokens
+        """
+        with self.lock:
+            known = len(self.token_map)
+            masked = self._mask(text)
+            return masked, self.tokens_since(known)
+    
+    def tokens_since(self, known: int) -> Dict[str, str]:
+        """映射表按插入顺序保存，返回前 known 个之后（新分配）的映射"""
+        return dict(list(self.token_map.items())[known:])
+    
+    def _mask(self, text: str) -> str:
+        """脱敏文本，只返回脱敏结果（批量调用时不复制映射表）"""
         masked_text = text
         
         # 1. 脱敏 Email 地址
@@ -60,7 +114,35 @@ class PIIMaskingService:
         # 3. 脱敏 IP 地址（可选）
         masked_text = self._mask_ips(masked_text)
         
-        return masked_text, self.token_map.copy()
+        return masked_text
+    
+    def _token_for(self, kind: str, value: str) -> str:
+        """获取值对应的 Token，首次出现时按类型分配新编号"""
+        if value not in self.token_map:
+            self.counters[kind] += 1
+            token = f"<{kind.upper()}_{self.counters[kind]:03d}>"
+            self.token_map[value] = token
+            self.reverse_map[token] = value
+        return self.token_map[value]
+    
+    def remap_tokens(self, text: Optional[str], local_reverse_map: Dict[str, str]) -> Optional[str]:
+        """
+        将其他实例（如导入进程池中的 mask_email_batch）产生的本地 Token 替换为本实例的 Token
+        
+        Args:
+            text: 含本地 Token 的脱敏文本
+            local_reverse_map: 本地 Token -> 原始值
+        """
+        if not text or not local_reverse_map:
+            return text
+        
+        def replacer(match):
+            value = local_reverse_map.get(match.group(0))
+            if value is None:
+                return match.group(0)
+            return self._token_for(match.group(1).lower(), value)
+        
+        return _TOKEN_PATTERN.sub(replacer, text)
     
     def _mask_emails(self, text: str) -> str:
         """
@@ -76,13 +158,7 @@ class PIIMaskingService:
         pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
         
         def replacer(match):
-            email = match.group(0)
-            if email not in self.token_map:
-                self.counters["email"] += 1
-                token = f"<EMAIL_{self.counters['email']:03d}>"
-                self.token_map[email] = token
-                self.reverse_map[token] = email
-            return self.token_map[email]
+            return self._token_for("email", match.group(0))
         
         return re.sub(pattern, replacer, text)
     
@@ -107,13 +183,7 @@ class PIIMaskingService:
             # 规范化：移除所有空格和短横线，只保留数字和可能的+号
             normalized = re.sub(r'[\s\-]', '', phone)
             
-            if normalized not in self.token_map:
-                self.counters["phone"] += 1
-                token = f"<PHONE_{self.counters['phone']:03d}>"
-                self.token_map[normalized] = token
-                self.reverse_map[token] = normalized
-            
-            return self.token_map[normalized]
+            return self._token_for("phone", normalized)
         
         # 处理中国手机号
         text = re.sub(china_pattern, replacer, text)
@@ -140,12 +210,7 @@ class PIIMaskingService:
             # 简单验证是否为合法 IP（每段0-255）
             parts = ip.split('.')
             if all(0 <= int(part) <= 255 for part in parts):
-                if ip not in self.token_map:
-                    self.counters["ip"] += 1
-                    token = f"<IP_{self.counters['ip']:03d}>"
-                    self.token_map[ip] = token
-                    self.reverse_map[token] = ip
-                return self.token_map[ip]
+                return self._token_for("ip", ip)
             return ip  # 不是合法 IP，保持原样
         
         return re.sub(pattern, replacer, text)
@@ -262,3 +327,26 @@ def get_global_masking_service() -> PIIMaskingService:
     if _global_masking_service is None:
         _global_masking_service = PIIMaskingService()
     return _global_masking_service
+
+
+# 任务级脱敏实例（进程内共享）：task_id -> PIIMaskingService
+_task_masking_services: Dict[str, PIIMaskingService] = {}
+_task_masking_lock = threading.Lock()
+
+
+def get_task_masking_service(task_id: str, load_tokens: Callable[[], Dict[str, str]]) -> PIIMaskingService:
+    """
+    获取任务级脱敏实例（首次使用时以 load_tokens() 返回的已持久化映射初始化）
+    
+    批量分析的运行时脱敏和导入时的预脱敏共用该实例分配 Token，同一编号不会对应不同的值
+    """
+    with _task_masking_lock:
+        if task_id not in _task_masking_services:
+            _task_masking_services[task_id] = PIIMaskingService(load_tokens())
+        return _task_masking_services[task_id]
+
+
+def forget_task_masking_service(task_id: str):
+    """丢弃任务级脱敏实例（删除任务时调用）"""
+    with _task_masking_lock:
+        _task_masking_services.pop(task_id, None)
@@ -1,115 +1,357 @@
 """
 CSV 预览服务模块 - 提供文件列名预览和样本数据获取功能
+同时支持 Parquet / NDJSON，以及 mbox / .eml 压缩包 / Maildir 等邮箱格式（解析为标准列）
+gzip / zstd 压缩文件预览时只解压开头部分
+
+预览元数据（方言、列类型、样本数据、行数）按 (路径, 大小, 修改时间, 内容哈希) 缓存，
+每个文件只嗅探一次；精确行数在上传后由后台任务统计，统计完成前返回估算值。
+上传后后台生成列式暂存副本，过滤行数和样本预览优先读取暂存副本。
 """
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
 import duckdb
-from typing import List, Dict, Any, Optional
+import pyarrow.parquet as pq
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 
+from services.mailbox_service import (
+    MAILBOX_COLUMNS,
+    detect_mailbox_format,
+    get_sample_messages,
+    count_messages,
+    estimate_message_count,
+    iter_parsed_batches
+)
+from services.ingest_service import (
+    NDJSON_FILE_TYPES,
+    PARQUET_FILE_TYPES,
+    file_source_sql,
+    split_compression,
+    open_source_stream,
+    iter_record_chunks,
+    sniff_csv_dialect,
+    supports_chunked_read
+)
+from services.staging_service import get_staged_path, stage_file
+
+
+# 估算行数时最多读取（解压）的字节数
+PREVIEW_HEAD_BYTES = 4 * 1024 * 1024
+# 缓存的样本行数（请求更多行时直接读取文件）
+CACHED_SAMPLE_ROWS = 20
+# 内容哈希读取文件头尾各多少字节
+_FINGERPRINT_BYTES = 1024 * 1024
+# 最多缓存的文件数
+_CACHE_SIZE = 64
+
+
+def _to_json_value(value: Any) -> Any:
+    """将样本数据中的特殊类型转换为可序列化的值"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        return str(value)
+    return value
+
+
+def _file_fingerprint(file_path: str) -> Optional[Tuple[str, int, int, str]]:
+    """
+    缓存键：(绝对路径, 大小, 修改时间, 内容哈希)
+
+    内容哈希只读取文件头尾各 1MB，避免为 GB 级文件计算全文哈希；目录（Maildir）不缓存。
+    """
+    if os.path.isdir(file_path):
+        return None
+    stat = os.stat(file_path)
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        digest.update(f.read(_FINGERPRINT_BYTES))
+        if stat.st_size > _FINGERPRINT_BYTES:
+            f.seek(max(stat.st_size - _FINGERPRINT_BYTES, _FINGERPRINT_BYTES))
+            digest.update(f.read())
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+
+
+def _estimate_row_count(file_path: str, dialect: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    只读取（解压）文件开头部分统计记录数，按已读取的源文件字节比例估算总行数
+
+    Args:
+        dialect: CSV 方言，NDJSON 传 None
+
+    Returns:
+        {"row_count": 行数, "row_count_estimated": 是否为估算值}；方言无法按记录切分时返回 None
+    """
+    if dialect is None:
+        quote, has_header = None, False
+    else:
+        if not supports_chunked_read(dialect):
+            return None
+        quote, has_header = dialect["quote"], dialect["has_header"]
+
+    with open_source_stream(file_path) as (stream, raw):
+        head = stream.read(PREVIEW_HEAD_BYTES)
+        exhausted = len(head) < PREVIEW_HEAD_BYTES or not stream.read(1)
+        consumed = raw.tell()
+
+    # 按记录切分（chunk_size=1 即每条记录一块），空行不计
+    records = [r for _, r in iter_record_chunks(io.BytesIO(head), quote, 1) if r.strip()]
+    if not exhausted and records:
+        records.pop()  # 最后一条可能被截断
+    count = max(len(records) - (1 if has_header else 0), 0)
+    if exhausted:
+        return {"row_count": count, "row_count_estimated": False}
+
+    total = os.path.getsize(file_path)
+    return {"row_count": int(count * total / max(consumed, 1)), "row_count_estimated": True}
+
 
 class PreviewService:
     """CSV 文件预览服务"""
     
-    @staticmethod
-    def get_csv_columns(file_path: str) -> List[str]:
+    def __init__(self):
+        # 预览元数据缓存（LRU），键见 _file_fingerprint
+        self._cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_metadata(self, file_path: str) -> Dict[str, Any]:
         """
-        获取 CSV 文件的所有列名
+        获取文件的预览元数据（命中缓存时直接返回）
         
         Args:
-            file_path: CSV 文件的绝对路径
-            
+            file_path: 文件路径
+        
         Returns:
-            列名列表
+            包含 columns / column_types / dialect / sample_rows / file_info 的字典
         """
+        key = _file_fingerprint(file_path)
+        if key is not None:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    self._cache.move_to_end(key)
+                    return entry
+        
+        entry = self._build_metadata(file_path)
+        if key is not None:
+            with self._lock:
+                # 并发构建时保留先写入的条目（后台行数统计可能已经更新了它）
+                entry = self._cache.setdefault(key, entry)
+                self._cache.move_to_end(key)
+                while len(self._cache) > _CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return entry
+    
+    @staticmethod
+    def _build_metadata(file_path: str) -> Dict[str, Any]:
+        """嗅探一次文件：列名、列类型、方言、样本数据和行数（或估算行数）"""
+        path = Path(file_path)
+        file_info = {
+            "filename": path.name,
+            "size_bytes": path.stat().st_size,
+            "extension": path.suffix.lower()
+        }
+        
+        mailbox_format = detect_mailbox_format(file_path)
+        if mailbox_format:
+            # mbox 只读取开头估算邮件数，精确数量由上传后的后台任务统计
+            row_count, estimated = estimate_message_count(file_path, mailbox_format, PREVIEW_HEAD_BYTES)
+            file_info.update({
+                "format": mailbox_format,
+                "row_count": row_count,
+                "row_count_estimated": estimated
+            })
+            samples = [
+                {col: _to_json_value(value) for col, value in message.items()}
+                for message in get_sample_messages(file_path, CACHED_SAMPLE_ROWS)
+            ]
+            return {
+                "columns": list(MAILBOX_COLUMNS),
+                "column_types": None,
+                "dialect": None,
+                "sample_rows": samples,
+                "file_info": file_info
+            }
+        
+        file_type, compression = split_compression(file_path)
+        if compression:
+            file_info["compression"] = compression
+        
+        dialect = None
+        if file_type not in PARQUET_FILE_TYPES and file_type not in NDJSON_FILE_TYPES:
+            dialect = sniff_csv_dialect(file_path)
+        
         conn = duckdb.connect(":memory:")
         try:
-            # 使用 DuckDB 的 read_csv_auto 读取 schema
+            # 列名、列类型和样本数据来自同一次读取
             result = conn.execute(
-                f"SELECT * FROM read_csv_auto('{file_path}') LIMIT 0"
+                f"SELECT * FROM {file_source_sql(file_path)} LIMIT {CACHED_SAMPLE_ROWS}"
             )
             columns = [desc[0] for desc in result.description]
-            return columns
+            column_types = {desc[0]: str(desc[1]) for desc in result.description}
+            # 处理特殊类型的序列化
+            samples = [
+                {col: _to_json_value(row[i]) for i, col in enumerate(columns)}
+                for row in result.fetchall()
+            ]
         finally:
             conn.close()
+        
+        if file_type in PARQUET_FILE_TYPES:
+            # Parquet 元数据中有精确行数
+            file_info.update({
+                "row_count": pq.ParquetFile(file_path).metadata.num_rows,
+                "row_count_estimated": False
+            })
+        else:
+            estimate = _estimate_row_count(file_path, dialect)
+            file_info.update(estimate or {"row_count": None, "row_count_estimated": True})
+        
+        return {
+            "columns": columns,
+            "column_types": column_types,
+            "dialect": dialect,
+            "sample_rows": samples,
+            "file_info": file_info
+        }
     
-    @staticmethod
-    def get_sample_rows(file_path: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def fill_row_count(self, file_path: str) -> int:
+        """
+        统计精确行数并写入缓存（上传后在后台执行）
+        
+        Args:
+            file_path: 文件路径
+        
+        Returns:
+            精确行数
+        """
+        entry = self.get_metadata(file_path)
+        file_info = entry["file_info"]
+        if file_info.get("row_count") is not None and not file_info.get("row_count_estimated"):
+            return file_info["row_count"]
+        
+        staged_path = get_staged_path(file_path)
+        if staged_path:
+            row_count = pq.ParquetFile(staged_path).metadata.num_rows
+        elif detect_mailbox_format(file_path):
+            row_count = count_messages(file_path)
+        else:
+            conn = duckdb.connect(":memory:")
+            try:
+                # 获取总行数（不含表头）
+                row_count = conn.execute(
+                    f"SELECT COUNT(*) FROM {file_source_sql(file_path)}"
+                ).fetchone()[0]
+            finally:
+                conn.close()
+        
+        self._set_row_count(entry, row_count)
+        return row_count
+    
+    def _set_row_count(self, entry: Dict[str, Any], row_count: int):
+        """将精确行数写入缓存条目"""
+        with self._lock:
+            entry["file_info"] = {**entry["file_info"], "row_count": row_count, "row_count_estimated": False}
+    
+    def prepare_upload(self, file_path: str):
+        """
+        上传后的后台准备：生成列式暂存副本（同时得到精确行数）；
+        不需要暂存的格式只统计精确行数
+        """
+        try:
+            row_count = stage_file(file_path)
+        except Exception as e:
+            # 暂存失败时预览和导入回退为直接读取源文件
+            print(f"Error staging {file_path}: {e}")
+            row_count = None
+        if not os.path.exists(file_path):
+            # 源文件已被移走（已确认导入）或清理，不再需要预览信息
+            return
+        if row_count is None:
+            self.fill_row_count(file_path)
+        else:
+            self._set_row_count(self.get_metadata(file_path), row_count)
+    
+    def get_csv_columns(self, file_path: str) -> List[str]:
+        """
+        获取 CSV 文件的所有列名
+        
+        Args:
+            file_path: CSV 文件的绝对路径
+        
+        Returns:
+            列名列表
+        """
+        return list(self.get_metadata(file_path)["columns"])
+    
+    def get_sample_rows(self, file_path: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
         获取 CSV 文件的前 N 行数据作为预览
         
         Args:
             file_path: CSV 文件的绝对路径
             limit: 返回的行数，默认 5 行
-            
+        
         Returns:
             样本数据列表，每行为一个字典
         """
+        if limit <= CACHED_SAMPLE_ROWS:
+            return self.get_metadata(file_path)["sample_rows"][:limit]
+        
+        staged_path = get_staged_path(file_path)
+        if not staged_path and detect_mailbox_format(file_path):
+            return [
+                {col: _to_json_value(value) for col, value in message.items()}
+                for message in get_sample_messages(file_path, limit)
+            ]
+        
+        source = file_source_sql(staged_path) if staged_path else file_source_sql(file_path)
         conn = duckdb.connect(":memory:")
         try:
             result = conn.execute(
-                f"SELECT * FROM read_csv_auto('{file_path}') LIMIT {limit}"
+                f"SELECT * FROM {source} LIMIT {limit}"
             )
             columns = [desc[0] for desc in result.description]
             rows = result.fetchall()
             
             sample_data = []
             for row in rows:
-                row_dict = {}
-                for i, col in enumerate(columns):
-                    value = row[i]
-                    # 处理特殊类型的序列化
-                    if hasattr(value, 'isoformat'):
-                        value = value.isoformat()
-                    elif value is not None and not isinstance(value, (str, int, float, bool)):
-                        value = str(value)
-                    row_dict[col] = value
-                sample_data.append(row_dict)
+                # 处理特殊类型的序列化
+                sample_data.append({col: _to_json_value(row[i]) for i, col in enumerate(columns)})
             
             return sample_data
         finally:
             conn.close()
     
-    @staticmethod
-    def get_file_info(file_path: str) -> Dict[str, Any]:
+    def get_file_info(self, file_path: str) -> Dict[str, Any]:
         """
         获取文件的基本信息
         
+        精确行数尚未统计完成时，row_count 为估算值且 row_count_estimated 为 True
+        
         Args:
             file_path: 文件路径
-            
+        
         Returns:
             包含文件名、大小等信息的字典
         """
-        path = Path(file_path)
-        conn = duckdb.connect(":memory:")
-        try:
-            # 获取总行数（不含表头）
-            result = conn.execute(
-                f"SELECT COUNT(*) FROM read_csv_auto('{file_path}')"
-            )
-            row_count = result.fetchone()[0]
-            
-            return {
-                "filename": path.name,
-                "size_bytes": path.stat().st_size,
-                "row_count": row_count,
-                "extension": path.suffix.lower()
-            }
-        finally:
-            conn.close()
+        return dict(self.get_metadata(file_path)["file_info"])
     
-    @staticmethod
-    def validate_file(file_path: str) -> Dict[str, Any]:
+    def validate_file(self, file_path: str) -> Dict[str, Any]:
         """
         验证文件是否可以被正确解析
         
         Args:
             file_path: 文件路径
-            
+        
         Returns:
             验证结果，包含 is_valid 和可能的 error_message
         """
         try:
-            columns = PreviewService.get_csv_columns(file_path)
+            columns = self.get_csv_columns(file_path)
             if not columns:
                 return {
                     "is_valid": False,
@@ -125,49 +367,129 @@ class PreviewService:
                 "is_valid": False,
                 "error_message": f"文件解析失败: {str(e)}"
             }
-
-
-    @staticmethod
-    def get_filtered_row_count(file_path: str, filter_config: Dict[str, Any]) -> int:
+    
+    
+    def _scan_counts(self, file_path: str, aggregates: List[str]) -> List[int]:
         """
-        获取过滤后的数据行数
+        一次扫描计算多个计数聚合（暂存副本 > 邮箱逐批解析 > 源文件）
         
         Args:
             file_path: 文件路径
-            filter_config: 过滤配置
-            
+            aggregates: 聚合表达式列表，如 COUNT(*) FILTER (WHERE ...)
+        
         Returns:
-            满足条件（未被过滤）的行数
+            与 aggregates 一一对应的计数
         """
-        from services.db_service import DBService
-        
+        select_sql = ", ".join(aggregates)
+        staged_path = get_staged_path(file_path)
         conn = duckdb.connect(":memory:")
         try:
-            # 构建过滤 WHERE 子句
-            where_sql = DBService.build_filter_where_clause(filter_config)
+            if staged_path:
+                # 暂存副本为列式文件，只读取过滤用到的列
+                return list(conn.execute(f"SELECT {select_sql} FROM {file_source_sql(staged_path)}").fetchone())
             
-            # 计算行数
-            # 注意：build_filter_where_clause 返回的 logic 是过滤排除的逻辑
-            # 但我们需要的是 *剩余* 的行数，也就是 *不* 满足过滤条件的行数吗？
-            # 仔细看 build_filter_where_clause 的注释：
-            # "构建过滤条件的 WHERE 子句... 排除符合条件的记录"
-            # 
-            # 让我们复查一下 db_service.py:
-            # where_parts.append(f'("{field}" != \'{escaped_value}\')')  --> 这是保留不等于的
-            # 
-            # 再次检查 db_service 逻辑：
-            # if match_type == "exact": where_parts.append(f'("{field}" != \'{escaped_value}\' OR "{field}" IS NULL)')
-            # 这里的语义是：保留那些（字段 != 值 或者 字段为空）的记录。即排除（字段 == 值）的记录。
-            # 
-            # 所以 build_filter_where_clause 返回的 SQL 是用来 SELECT 那些 **应该被保留** 的记录的。
-            # 直接使用这个 WHERE 子句即可统计剩余行数。
+            if detect_mailbox_format(file_path):
+                # 邮箱格式：逐批解析后在内存中计数
+                totals = [0] * len(aggregates)
+                for table in iter_parsed_batches(file_path):
+                    conn.register("_mailbox_batch", table)
+                    row = conn.execute(f"SELECT {select_sql} FROM _mailbox_batch").fetchone()
+                    conn.unregister("_mailbox_batch")
+                    totals = [total + value for total, value in zip(totals, row)]
+                return totals
             
-            result = conn.execute(
-                f"SELECT COUNT(*) FROM read_csv_auto('{file_path}') {where_sql}"
-            )
-            return result.fetchone()[0]
+            return list(conn.execute(f"SELECT {select_sql} FROM {file_source_sql(file_path)}").fetchone())
         finally:
             conn.close()
+    
+    def get_filtered_row_count(self, file_path: str, filter_config: Dict[str, Any]) -> int:
+        """
+        获取过滤后的数据行数
+        
+        Args:
+            file_path: 文件路径
+            filter_config: 过滤配置
+        
+        Returns:
+            满足条件（未被过滤）的行数
+        """
+        from services.db_service import DBService
+        
+        # build_filter_where_clause 返回的是 **应该被保留** 的记录的条件
+        where_sql = DBService.build_filter_where_clause(filter_config)
+        if not where_sql and not detect_mailbox_format(file_path):
+            # 没有过滤条件时即总行数（已缓存时无需扫描文件）
+            return self.fill_row_count(file_path)
+        
+        keep_sql = where_sql[len("WHERE "):] if where_sql else "TRUE"
+        return self._scan_counts(file_path, [f"COUNT(*) FILTER (WHERE {keep_sql})"])[0]
+    
+    def get_filter_impact(self, file_path: str, filter_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        一次扫描统计每条过滤规则的影响：各规则命中行数、仅被该规则命中的行数、
+        规则两两重叠的行数，以及最终保留的行数（全部为条件聚合）
+        
+        Args:
+            file_path: 文件路径
+            filter_config: 过滤配置
+        
+        Returns:
+            {"total", "count", "excluded", "conditions": [...], "overlaps": [...]}；
+            conditions / overlaps 中的 index 为规则在 filter_config["conditions"] 中的下标，
+            无效规则（字段或值为空）不统计
+        """
+        from services.db_service import DBService
+        
+        rules = []
+        for index, cond in enumerate(filter_config.get("conditions", []) if filter_config else []):
+            keep = DBService.build_filter_condition(cond)
+            if keep:
+                rules.append((index, cond, f"(NOT {keep})"))
+        
+        where_sql = DBService.build_filter_where_clause(filter_config)
+        keep_sql = where_sql[len("WHERE "):] if where_sql else "TRUE"
+        
+        aggregates = ["COUNT(*)", f"COUNT(*) FILTER (WHERE {keep_sql})"]
+        for i, (_, _, matched) in enumerate(rules):
+            aggregates.append(f"COUNT(*) FILTER (WHERE {matched})")
+            others = [other for j, (_, _, other) in enumerate(rules) if j != i]
+            if others:
+                aggregates.append(f"COUNT(*) FILTER (WHERE {matched} AND NOT ({' OR '.join(others)}))")
+            else:
+                aggregates.append(f"COUNT(*) FILTER (WHERE {matched})")
+        pairs = [(i, j) for i in range(len(rules)) for j in range(i + 1, len(rules))]
+        for i, j in pairs:
+            aggregates.append(f"COUNT(*) FILTER (WHERE {rules[i][2]} AND {rules[j][2]})")
+        
+        counts = self._scan_counts(file_path, aggregates)
+        total, kept = counts[0], counts[1]
+        rule_counts = counts[2:2 + 2 * len(rules)]
+        overlap_counts = counts[2 + 2 * len(rules):]
+        
+        # 扫描得到的总行数即精确行数
+        if os.path.exists(file_path):
+            self._set_row_count(self.get_metadata(file_path), total)
+        
+        return {
+            "total": total,
+            "count": kept,
+            "excluded": total - kept,
+            "conditions": [
+                {
+                    "index": index,
+                    "field": cond.get("field"),
+                    "match_type": cond.get("match_type", "exact"),
+                    "value": cond.get("value"),
+                    "matched": rule_counts[2 * i],
+                    "only_matched": rule_counts[2 * i + 1]
+                }
+                for i, (index, cond, _) in enumerate(rules)
+            ],
+            "overlaps": [
+                {"a": rules[i][0], "b": rules[j][0], "count": count}
+                for (i, j), count in zip(pairs, overlap_counts)
+            ]
+        }
 
 
 # 全局预览服务实例
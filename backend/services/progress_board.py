@@ -0,0 +1,197 @@
+"""
+批量分析进度看板 - 运行中任务的计数保存在内存中，定时合并写入数据库
+
+批量分析每完成一项就 UPDATE 一次 batch_analysis_jobs，50 万封邮件的任务会产生 50 万次更新；
+前端每 2 秒轮询 /status，每次又读回这一行。ProgressBoard：
+- 计数（处理 / 成功 / 失败 / 跳过）、正在处理的项数和最近 RATE_WINDOW_SECONDS 秒的处理速率保存在内存中
+- /status 对运行中的任务直接读取看板，不访问数据库
+- 每 PROGRESS_FLUSH_SECONDS 秒把有变化的计数写入数据库一次；任务结束（完成、失败、取消）时立即写入最终计数和状态
+
+看板只在事件循环中读写（批量分析任务与 API 路由在同一个事件循环），无需加锁。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from services.db_service import DBService, get_db_service
+
+
+# 定时写入数据库的间隔（秒）
+DEFAULT_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "2"))
+# 处理速率的统计窗口（秒）
+RATE_WINDOW_SECONDS = 30.0
+
+
+class JobProgress:
+    """单个运行中任务的进度"""
+
+    def __init__(self, job: Dict[str, Any]):
+        # 任务的其余字段（配置、时间戳）在开始时读取一次
+        self.job = job
+        self.status = job["status"]
+        self.total = job["total_count"]
+        self.processed = job["processed_count"]
+        self.success = job["success_count"]
+        self.failed = job["failed_count"]
+        self.skipped = job["skipped_count"]
+        self.in_flight = 0
+        self.limiter = None
+        self.dirty = False
+        # (monotonic 时间, 已处理数) 采样，用于计算窗口内的处理速率
+        self._samples: Deque[Tuple[float, int]] = deque([(time.monotonic(), self.processed)])
+
+    def sample(self):
+        """记录一次速率采样，丢弃窗口外的旧采样（至少保留一个作为起点）"""
+        now = time.monotonic()
+        self._samples.append((now, self.processed))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= RATE_WINDOW_SECONDS:
+            self._samples.popleft()
+
+    @property
+    def items_per_second(self) -> float:
+        """最近 RATE_WINDOW_SECONDS 秒的平均处理速率"""
+        started_at, processed_then = self._samples[0]
+        elapsed = time.monotonic() - started_at
+        if elapsed <= 0:
+            return 0.0
+        return round((self.processed - processed_then) / elapsed, 2)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """与 DBService.get_batch_job 格式相同的任务字典，附带 in_flight / items_per_second / adaptive_concurrency"""
+        return {
+            **self.job,
+            "status": self.status,
+            "total_count": self.total,
+            "processed_count": self.processed,
+            "success_count": self.success,
+            "failed_count": self.failed,
+            "skipped_count": self.skipped,
+            "in_flight": self.in_flight,
+            "items_per_second": self.items_per_second,
+            "adaptive_concurrency": self.limiter.snapshot() if self.limiter else None,
+        }
+
+
+class ProgressBoard:
+    """运行中批量分析任务的进度看板"""
+
+    def __init__(self, db: DBService, flush_seconds: Optional[float] = None):
+        self.db = db
+        self.flush_seconds = flush_seconds or DEFAULT_FLUSH_SECONDS
+        self._jobs: Dict[str, JobProgress] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # 定时写入与结束写入串行执行，避免旧计数覆盖最终计数
+        self._write_lock = asyncio.Lock()
+
+    def get(self, job_id: str) -> Optional[JobProgress]:
+        """运行中任务的进度；任务不在看板上时返回 None"""
+        return self._jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """运行中任务的状态字典（/status 使用）"""
+        progress = self._jobs.get(job_id)
+        return progress.snapshot() if progress else None
+
+    async def start_job(
+        self, job_id: str, total: int, skipped: int, done: int = 0, limiter: Optional[Any] = None
+    ) -> JobProgress:
+        """
+        待处理项确定后：写入总数，加入看板；done 为开始前已有结果的项数，计为已处理（成功）；
+        limiter 为任务的自适应并发控制，其当前上限和变化记录随状态返回
+        """
+        await asyncio.to_thread(self.db.update_batch_job_total_count, job_id, total)
+        job = await asyncio.to_thread(self.db.get_batch_job, job_id)
+        progress = JobProgress({
+            **job, "skipped_count": skipped, "processed_count": done, "success_count": done
+        })
+        progress.limiter = limiter
+        progress.dirty = True
+        self._jobs[job_id] = progress
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        return progress
+
+    def item_started(self, job_id: str):
+        """一项开始处理"""
+        self._jobs[job_id].in_flight += 1
+
+    def item_finished(self, job_id: str, result: str):
+        """一项处理结束（result 为 SUCCESS / FAILED）"""
+        progress = self._jobs[job_id]
+        progress.in_flight -= 1
+        progress.processed += 1
+        if result == "SUCCESS":
+            progress.success += 1
+        else:
+            progress.failed += 1
+        progress.dirty = True
+
+    def set_status(self, job_id: str, status: str):
+        """在任务结束前更新看板上的状态（取消请求已写入数据库，任务协程尚未退出）"""
+        progress = self._jobs.get(job_id)
+        if progress is not None:
+            progress.status = status
+
+    async def finish_job(self, job_id: str, status: str, error_message: Optional[str] = None):
+        """任务结束：立即写入最终计数和状态，移出看板"""
+        progress = self._jobs.pop(job_id, None)
+        async with self._write_lock:
+            await asyncio.to_thread(self._finish_job_sync, job_id, progress, status, error_message)
+
+    def _finish_job_sync(
+        self, job_id: str, progress: Optional[JobProgress], status: str, error_message: Optional[str]
+    ):
+        if progress is not None:
+            self._write_progress(job_id, progress)
+        self.db.update_batch_job_status(job_id, status, error_message)
+
+    def _write_progress(self, job_id: str, progress: JobProgress):
+        self.db.update_batch_job_progress(
+            job_id, progress.processed, progress.success, progress.failed, progress.skipped
+        )
+
+    async def flush(self) -> int:
+        """将有变化的计数写入数据库，返回写入的任务数；写入失败时下一次重试"""
+        async with self._write_lock:
+            changed = []
+            for job_id, progress in self._jobs.items():
+                progress.sample()
+                if progress.dirty:
+                    progress.dirty = False
+                    changed.append((job_id, progress))
+            if not changed:
+                return 0
+            try:
+                await asyncio.to_thread(self._write_all, changed)
+            except BaseException:
+                for _, progress in changed:
+                    progress.dirty = True
+                raise
+            return len(changed)
+
+    def _write_all(self, changed):
+        for job_id, progress in changed:
+            self._write_progress(job_id, progress)
+
+    async def _run(self):
+        """定时写入协程：看板上没有任务时退出"""
+        while self._jobs:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[ProgressBoard] 写入进度失败: {e}")
+
+
+# 全局看板实例
+_progress_board: Optional[ProgressBoard] = None
+
+
+def get_progress_board() -> ProgressBoard:
+    """获取进度看板实例（单例模式）"""
+    global _progress_board
+    if _progress_board is None:
+        _progress_board = ProgressBoard(get_db_service())
+    return _progress_board
@@ -0,0 +1,132 @@
+"""
+分析结果写入缓冲 - 批量分析的结果先进入内存缓冲，由单个写入协程批量写入数据库
+
+批量分析并发 20 时，每封邮件完成后立即 save_analysis_result 会产生大量只有一行的自动提交事务，
+争用同一个写入通道。AnalysisResultSink：
+- 工作协程 put() 结果后立即返回，不等待数据库
+- 写入协程每累计 RESULT_SINK_BATCH_ROWS 行或每 RESULT_SINK_FLUSH_MS 毫秒刷新一次，
+  一次刷新为一条 INSERT ... ON CONFLICT DO UPDATE（DBService.upsert_analysis_results），在线程池中执行
+- async with 退出时（任务完成、失败或被取消）写入全部剩余结果
+
+用法：
+    async with AnalysisResultSink(db) as sink:
+        sink.put(result_id, task_id, email_id, "batch_summary", model, result)
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from services.db_service import DBService, dump_result_json
+
+
+# 累计多少行刷新一次
+DEFAULT_BATCH_ROWS = int(os.getenv("RESULT_SINK_BATCH_ROWS", "200"))
+# 最长多久刷新一次（毫秒）
+DEFAULT_FLUSH_MS = int(os.getenv("RESULT_SINK_FLUSH_MS", "500"))
+
+
+class AnalysisResultSink:
+    """分析结果写入缓冲（在事件循环中使用）"""
+
+    def __init__(
+        self,
+        db: DBService,
+        batch_rows: Optional[int] = None,
+        flush_ms: Optional[int] = None
+    ):
+        self.db = db
+        self.batch_rows = batch_rows or DEFAULT_BATCH_ROWS
+        self.flush_interval = (flush_ms or DEFAULT_FLUSH_MS) / 1000
+        # 唯一键 (email_id, analysis_type, model_provider) -> 待写入的行；同一键重复写入时保留最新结果
+        self._pending: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+        # 关闭后才完成的结果（任务取消时仍在执行的 LLM 调用）各自在后台写入
+        self._late_flushes: Set[asyncio.Task] = set()
+        self.rows_written = 0
+        self.flushes = 0
+
+    @property
+    def pending(self) -> int:
+        """尚未写入数据库的结果数"""
+        return len(self._pending)
+
+    def put(
+        self,
+        result_id: str,
+        task_id: str,
+        email_id: int,
+        analysis_type: str,
+        model_provider: str,
+        result: Any
+    ):
+        """加入一条分析结果（立即返回，结果在下一次刷新时写入）"""
+        self._pending[(email_id, analysis_type, model_provider)] = (
+            result_id, task_id, email_id, analysis_type, model_provider,
+            dump_result_json(result), datetime.now()
+        )
+        if self._closing and self._writer is None:
+            flush = asyncio.create_task(self.flush())
+            self._late_flushes.add(flush)
+            flush.add_done_callback(self._late_flushes.discard)
+        elif len(self._pending) >= self.batch_rows:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """将缓冲中的结果写入数据库，返回写入的行数；写入失败时结果留在缓冲中"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            rows, self._pending = self._pending, {}
+            try:
+                written = await asyncio.to_thread(self.db.upsert_analysis_results, list(rows.values()))
+            except BaseException:
+                # 刷新期间又写入的同键结果更新，保留新的
+                for key, row in rows.items():
+                    self._pending.setdefault(key, row)
+                raise
+            self.rows_written += written
+            self.flushes += 1
+            return written
+
+    async def _run(self):
+        """写入协程：攒够一批或到达刷新间隔时写入"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # 保留在缓冲中，下一次刷新重试；关闭时的最终刷新会抛出错误
+                print(f"[ResultSink] 写入分析结果失败，稍后重试: {e}")
+
+    def start(self):
+        """启动写入协程"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    async def close(self):
+        """
+        等待写入协程完成当前刷新后退出，再写入剩余结果（失败时抛出）
+        
+        所在任务被取消后仍可调用；等待期间再次被取消时，写入会在后台完成
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+            self._writer = None
+        await asyncio.shield(self.flush())
+
+    async def __aenter__(self) -> "AnalysisResultSink":
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,110 @@
+"""
+暂存服务模块 - 上传后把源文件转换为列式暂存副本（Parquet）
+
+- CSV（含 gzip / zstd 压缩）按字符串读取后由 DuckDB 直接写出 Parquet，与分块导入的字符串语义一致
+- mbox / .eml 压缩包按批解析后写出 Parquet（列为解析出的标准列）
+- 过滤行数预览、样本预览和最终导入都读取暂存副本，源文件只解析一次
+- 暂存副本与源文件放在同一目录（<源文件名>.staged.parquet），随源文件一起移动和删除
+"""
+import os
+from typing import Optional
+
+import duckdb
+import pyarrow.parquet as pq
+
+from services.ingest_service import split_compression, PARQUET_FILE_TYPES, NDJSON_FILE_TYPES
+from services.mailbox_service import MAILBOX_SCHEMA, detect_mailbox_format, iter_parsed_batches
+
+
+STAGED_SUFFIX = ".staged.parquet"
+# 暂存副本写入期间的临时文件后缀
+STAGED_TMP_SUFFIX = ".tmp"
+
+
+def staged_path_for(file_path: str) -> str:
+    """源文件对应的暂存副本路径"""
+    return file_path.rstrip(os.sep) + STAGED_SUFFIX
+
+
+def get_staged_path(file_path: str) -> Optional[str]:
+    """暂存副本已生成时返回其路径，否则返回 None"""
+    staged_path = staged_path_for(file_path)
+    return staged_path if os.path.exists(staged_path) else None
+
+
+def supports_staging(file_path: str) -> bool:
+    """Parquet 本身即列式；NDJSON 可能包含嵌套字段，按原文件读取"""
+    if detect_mailbox_format(file_path):
+        return not os.path.isdir(file_path)
+    file_type = split_compression(file_path)[0]
+    return file_type not in PARQUET_FILE_TYPES and file_type not in NDJSON_FILE_TYPES
+
+
+def _remove_quietly(path: str):
+    """删除文件，文件不存在时忽略"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_staged(file_path: str):
+    """删除源文件的暂存副本及写入中的临时文件"""
+    staged_path = staged_path_for(file_path)
+    _remove_quietly(staged_path)
+    _remove_quietly(staged_path + STAGED_TMP_SUFFIX)
+
+
+def stage_file(file_path: str) -> Optional[int]:
+    """
+    生成暂存副本（先写临时文件，完成后再原子替换，读取方不会看到写了一半的副本）
+
+    暂存期间源文件被移走或删除（已确认导入、临时目录被清理）时不保留副本，返回 None
+
+    Returns:
+        暂存的行数；不需要暂存的文件返回 None
+    """
+    if not supports_staging(file_path):
+        return None
+
+    staged_path = staged_path_for(file_path)
+    if os.path.exists(staged_path):
+        return pq.ParquetFile(staged_path).metadata.num_rows
+
+    tmp_path = staged_path + STAGED_TMP_SUFFIX
+    try:
+        if detect_mailbox_format(file_path):
+            row_count = 0
+            with pq.ParquetWriter(tmp_path, MAILBOX_SCHEMA, compression="zstd") as writer:
+                for table in iter_parsed_batches(file_path):
+                    writer.write_table(table)
+                    row_count += table.num_rows
+        else:
+            escaped_path = file_path.replace("'", "''")
+            escaped_tmp = tmp_path.replace("'", "''")
+            conn = duckdb.connect(":memory:")
+            try:
+                row_count = conn.execute(f"""
+                    COPY (SELECT * FROM read_csv_auto('{escaped_path}', all_varchar = true))
+                    TO '{escaped_tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)
+                """).fetchone()[0]
+            finally:
+                conn.close()
+        os.replace(tmp_path, staged_path)
+    except Exception:
+        if not os.path.exists(file_path):
+            # 临时文件或所在目录已随源文件一起被移走 / 清理
+            return None
+        raise
+    finally:
+        _remove_quietly(tmp_path)
+
+    if not os.path.exists(file_path):
+        # 副本写完前源文件已被移走，副本不再有用；移走源文件时因临时文件未删除的空目录一并删除
+        remove_staged(file_path)
+        try:
+            os.rmdir(os.path.dirname(staged_path))
+        except OSError:
+            pass
+        return None
+    return row_count
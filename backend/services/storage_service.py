@@ -1,11 +1,32 @@
 """
 存储服务模块 - 负责文件的流式上传和管理
+支持可断点续传的分片上传（init / 按偏移写入分片 / finalize）
 """
+import json
+import uuid
 import shutil
+import hashlib
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import BinaryIO
+from typing import BinaryIO, Dict, Any, Optional
 import os
 
+from services.staging_service import STAGED_SUFFIX, STAGED_TMP_SUFFIX
+
+
+# 分片上传默认分片大小
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# 允许的最大分片大小（分片在请求中整体读入内存）
+MAX_UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+# 上传清单文件名（记录已接收的分片及其校验值）
+_MANIFEST_NAME = ".upload.json"
+
+
+class UploadError(Exception):
+    """分片上传请求不合法（偏移、大小或校验值错误）"""
+    pass
+
 
 class StorageService:
     """文件存储服务"""
@@ -14,6 +35,8 @@ class StorageService:
         """初始化存储服务"""
         self.upload_dir = Path(upload_dir)
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
     
     async def save_upload_file(self, file: BinaryIO, task_id: str, filename: str) -> str:
         """
@@ -62,7 +85,7 @@ class StorageService:
     
     def move_temp_file(self, source_path: str, temp_task_id: str, new_task_id: str) -> str:
         """
-        将临时文件移动到正式任务目录
+        将临时文件（及其派生文件）移动到正式任务目录
         
         Args:
             source_path: 源文件完整路径
@@ -80,6 +103,16 @@ class StorageService:
         new_task_dir = self.upload_dir / new_task_id
         new_task_dir.mkdir(parents=True, exist_ok=True)
         
+        # 先移动派生文件（如暂存副本 <文件名>.staged.parquet），再移动源文件；
+        # 写入中的暂存临时文件直接删除，暂存任务发现源文件已移走后放弃该副本
+        for derived in list(source.parent.iterdir()):
+            if not derived.name.startswith(f"{source.name}."):
+                continue
+            if derived.name.endswith(STAGED_SUFFIX + STAGED_TMP_SUFFIX):
+                derived.unlink(missing_ok=True)
+            else:
+                shutil.move(str(derived), str(new_task_dir / derived.name))
+        
         # 移动文件
         new_path = new_task_dir / source.name
         shutil.move(str(source), str(new_path))
@@ -90,6 +123,169 @@ class StorageService:
             temp_dir.rmdir()
         
         return str(new_path)
+    
+    # ==================== 分片上传 ====================
+    
+    def _upload_dir(self, upload_id: str) -> Path:
+        """分片上传的临时目录（与普通上传的临时目录规则一致）"""
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise FileNotFoundError(f"上传会话不存在: {upload_id}")
+        return self.upload_dir / f"temp_{upload_id}"
+    
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        """获取上传会话的清单锁（并行分片同时更新清单）"""
+        with self._locks_guard:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+    
+    def _read_manifest(self, upload_id: str) -> Dict[str, Any]:
+        manifest_path = self._upload_dir(upload_id) / _MANIFEST_NAME
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"上传会话不存在: {upload_id}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    def _write_manifest(self, upload_id: str, manifest: Dict[str, Any]):
+        """原子写入清单（先写临时文件再替换）"""
+        manifest_path = self._upload_dir(upload_id) / _MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+    
+    def init_resumable_upload(
+        self,
+        filename: str,
+        total_size: int,
+        chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE
+    ) -> Dict[str, Any]:
+        """
+        创建分片上传会话
+        
+        预先分配目标文件大小，各分片可按任意顺序、并行写入各自的偏移位置。
+        
+        Args:
+            filename: 原始文件名
+            total_size: 文件总字节数
+            chunk_size: 分片大小（最后一片可以更小）
+            
+        Returns:
+            上传会话状态
+        """
+        if total_size <= 0:
+            raise UploadError("文件大小必须大于 0")
+        if not 0 < chunk_size <= MAX_UPLOAD_CHUNK_SIZE:
+            raise UploadError(f"分片大小必须在 1 到 {MAX_UPLOAD_CHUNK_SIZE} 字节之间")
+        
+        upload_id = str(uuid.uuid4())
+        upload_dir = self._upload_dir(upload_id)
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        
+        filename = Path(filename).name
+        with open(upload_dir / f"{filename}.part", "wb") as f:
+            f.truncate(total_size)
+        
+        manifest = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "total_chunks": (total_size + chunk_size - 1) // chunk_size,
+            "received": {},
+            "created_at": datetime.now().isoformat()
+        }
+        self._write_manifest(upload_id, manifest)
+        return self._upload_status(manifest)
+    
+    @staticmethod
+    def _upload_status(manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """根据清单生成上传状态（已接收 / 缺失的分片序号）"""
+        received = sorted(int(i) for i in manifest["received"])
+        received_set = set(received)
+        return {
+            "upload_id": manifest["upload_id"],
+            "filename": manifest["filename"],
+            "total_size": manifest["total_size"],
+            "chunk_size": manifest["chunk_size"],
+            "total_chunks": manifest["total_chunks"],
+            "received_chunks": received,
+            "missing_chunks": [i for i in range(manifest["total_chunks"]) if i not in received_set]
+        }
+    
+    def get_upload_status(self, upload_id: str) -> Dict[str, Any]:
+        """获取上传会话状态（断点续传时客户端据此跳过已上传的分片）"""
+        return self._upload_status(self._read_manifest(upload_id))
+    
+    def write_upload_chunk(
+        self,
+        upload_id: str,
+        offset: int,
+        data: bytes,
+        checksum: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        写入一个分片
+        
+        Args:
+            upload_id: 上传会话 ID
+            offset: 分片在文件中的起始偏移（必须是分片大小的整数倍）
+            data: 分片内容
+            checksum: 分片的 SHA-256（十六进制），提供时校验
+            
+        Returns:
+            上传会话状态
+        """
+        manifest = self._read_manifest(upload_id)
+        chunk_size = manifest["chunk_size"]
+        total_size = manifest["total_size"]
+        
+        if offset < 0 or offset % chunk_size != 0:
+            raise UploadError(f"偏移 {offset} 不是分片大小的整数倍")
+        index = offset // chunk_size
+        expected_size = min(chunk_size, total_size - offset)
+        if index >= manifest["total_chunks"] or len(data) != expected_size:
+            raise UploadError(f"分片 {index} 大小应为 {expected_size} 字节，实际 {len(data)} 字节")
+        
+        digest = hashlib.sha256(data).hexdigest()
+        if checksum and checksum.lower() != digest:
+            raise UploadError(f"分片 {index} 校验失败")
+        
+        part_path = self._upload_dir(upload_id) / f"{manifest['filename']}.part"
+        with open(part_path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # 分片落盘后再登记，清单中的分片一定已完整写入
+        with self._upload_lock(upload_id):
+            manifest = self._read_manifest(upload_id)
+            manifest["received"][str(index)] = digest
+            self._write_manifest(upload_id, manifest)
+        return self._upload_status(manifest)
+    
+    def finalize_resumable_upload(self, upload_id: str) -> str:
+        """
+        完成分片上传：确认所有分片已接收，生成最终文件
+        
+        Returns:
+            str: 最终文件路径（位于 temp_{upload_id} 目录，可直接进入预览流程）
+        """
+        with self._upload_lock(upload_id):
+            manifest = self._read_manifest(upload_id)
+            status = self._upload_status(manifest)
+            if status["missing_chunks"]:
+                raise UploadError(f"还有 {len(status['missing_chunks'])} 个分片未上传")
+            
+            upload_dir = self._upload_dir(upload_id)
+            file_path = upload_dir / manifest["filename"]
+            os.replace(upload_dir / f"{manifest['filename']}.part", file_path)
+            (upload_dir / _MANIFEST_NAME).unlink()
+        
+        with self._locks_guard:
+            self._upload_locks.pop(upload_id, None)
+        return str(file_path)
 
 
 # 全局存储服务实例
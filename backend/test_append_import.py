@@ -0,0 +1,115 @@
+"""
+追加导入测试脚本
+
+测试内容：
+1. 追加导入只插入任务中尚不存在的行，记录新增 / 重复行数
+2. 多块并行导入时跨块、块内的重复行均被跳过，新增行保持文件顺序
+3. 旧版本导入的行（无内容哈希）在追加前补齐哈希
+4. 追加导入失败时任务保持原状态，错误记录在导入进度中
+"""
+import sys
+import os
+import re
+import csv
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.ingest_service import IngestService
+from test_ingest import _write_sample_csv, MAPPING
+
+
+def _numbers(db: DBService, task_id: str):
+    rows = db.conn.execute(
+        "SELECT content FROM emails WHERE task_id = ? ORDER BY id", [task_id]
+    ).fetchall()
+    return [int(re.search(r"\d+", row[0]).group()) for row in rows]
+
+
+def test_append_skips_seen_rows():
+    """测试 1/2: 增量追加"""
+    with tempfile.TemporaryDirectory() as tmp:
+        first = os.path.join(tmp, "export_1.csv")
+        second = os.path.join(tmp, "export_2.csv")
+        _write_sample_csv(first, rows=3000)
+        _write_sample_csv(second, rows=5000)
+        # 第二次导出中夹带一段重复行
+        with open(second, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            for i in range(4990, 5000):
+                writer.writerow([f"user{i % 7}@company.com", f"peer{i % 5}@vendor.com", f"主题 {i % 11}",
+                                 f"第一行 {i}\n第二行 \"引用\" {i}\n", f"2024-01-{(i % 28) + 1:02d} 10:00:00"])
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", first)
+        db.ingest_file_with_config("t", first, "csv", MAPPING)
+
+        IngestService(db, chunk_size=64 * 1024, append=True).ingest_csv("t", second, MAPPING)
+        progress = db.get_ingest_progress("t")
+        assert progress["chunks_total"] > 1
+        assert progress["rows_read"] == 5010
+        assert progress["rows_inserted"] == 2000
+        assert progress["rows_duplicate"] == 3010
+        assert _numbers(db, "t") == list(range(5000))
+
+        # 再次追加同一文件：全部为重复
+        db.ingest_file_with_config("t", second, "csv", MAPPING, append=True)
+        progress = db.get_ingest_progress("t")
+        assert progress["rows_inserted"] == 0 and progress["rows_duplicate"] == 5010
+        assert db.get_task("t")["status"] == "DONE"
+        db.close()
+        print(f"✓ 追加导入: 新增 2000 行，跳过 3010 行重复")
+
+
+def test_append_backfills_old_rows():
+    """测试 3: 旧数据补齐哈希"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(path, rows=500)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", path)
+        db.ingest_file_with_config("t", path, "csv", MAPPING)
+        db.conn.execute("UPDATE emails SET content_hash = NULL")
+
+        db.ingest_file_with_config("t", path, "csv", MAPPING, append=True)
+        progress = db.get_ingest_progress("t")
+        assert progress["rows_inserted"] == 0 and progress["rows_duplicate"] == 500
+        assert db.conn.execute("SELECT COUNT(*) FROM emails WHERE content_hash IS NULL").fetchone()[0] == 0
+        db.close()
+        print("✓ 旧数据补齐内容哈希")
+
+
+def test_failed_append_keeps_task_status():
+    """测试 4: 追加失败"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(path, rows=500)
+        broken = os.path.join(tmp, "broken.csv")
+        with open(broken, "w", encoding="utf-8") as f:
+            f.write("a,b\n1,2\n")
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", path)
+        db.ingest_file_with_config("t", path, "csv", MAPPING)
+        try:
+            db.ingest_file_with_config("t", broken, "csv", MAPPING, append=True)
+            raise AssertionError("应当失败")
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+
+        assert db.get_task("t")["status"] == "DONE"
+        progress = db.get_ingest_progress("t")
+        assert progress["status"] == "FAILED" and progress["error_message"]
+        assert db.get_task_stats("t")["total_emails"] == 500
+        db.close()
+        print("✓ 追加失败时任务保持 DONE，错误记录在导入进度中")
+
+
+if __name__ == "__main__":
+    test_append_skips_seen_rows()
+    test_append_backfills_old_rows()
+    test_failed_append_keeps_task_status()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,66 @@
+"""
+异步数据库服务测试脚本
+
+测试内容：
+1. 查询在专用线程池中执行，事件循环在长查询期间保持响应
+2. 超时后中断查询并抛出 DBQueryTimeout，查询线程随即可用
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.async_db_service import AsyncDBService, DBQueryTimeout
+
+# 约 10^10 次运算的交叉连接，不中断时需要很久
+HEAVY_SQL = "SELECT SUM(a.range * b.range) FROM range(100000) a, range(100000) b"
+
+
+async def _run_checks(db: DBService):
+    adb = AsyncDBService(db, max_workers=2, timeout=0.5)
+    assert (await adb.get_task("t"))["name"] == "t"
+
+    # 长查询期间事件循环继续调度其他协程
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticking = asyncio.create_task(ticker())
+    started = time.monotonic()
+    try:
+        await adb.run(lambda: db.conn.execute(HEAVY_SQL).fetchone())
+        raise AssertionError("应当超时")
+    except DBQueryTimeout as e:
+        assert "超过 0.5 秒" in str(e)
+    finally:
+        ticking.cancel()
+    assert ticks >= 20
+    assert time.monotonic() - started < 5
+
+    # 被中断的线程很快可以执行新的查询
+    for _ in range(4):
+        assert await adb.get_tasks(timeout=5)
+    adb.shutdown()
+    return ticks
+
+
+def test_async_db_offloads_and_times_out():
+    """测试 1/2: 线程池执行与超时"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t")
+        ticks = asyncio.run(_run_checks(db))
+        db.close()
+        print(f"✓ 长查询期间事件循环调度 {ticks} 次，超时后查询被中断")
+
+
+if __name__ == "__main__":
+    test_async_db_offloads_and_times_out()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,253 @@
+"""
+批量分析流水线测试脚本
+
+测试内容：
+1. 生产者按 id 窗口分页读取待分析的邮件放入有界队列（不在内存中保存 id 列表），读取进度领先处理进度不超过与并发上限成正比的数量
+2. 待处理集合排除被过滤和已有结果的邮件（分别计入跳过 / 成功），其余每封处理一次，结果和最终计数写入数据库
+3. 分析调用失败只计入失败；恢复任务只读取未完成的邮件
+4. 任务被取消时停止读取并记录已完成的进度
+5. 任务启动时的状态读写及聚类分析的数据库读写在线程池中执行，不阻塞事件循环
+6. Azure 返回 5xx 时抛出给重试循环：重试成功才计为成功，重试用尽返回失败，不保存默认结果
+"""
+import sys
+import os
+import json
+import asyncio
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import services.db_service as db_module
+import services.progress_board as board_module
+import services.batch_analysis_service as batch_module
+from services.db_service import DBService
+from services.ai_base import EmailAnalysisResult
+from services.batch_analysis_service import BatchAnalysisService, PIPELINE_QUEUE_FACTOR
+from services.concurrency_limiter import AdaptiveConcurrencyLimiter, DEFAULT_MAX_CONCURRENCY
+from services.azure_service import AzureService
+
+CONCURRENCY = 3
+# 队列 + 生产者手中的一批 + 正在处理的项（消费者数为并发上限的最大值）
+MAX_AHEAD = DEFAULT_MAX_CONCURRENCY * (2 * PIPELINE_QUEUE_FACTOR + 1)
+
+
+class _LocalAnalysisService(BatchAnalysisService):
+    """以本地函数代替 LLM 调用，记录读取与处理进度"""
+
+    def __init__(self, delay: float = 0.001):
+        super().__init__()
+        self.delay = delay
+        self.fetched = 0
+        self.analyzed = 0
+        self.max_ahead = 0
+        self.active = 0
+        self.max_active = 0
+        fetch = self.db.get_emails_for_analysis
+
+        def counting_fetch(*args):
+            batch = fetch(*args)
+            self.fetched += len(batch)
+            return batch
+        self.db.get_emails_for_analysis = counting_fetch
+
+    def _get_ai_service(self, model: str = "azure"):
+        return None
+
+    async def _local_call(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+
+    async def _analyze_with_retry(self, ai_service, email, prompt_template, max_retries, task_id=None, limiter=None):
+        self.max_ahead = max(self.max_ahead, self.fetched - self.analyzed)
+        try:
+            await limiter.call(self._local_call, timeout=5)
+        finally:
+            self.analyzed += 1
+        if email["id"] % 97 == 0:
+            return None
+        return EmailAnalysisResult(summary=f"摘要 {email['id']}", risk_level="低", tags=[])
+    
+    async def _analyze_cluster_with_retry(self, ai_service, emails, prompt_template, max_retries, task_id=None, limiter=None):
+        await limiter.call(self._local_call, timeout=5)
+        return f'{{"summary": "{len(emails)} 封"}}'
+
+
+def _setup(tmp: str) -> DBService:
+    db = DBService(os.path.join(tmp, "test.duckdb"))
+    db.create_task("t", "t")
+    db.conn.execute("""
+        INSERT INTO emails (id, task_id, sender, receiver, subject, content)
+        SELECT range, 't', 'a@x.com', 'b@x.com',
+               CASE WHEN range % 10 = 0 THEN 'Out of Office' ELSE '主题 ' || range END, '正文 ' || range
+        FROM range(1, 1001)
+    """)
+    db.save_analysis_result("r1", "t", 1, "batch_summary", "azure", {"summary": "已有"})
+    return db
+
+
+async def _run_job(service: BatchAnalysisService, job_id: str, cancel_after: float = None,
+                   analysis_type: str = "email"):
+    service.db.create_batch_job(
+        job_id, "t", "{content}", ["Out of Office"], "azure", concurrency=CONCURRENCY, analysis_type=analysis_type
+    )
+    task = asyncio.create_task(service._run_job(job_id))
+    if cancel_after is not None:
+        await asyncio.sleep(cancel_after)
+        task.cancel()
+    await task
+    return service.db.get_batch_job(job_id)
+
+
+def _with_db(check):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _setup(tmp)
+        saved = db_module._db_service, board_module._progress_board
+        db_module._db_service, board_module._progress_board = db, None
+        try:
+            check(db)
+        finally:
+            db_module._db_service, board_module._progress_board = saved
+            db.close()
+
+
+def test_pipeline_processes_all_with_bounded_read_ahead():
+    """测试 1/2/3: 有界读取、完整处理与恢复"""
+    def check(db: DBService):
+        service = _LocalAnalysisService()
+        # 窗口小于邮件 id 范围，覆盖跨窗口分页（窗口内不足一批、读满一批两种情况）
+        span = batch_module.PIPELINE_SCAN_SPAN
+        batch_module.PIPELINE_SCAN_SPAN = 64
+        try:
+            job = asyncio.run(_run_job(service, "j1"))
+        finally:
+            batch_module.PIPELINE_SCAN_SPAN = span
+        assert job["status"] == "COMPLETED"
+        assert (job["total_count"], job["skipped_count"], job["processed_count"]) == (1000, 100, 900)
+        # 900 封中：1 封已有结果，id 为 97 的倍数且未被过滤的 9 封失败
+        assert (job["success_count"], job["failed_count"]) == (891, 9)
+        assert service.analyzed == 899 and service.fetched == 899
+        # 延迟稳定时并发从初始值逐步增加
+        assert CONCURRENCY < service.max_active <= DEFAULT_MAX_CONCURRENCY
+        assert service.max_ahead <= MAX_AHEAD
+        saved = db.conn.execute(
+            "SELECT COUNT(*) FROM analysis_results WHERE analysis_type = 'batch_summary'"
+        ).fetchone()[0]
+        assert saved == 891
+        print(f"✓ 处理 900 封邮件，读取进度最多领先 {service.max_ahead} 封（并发从 {CONCURRENCY} 增至 {service.max_active}）")
+
+        # 恢复：只读取没有结果的 9 封
+        resumed = _LocalAnalysisService()
+        job = asyncio.run(_run_job(resumed, "j1-resume"))
+        assert resumed.fetched == 9 and resumed.analyzed == 9
+        assert (job["processed_count"], job["success_count"], job["failed_count"]) == (900, 891, 9)
+        print("✓ 恢复任务只读取未完成的 9 封邮件")
+    _with_db(check)
+
+
+def test_pipeline_cancel_stops_producer():
+    """测试 4: 取消任务"""
+    def check(db: DBService):
+        service = _LocalAnalysisService(delay=0.01)
+        job = asyncio.run(_run_job(service, "j2", cancel_after=0.2))
+        assert job["status"] == "CANCELLED"
+        assert 0 < job["processed_count"] < 900
+        assert service.fetched < 900
+        assert service.fetched - service.analyzed <= MAX_AHEAD
+        print(f"✓ 取消后停止读取：已读取 {service.fetched} 封，已处理 {job['processed_count']} 封")
+    _with_db(check)
+
+
+def test_cluster_job_runs_db_calls_off_loop():
+    """测试 5: 任务状态与聚类分析的数据库调用不在事件循环线程中执行"""
+    def check(db: DBService):
+        service = _LocalAnalysisService()
+        calls = []
+        for name in ("get_batch_job", "update_batch_job_status", "get_clusters_for_batch_analysis",
+                     "get_emails_by_participants", "save_cluster_insight"):
+            def recording(*args, _name=name, _method=getattr(db, name), **kwargs):
+                calls.append((_name, threading.current_thread() is threading.main_thread()))
+                return _method(*args, **kwargs)
+            setattr(db, name, recording)
+
+        job = asyncio.run(_run_job(service, "j3", analysis_type="people_cluster"))
+        assert (job["status"], job["success_count"]) == ("COMPLETED", 1)
+        assert calls[:2] == [("get_batch_job", False), ("update_batch_job_status", False)]
+        assert [name for name, _ in calls if "batch_job" not in name] == [
+            "get_clusters_for_batch_analysis", "get_emails_by_participants", "save_cluster_insight"
+        ]
+        # 最后一次 get_batch_job 为测试读取任务状态
+        assert not any(on_loop for _, on_loop in calls[:-1])
+        insight = db.get_people_clusters("t")["clusters"][0]["ai_insight"]
+        assert insight == '{"summary": "20 封"}'
+        print("✓ 聚类分析的数据库调用在线程池中执行")
+    _with_db(check)
+
+
+class _FlakyAzure(BaseHTTPRequestHandler):
+    """模拟 Azure OpenAI：前 failures 次请求返回 500，之后返回正常的分析结果"""
+    failures = 0
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).requests += 1
+        if type(self).requests <= type(self).failures:
+            status, body = 500, {"error": {"message": "internal error"}}
+        else:
+            content = json.dumps({"summary": "正常", "risk_level": "低", "tags": []}, ensure_ascii=False)
+            status, body = 200, {
+                "id": "c", "object": "chat.completion", "created": 0, "model": "d",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            }
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_server_error_is_retried_not_saved():
+    """测试 6: 5xx 进入重试，不作为成功结果"""
+    def check(db: DBService):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyAzure)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            ai_service = AzureService(
+                api_key="k", endpoint=f"http://127.0.0.1:{server.server_port}", deployment_name="d", max_retries=0
+            )
+            email = {"id": 2, "subject": "主题", "content": "正文"}
+
+            async def analyze(failures: int):
+                _FlakyAzure.failures, _FlakyAzure.requests = failures, 0
+                limiter = AdaptiveConcurrencyLimiter(initial=1)
+                result = await BatchAnalysisService()._analyze_with_retry(
+                    ai_service, email, "{content}", 2, limiter=limiter
+                )
+                return result, _FlakyAzure.requests
+
+            result, requests = asyncio.run(analyze(1))
+            assert requests == 2 and result.summary == "正常"
+            result, requests = asyncio.run(analyze(2))
+            assert requests == 2 and result is None
+        finally:
+            server.shutdown()
+        print("✓ 5xx 重试后成功；重试用尽计为失败")
+    _with_db(check)
+
+
+if __name__ == "__main__":
+    test_pipeline_processes_all_with_bounded_read_ahead()
+    test_pipeline_cancel_stops_producer()
+    test_cluster_job_runs_db_calls_off_loop()
+    test_server_error_is_retried_not_saved()
+    print("\n✅ 所有测试通过！")
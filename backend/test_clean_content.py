@@ -0,0 +1,74 @@
+"""
+正文预清洗测试脚本
+
+测试内容：
+1. 导入后进程池按批预计算 clean_content / clean_hash，结果与实时清洗一致
+2. 构建上下文时读取预计算列，结果与实时清洗一致，并按哈希去重
+"""
+import sys
+import os
+import csv
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.ingest_service import IngestService
+from services.email_dedup_service import EmailDedupService
+from test_ingest import MAPPING
+
+
+def _write_reply_csv(path: str, rows: int):
+    """正文包含引用的回复，同一主题下每 2 封邮件的最新回复相同"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["From", "To", "Subject", "Body", "Date"])
+        for i in range(rows):
+            body = (f"回复内容 {i // 8}\n\n"
+                    f"On Mon, Jan 1, 2024 at 10:00 AM peer{i}@vendor.com wrote:\n"
+                    f"> 原始邮件 {i}\n> 第二行\n")
+            writer.writerow([f"user{i % 7}@company.com", "peer@vendor.com", f"主题 {i % 4}",
+                             body, "2024-01-01 10:00:00"])
+
+
+def test_clean_content_precomputed():
+    """测试 1/2: 预计算与上下文构建"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_reply_csv(path, 900)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", path)
+        db.ingest_file_with_config("t", path, "csv", MAPPING)
+        # 导入时已预计算（单批，当前进程处理）
+        assert db.conn.execute("SELECT COUNT(*) FROM emails WHERE clean_hash IS NULL").fetchone()[0] == 0
+
+        # 多批时使用进程池
+        db.conn.execute("UPDATE emails SET clean_content = NULL, clean_hash = NULL")
+        assert IngestService(db, workers=2).precompute_clean_content("t", batch_rows=100) == 900
+
+        rows = db.conn.execute("SELECT content, clean_content, clean_hash FROM emails ORDER BY id").fetchall()
+        for content, clean_content, clean_hash in rows:
+            assert (clean_content, clean_hash) == EmailDedupService.clean_and_hash(content)
+        assert rows[9][1] == "回复内容 1"
+
+        emails = db.get_emails_by_subject("t", "主题 0", limit=30, include_clean=True)
+        assert all(e["clean_hash"] for e in emails)
+        precomputed = EmailDedupService.build_deduped_context(emails)
+        live = EmailDedupService.build_deduped_context(
+            [{k: v for k, v in e.items() if k not in ("clean_content", "clean_hash")} for e in emails]
+        )
+        assert precomputed == live
+        assert precomputed.count("回复内容") == len({e["clean_hash"] for e in emails}) < len(emails)
+
+        # 预计算列存在时不再解析原始正文
+        context = EmailDedupService.build_deduped_context(
+            [{"content": None, "clean_content": "已清洗", "clean_hash": "h", "subject": "s"}]
+        )
+        assert "已清洗" in context
+        db.close()
+        print(f"✓ 预计算 {len(rows)} 封邮件的清洗正文")
+
+
+if __name__ == "__main__":
+    test_clean_content_precomputed()
+    print("\n✅ 所有测试通过！")
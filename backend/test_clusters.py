@@ -0,0 +1,149 @@
+"""
+聚类列表测试脚本
+
+测试内容：
+1. 聚类列表一次查询关联 AI 洞察，分页结果稳定、总数正确；按 next_cursor 游标翻页与按页码读取结果一致
+2. 导出从游标流式读取，可在不同线程中迭代，与分页结果一致
+3. 删除任务时一并删除聚类洞察
+4. 聚类物化表在导入结束时构建，追加导入时按聚类列增量 upsert，结果与全量重建一致
+5. 物化表缺失时读取回退为直接聚合（不触发构建），由启动时的回填全量构建
+"""
+import sys
+import os
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from test_ingest import _write_sample_csv, MAPPING
+
+
+def _materialized(db: DBService, task_id: str):
+    return (
+        db.conn.execute(
+            "SELECT * FROM people_clusters WHERE task_id = ? ORDER BY email_count DESC, participant1, participant2",
+            [task_id]
+        ).fetchall(),
+        db.conn.execute(
+            "SELECT * FROM subject_clusters WHERE task_id = ? ORDER BY email_count DESC, subject", [task_id]
+        ).fetchall(),
+        db.conn.execute("SELECT * FROM cluster_totals WHERE task_id = ? ORDER BY cluster_type", [task_id]).fetchall(),
+    )
+
+
+def test_cluster_listing_joins_insights():
+    """测试 1/2/3: 聚类列表与导出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(path, rows=500)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", path)
+        db.ingest_file_with_config("t", path, "csv", MAPPING)
+        db.save_cluster_insight("t", "people", "peer0@vendor.com ↔ user0@company.com", '{"summary": "p"}', "azure")
+        db.save_cluster_insight("t", "subjects", "主题 3", '{"summary": "s"}', "azure")
+
+        emails = db.conn.execute("SELECT sender, receiver, subject FROM emails").fetchall()
+        pair_counts = Counter(f"{min(s, r)} ↔ {max(s, r)}" for s, r, _ in emails)
+        subject_counts = Counter(subject for _, _, subject in emails)
+
+        pages = [db.get_people_clusters("t", page, 8) for page in range(1, 6)]
+        assert all(p["total"] == 35 and p["total_pages"] == 5 for p in pages)
+        people = [c for p in pages for c in p["clusters"]]
+        assert {c["participants"]: c["email_count"] for c in people} == pair_counts
+        assert [c["email_count"] for c in people] == sorted(pair_counts.values(), reverse=True)
+        insights = {c["participants"]: c["ai_insight"] for c in people if c["ai_insight"]}
+        assert insights == {"peer0@vendor.com ↔ user0@company.com": '{"summary": "p"}'}
+
+        beyond = db.get_people_clusters("t", 9, 8)
+        assert beyond["clusters"] == [] and beyond["total"] == 35
+
+        # 游标翻页：从上一页最后一个聚类之后读取
+        walked, cursor = [], None
+        while True:
+            page = db.get_people_clusters("t", page_size=8, cursor=cursor)
+            walked += page["clusters"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert walked == people
+        assert pages[-1]["next_cursor"] is None
+        try:
+            db.get_subject_clusters("t", cursor=pages[0]["next_cursor"])
+            assert False, "往来聚类的游标不能用于主题聚类"
+        except ValueError:
+            pass
+
+        subjects = db.get_subject_clusters("t", 1, 20)
+        assert subjects["total"] == 11
+        assert {c["subject"]: c["email_count"] for c in subjects["clusters"]} == subject_counts
+        assert [c["subject"] for c in subjects["clusters"] if c["ai_insight"]] == ["主题 3"]
+
+        # 导出：逐条在不同线程中迭代
+        exported = db.iter_clusters_for_export("t", "people", batch_size=4)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            rows = []
+            while True:
+                row = pool.submit(next, exported, None).result()
+                if row is None:
+                    break
+                rows.append(row)
+        assert [r["participants"] for r in rows] == [c["participants"] for c in people]
+        assert [r["ai_insight"] for r in rows].count("") == 34
+        assert [r["subject"] for r in db.iter_clusters_for_export("t", "subjects")] == \
+            [c["subject"] for c in subjects["clusters"]]
+
+        db.delete_task("t")
+        assert db.conn.execute("SELECT COUNT(*) FROM email_clusters").fetchone()[0] == 0
+        db.close()
+        print(f"✓ 聚类列表: {len(people)} 个往来聚类，{len(subjects['clusters'])} 个主题聚类")
+
+
+def test_clusters_refreshed_incrementally():
+    """测试 4/5: 聚类物化表增量刷新与回填"""
+    with tempfile.TemporaryDirectory() as tmp:
+        first = os.path.join(tmp, "first.csv")
+        second = os.path.join(tmp, "second.csv")
+        _write_sample_csv(first, rows=300)
+        _write_sample_csv(second, rows=800)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", first)
+        db.ingest_file_with_config("t", first, "csv", MAPPING)
+        assert db.conn.execute(
+            "SELECT total, emails_through FROM cluster_totals WHERE task_id = 't' AND cluster_type = 'people'"
+        ).fetchone() == (35, 300)
+
+        # 追加：只聚合新增的 500 封邮件，与已有聚类合并
+        db.ingest_file_with_config("t", second, "csv", MAPPING, append=True)
+        incremental = _materialized(db, "t")
+        assert sum(row[3] for row in incremental[0]) == 800
+        db.refresh_clusters("t", full=True)
+        assert _materialized(db, "t") == incremental
+
+        # 旧版本导入的任务（没有物化结果）：读取直接聚合，不写物化表
+        materialized_page = db.get_subject_clusters("t", 2, 5)
+        materialized_people = db.get_people_clusters("t", 1, 100)["clusters"]
+        db.drop_clusters("t")
+        assert db.get_subject_clusters("t", 2, 5) == materialized_page
+        assert db.get_people_clusters("t", 1, 100)["clusters"] == materialized_people
+        assert [r["participants"] for r in db.iter_clusters_for_export("t", "people")] == \
+            [c["participants"] for c in materialized_people]
+        batch = db.get_clusters_for_batch_analysis("t", "people")
+        assert [c["count"] for c in batch] == [row[3] for row in incremental[0]]
+        assert batch[0]["key"] == f"{incremental[0][0][1]} ↔ {incremental[0][0][2]}"
+        assert db.conn.execute("SELECT COUNT(*) FROM cluster_totals").fetchone()[0] == 0
+
+        # 启动回填：只构建已完成且没有物化结果的任务
+        assert db.backfill_rollups() == ["t"]
+        assert _materialized(db, "t") == incremental
+        assert db.backfill_rollups() == []
+        db.close()
+        print(f"✓ 增量刷新: {len(incremental[0])} 个往来聚类，{len(incremental[1])} 个主题聚类")
+
+
+if __name__ == "__main__":
+    test_cluster_listing_joins_insights()
+    test_clusters_refreshed_incrementally()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,152 @@
+"""
+Parquet / NDJSON 导入导出测试脚本
+
+测试内容：
+1. Parquet 按行组导入（列投影 + 过滤）
+2. NDJSON 分块导入（字段类型不一致、缺失字段）
+3. 导出邮件及最新分析结果为 Parquet / NDJSON
+"""
+import sys
+import os
+import json
+import uuid
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services.db_service import DBService
+from services.ingest_service import IngestService
+
+
+MAPPING = {
+    "sender": "from",
+    "receiver": "to",
+    "subject": "subject",
+    "content": "body",
+    "timestamp": "sent_at"
+}
+
+
+def _records(count: int):
+    return [
+        {
+            "from": f"user{i % 7}@company.com",
+            "to": f"peer{i % 5}@vendor.com",
+            "subject": f"主题 {i % 11}",
+            "body": f"第一行 {i}\n第二行",
+            "sent_at": datetime(2024, 1, 1) + timedelta(hours=i),
+            "attachments": [f"file{i}.pdf"],
+        }
+        for i in range(count)
+    ]
+
+
+def test_parquet_ingest():
+    """测试 1: Parquet 按行组导入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.parquet")
+        pq.write_table(pa.Table.from_pylist(_records(1000)), path, row_group_size=100)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("p1", "parquet", path)
+        filter_config = {"logic": "OR", "conditions": [
+            {"field": "subject", "match_type": "exact", "value": "主题 3"}
+        ]}
+        progress = IngestService(db, workers=3).ingest_parquet("p1", path, MAPPING, filter_config)
+
+        expected = db.conn.execute(f"""
+            SELECT COUNT(*) FROM read_parquet('{path}')
+            {db.build_filter_where_clause(filter_config)}
+        """).fetchone()[0]
+        count, first_ts = db.conn.execute(
+            "SELECT COUNT(*), MIN(timestamp) FROM emails WHERE task_id = 'p1'"
+        ).fetchone()
+        assert count == expected == progress["rows_inserted"]
+        assert progress["rows_read"] == 1000
+        assert progress["chunks_total"] == 10
+        assert progress["bytes_read"] == progress["total_bytes"]
+        assert first_ts == datetime(2024, 1, 1)
+        db.close()
+        print(f"✓ Parquet 导入 {count} 行，{progress['chunks_total']} 个行组")
+
+
+def test_ndjson_ingest():
+    """测试 2: NDJSON 分块导入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.ndjson")
+        with open(path, "w", encoding="utf-8") as f:
+            for i, record in enumerate(_records(600)):
+                record["sent_at"] = record["sent_at"].isoformat()
+                if i == 350:
+                    # 同一字段类型不一致，且缺少 to 字段
+                    record["subject"] = 12345
+                    del record["to"]
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("j1", "ndjson", path)
+        db.ingest_file_with_config("j1", path, "ndjson", MAPPING)
+
+        progress = db.get_ingest_progress("j1")
+        count, with_ts = db.conn.execute(
+            "SELECT COUNT(*), COUNT(timestamp) FROM emails WHERE task_id = 'j1'"
+        ).fetchone()
+        assert count == with_ts == 600
+        assert progress["bytes_read"] == os.path.getsize(path)
+        row = db.conn.execute(
+            "SELECT subject, receiver, content FROM emails WHERE task_id = 'j1' AND subject = '12345'"
+        ).fetchone()
+        assert row[1] is None and row[2] == "第一行 350\n第二行"
+
+        # 小块多线程导入结果一致
+        db.create_task("j2", "ndjson", path)
+        progress = IngestService(db, chunk_size=4096, workers=3).ingest_ndjson("j2", path, MAPPING)
+        assert progress["rows_inserted"] == 600 and progress["chunks_total"] > 1
+        db.close()
+        print(f"✓ NDJSON 导入 {count} 行")
+
+
+def test_export():
+    """测试 3: 导出邮件及最新分析结果"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.parquet")
+        pq.write_table(pa.Table.from_pylist(_records(50)), path)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("e1", "export", path)
+        db.ingest_file_with_config("e1", path, "parquet", MAPPING)
+
+        email_id = db.conn.execute("SELECT MIN(id) FROM emails WHERE task_id = 'e1'").fetchone()[0]
+        # 同一邮件、类型、模型只保留一条结果，两条结果来自不同模型
+        for i, (model, summary) in enumerate([("gemini", "旧结果"), ("azure", "新结果")]):
+            db.conn.execute(
+                "INSERT INTO analysis_results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [str(uuid.uuid4()), "e1", email_id, "summary", model,
+                 json.dumps({"summary": summary}, ensure_ascii=False),
+                 datetime(2024, 6, 1) + timedelta(minutes=i)]
+            )
+
+        out = os.path.join(tmp, "out.parquet")
+        assert db.export_task("e1", out) == 50
+        table = pq.read_table(out)
+        assert table.num_rows == 50
+        first = table.slice(0, 1).to_pylist()[0]
+        assert first["id"] == email_id
+        assert json.loads(first["analysis_result"])["summary"] == "新结果"
+
+        out = os.path.join(tmp, "out.ndjson")
+        assert db.export_task("e1", out, "ndjson") == 50
+        with open(out, encoding="utf-8") as f:
+            assert sum(1 for _ in f) == 50
+        db.close()
+        print("✓ 导出成功")
+
+
+if __name__ == "__main__":
+    test_parquet_ingest()
+    test_ndjson_ingest()
+    test_export()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,137 @@
+"""
+自适应并发控制测试脚本
+
+测试内容：
+1. 延迟稳定、无错误时并发上限逐步增加；服务端容量不足返回 429 时上限减半，在容量附近收敛
+2. 429 带 Retry-After 时暂停期间不发出新请求；超时同样减小上限；上限变化记录在 history 中
+3. Retry-After 解析：retry-after-ms、秒数、HTTP 日期
+"""
+import sys
+import os
+import time
+import asyncio
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.concurrency_limiter import AdaptiveConcurrencyLimiter, retry_after_seconds
+
+
+class _RateLimited(Exception):
+    """模拟 SDK 的 429 错误（status_code + response.headers）"""
+    status_code = 429
+
+    def __init__(self, headers=None):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class _Server:
+    """容量有限的模拟服务：同时处理的请求超过 capacity 时返回 429"""
+
+    def __init__(self, capacity: int, retry_after: str = None):
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.active = 0
+        self.max_active = 0
+        self.throttled = 0
+        self.starts = []
+
+    async def handle(self):
+        self.starts.append(time.monotonic())
+        self.active += 1
+        try:
+            self.max_active = max(self.max_active, self.active)
+            if self.active > self.capacity:
+                self.throttled += 1
+                raise _RateLimited({"retry-after": self.retry_after} if self.retry_after else {})
+            await asyncio.sleep(0.005)
+        finally:
+            self.active -= 1
+
+
+async def _drive(limiter: AdaptiveConcurrencyLimiter, server: _Server, requests: int, workers: int = 30):
+    """workers 个协程共发出 requests 次请求，失败的请求不重试"""
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            try:
+                await limiter.call(server.handle, timeout=5)
+            except _RateLimited:
+                pass
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+def test_limit_grows_and_backs_off():
+    """测试 1: 加性增、乘性减"""
+    async def run():
+        healthy = AdaptiveConcurrencyLimiter(initial=2, max_limit=12)
+        await _drive(healthy, _Server(capacity=100), 600)
+        assert healthy.limit == 12
+        assert [h["reason"] for h in healthy.history][:2] == ["start", "increase"]
+
+        limiter = AdaptiveConcurrencyLimiter(initial=4, max_limit=40)
+        server = _Server(capacity=8, retry_after="0.01")
+        await _drive(limiter, server, 3000)
+        reasons = {h["reason"] for h in limiter.history}
+        assert {"increase", "rate_limited"} <= reasons
+        assert server.throttled > 0
+        assert 2 <= limiter.limit <= 16
+        assert limiter.in_flight == 0
+        return healthy.limit, limiter.limit, server.throttled
+
+    grown, converged, throttled = asyncio.run(run())
+    print(f"✓ 无限流时上限增至 {grown}；容量 8 时收敛到 {converged}（429 共 {throttled} 次）")
+
+
+def test_retry_after_pauses_requests():
+    """测试 2: Retry-After 暂停与超时"""
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial=4)
+        server = _Server(capacity=0, retry_after="0.3")
+        try:
+            await limiter.call(server.handle, timeout=5)
+        except _RateLimited:
+            pass
+        throttled_at = time.monotonic()
+        assert limiter.limit == 2 and limiter.snapshot()["paused_seconds"] > 0
+
+        server.capacity = 100
+        await asyncio.gather(*(limiter.call(server.handle, timeout=5) for _ in range(3)))
+        assert min(server.starts[1:]) - throttled_at >= 0.25
+
+        async def hang():
+            await asyncio.sleep(1)
+
+        limiter._last_backoff = 0.0
+        try:
+            await limiter.call(hang, timeout=0.05)
+            raise AssertionError("应当超时")
+        except asyncio.TimeoutError:
+            pass
+        assert limiter.limit == 1
+        assert [h["reason"] for h in limiter.history] == ["start", "rate_limited", "timeout"]
+
+    asyncio.run(run())
+    print("✓ Retry-After 期间暂停发出请求，超时时减小上限")
+
+
+def test_retry_after_parsing():
+    """测试 3: Retry-After 解析"""
+    assert retry_after_seconds(_RateLimited({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(_RateLimited({"retry-after": "7"})) == 7.0
+    http_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= retry_after_seconds(_RateLimited({"retry-after": http_date})) <= 30
+    assert retry_after_seconds(_RateLimited({})) is None
+    assert retry_after_seconds(ValueError("x")) is None
+    print("✓ Retry-After 解析")
+
+
+if __name__ == "__main__":
+    test_limit_grows_and_backs_off()
+    test_retry_after_pauses_requests()
+    test_retry_after_parsing()
+    print("\n✅ 所有测试通过！")
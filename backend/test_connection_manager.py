@@ -0,0 +1,70 @@
+"""
+数据库连接管理测试脚本
+
+测试内容：
+1. 写入通道被占用时（大文件导入 / 批量任务写入中），读取照常执行
+2. 并发读取使用不同游标，写入串行，提交后对读取可见
+"""
+import sys
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+
+
+def test_reads_not_blocked_by_writer():
+    """测试 1/2: 读写分离"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t")
+
+        entered, release = threading.Event(), threading.Event()
+
+        def hold_writer():
+            with db.connections.writer():
+                entered.set()
+                release.wait(10)
+
+        holder = threading.Thread(target=hold_writer)
+        holder.start()
+        assert entered.wait(5)
+
+        # 写入通道被占用：读取不受影响，写入等待
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            reads = [pool.submit(db.get_task, "t") for _ in range(8)]
+            assert all(f.result(timeout=5)["status"] == "PENDING" for f in reads)
+            write = pool.submit(db.update_task_status, "t", "DONE")
+            time.sleep(0.2)
+            assert not write.done()
+            release.set()
+            write.result(timeout=5)
+        holder.join()
+        assert db.get_task("t")["status"] == "DONE"
+
+        # 读取使用池中的独立游标，嵌套调用复用外层游标
+        seen = set()
+        barrier = threading.Barrier(3)
+
+        def read_cursor():
+            with db.connections.reader() as conn:
+                barrier.wait(5)
+                assert db.conn is conn
+                with db.connections.reader() as inner:
+                    assert inner is conn
+                seen.add(id(conn))
+                return db.get_tasks()
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            assert all(len(r) == 1 for r in pool.map(lambda _: read_cursor(), range(3)))
+        assert len(seen) == 3
+        db.close()
+        print("✓ 写入通道占用期间读取不受影响")
+
+
+if __name__ == "__main__":
+    test_reads_not_blocked_by_writer()
+    print("\n✅ 所有测试通过！")
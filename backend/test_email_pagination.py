@@ -0,0 +1,85 @@
+"""
+邮件游标分页测试脚本
+
+测试内容：
+1. 逐页读取覆盖全部邮件、顺序稳定，游标为不透明字符串
+2. 按发件人、时间范围、是否已分析过滤后分页，结果与直接查询一致
+3. 每封邮件只返回一条分析结果（batch_summary 优先）
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService, decode_email_cursor
+from test_ingest import _write_sample_csv, MAPPING
+
+
+def _walk(db: DBService, limit: int, **filters):
+    emails, cursor, pages = [], None, 0
+    while True:
+        page = db.get_emails_page("t", limit, cursor, **filters)
+        emails += page["emails"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return emails, pages
+
+
+def test_keyset_pagination():
+    """测试 1/2/3: 游标分页"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(path, rows=1000)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        for task_id in ("other", "t"):
+            db.create_task(task_id, task_id, path)
+            db.ingest_file_with_config(task_id, path, "csv", MAPPING)
+        ids = [row[0] for row in db.conn.execute("SELECT id FROM emails WHERE task_id = 't' ORDER BY id").fetchall()]
+
+        emails, pages = _walk(db, 64)
+        assert [e["id"] for e in emails] == ids and pages == 16
+        first = db.get_emails_page("t", 64)
+        assert first["emails"] == emails[:64]
+        assert decode_email_cursor(first["next_cursor"]) == ids[63]
+        assert "after" not in first["next_cursor"]
+        try:
+            db.get_emails_page("t", 64, "not-a-cursor")
+            raise AssertionError("应当拒绝无效游标")
+        except ValueError:
+            pass
+
+        # 过滤
+        by_sender, _ = _walk(db, 50, sender="user3@company.com")
+        assert [e["id"] for e in by_sender] == [
+            row[0] for row in db.conn.execute(
+                "SELECT id FROM emails WHERE task_id = 't' AND sender = 'user3@company.com' ORDER BY id"
+            ).fetchall()
+        ]
+        in_range, _ = _walk(db, 50, start="2024-01-05", end="2024-01-07")
+        assert in_range and all("2024-01-05" <= e["timestamp"] < "2024-01-07" for e in in_range)
+        assert len(in_range) == db.conn.execute(
+            "SELECT COUNT(*) FROM emails WHERE task_id = 't' AND timestamp >= '2024-01-05' AND timestamp < '2024-01-07'"
+        ).fetchone()[0]
+
+        # 分析结果：同一邮件有多条结果时只返回一条，batch_summary 优先
+        db.save_analysis_result("r1", "t", ids[10], "summary", "azure", {"summary": "单条"})
+        db.save_analysis_result("r2", "t", ids[10], "batch_summary", "azure", {"summary": "批量"})
+        db.save_analysis_result("r3", "t", ids[10], "batch_summary", "other", {"summary": "批量 2"})
+        db.save_analysis_result("r4", "t", ids[700], "summary", "azure", {"summary": "单条"})
+        analyzed, _ = _walk(db, 10, has_analysis=True)
+        assert [e["id"] for e in analyzed] == [ids[10], ids[700]]
+        assert analyzed[1]["batch_analysis_result"] == {"summary": "单条"}
+        assert analyzed[0]["batch_analysis_result"]["summary"].startswith("批量")
+        pending, _ = _walk(db, 100, has_analysis=False)
+        assert len(pending) == 998
+
+        assert [e["id"] for e in db.get_emails_by_task("t", 10, 5)] == ids[5:15]
+        db.close()
+        print(f"✓ 游标分页: {len(emails)} 封邮件，{pages} 页")
+
+
+if __name__ == "__main__":
+    test_keyset_pagination()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,61 @@
+"""
+过滤规则影响统计测试脚本
+
+测试内容：
+1. 每条规则的命中数、独占命中数、重叠数与逐条统计结果一致
+2. 源文件与暂存副本的统计结果一致
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.preview_service import PreviewService
+from services.staging_service import stage_file
+from test_ingest import _write_sample_csv
+
+
+def _single(cond):
+    return {"logic": "OR", "conditions": [cond]}
+
+
+def test_filter_impact():
+    """测试 1/2: 条件聚合统计"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(path, rows=1540)
+
+        conditions = [
+            {"field": "From", "match_type": "exact", "value": "user0@company.com"},
+            {"field": "", "match_type": "exact", "value": ""},  # 无效规则不统计
+            {"field": "Subject", "match_type": "exact", "value": "主题 0"},
+            {"field": "Body", "match_type": "contains", "value": "O'Brien"},
+        ]
+        service = PreviewService()
+        for logic in ("OR", "AND"):
+            config = {"logic": logic, "conditions": conditions}
+            impact = service.get_filter_impact(path, config)
+            assert impact["total"] == 1540
+            assert impact["count"] == service.get_filtered_row_count(path, config)
+            assert impact["excluded"] == 1540 - impact["count"]
+
+            assert [c["index"] for c in impact["conditions"]] == [0, 2, 3]
+            by_index = {c["index"]: c for c in impact["conditions"]}
+            for index, rule in by_index.items():
+                assert rule["matched"] == 1540 - service.get_filtered_row_count(path, _single(conditions[index]))
+            # 7 与 11 互质：user0 命中 220 行，主题 0 命中 140 行，两者同时命中 20 行
+            assert by_index[0]["matched"] == 220 and by_index[2]["matched"] == 140
+            assert by_index[0]["only_matched"] == 200 and by_index[2]["only_matched"] == 120
+            assert by_index[3]["matched"] == 0
+            assert {(o["a"], o["b"]): o["count"] for o in impact["overlaps"]} == {(0, 2): 20, (0, 3): 0, (2, 3): 0}
+
+        before = service.get_filter_impact(path, {"logic": "OR", "conditions": conditions})
+        assert before["count"] == 1540 - 340
+        stage_file(path)
+        assert service.get_filter_impact(path, {"logic": "OR", "conditions": conditions}) == before
+        print(f"✓ 规则影响统计: {before['conditions']}")
+
+
+if __name__ == "__main__":
+    test_filter_impact()
+    print("\n✅ 所有测试通过！")
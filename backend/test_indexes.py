@@ -0,0 +1,86 @@
+"""
+索引层测试脚本
+
+测试内容：
+1. 初始化和导入后自动补齐索引
+2. 按索引列预取候选行的点查，结果与无索引时一致
+3. 聚类洞察按唯一键 upsert；旧数据库中的重复洞察在建唯一索引前去重
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService, INDEXES
+from test_ingest import _write_sample_csv, MAPPING
+
+
+def _index_names(db: DBService):
+    return {row[0] for row in db.conn.execute(
+        "SELECT index_name FROM duckdb_indexes() WHERE NOT starts_with(index_name, 'PRIMARY')"
+    ).fetchall()}
+
+
+def _drilldowns(db: DBService):
+    return (
+        db.get_emails_by_sender("t", "user3@company.com"),
+        db.get_emails_by_subject("t", "主题 4", include_clean=True),
+        db.get_emails_by_participants("t", "peer2@vendor.com", "user3@company.com"),
+        db.get_emails_for_analysis("t", 0, 100, 10, analysis_type="summary"),
+        db.get_analysis_results(5, "summary"),
+        next(c["ai_insight"] for c in db.get_subject_clusters("t", page_size=100)["clusters"]
+             if c["subject"] == "主题 4"),
+    )
+
+
+def test_indexes_maintained():
+    """测试 1/2: 索引维护与点查"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(path, rows=3000)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        assert _index_names(db) == set(INDEXES)
+
+        db.conn.execute("DROP INDEX idx_emails_sender")
+        db.create_task("t", "t", path)
+        db.ingest_file_with_config("t", path, "csv", MAPPING)
+        assert "idx_emails_sender" in _index_names(db)
+
+        db.save_analysis_result("r1", "t", 5, "summary", "azure", {"summary": "旧"})
+        db.save_analysis_result("r2", "t", 5, "summary", "azure", {"summary": "新"})
+        db.save_cluster_insight("t", "subjects", "主题 4", "{}", "azure")
+        db.save_cluster_insight("t", "subjects", "主题 4", '{"v": 2}', "azure")
+        assert db.conn.execute("SELECT COUNT(*) FROM email_clusters").fetchone()[0] == 1
+        assert _index_names(db) == set(INDEXES)
+
+        indexed = _drilldowns(db)
+        assert len(indexed[0]) == 50 and indexed[1] and indexed[2]
+        assert [e["id"] for e in indexed[3]] == [1, 2, 3, 4, 6, 7, 8, 9, 10, 11]
+        assert [r["result"] for r in indexed[4]] == [{"summary": "新"}]
+        for name in INDEXES:
+            db.conn.execute(f"DROP INDEX {name}")
+        assert _drilldowns(db) == indexed
+        assert indexed[5] == '{"v": 2}'
+
+        # 旧版本数据库：没有唯一索引，同一聚类存在多条洞察，重新打开时只保留最新一条
+        db.conn.execute("""
+            INSERT INTO email_clusters (id, task_id, cluster_type, cluster_key, ai_insight, model_provider, analyzed_at)
+            VALUES ('old', 't', 'subjects', '主题 4', '{"v": 1}', 'azure', TIMESTAMP '2024-01-01')
+        """)
+        db.close()
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        assert _index_names(db) == set(INDEXES)
+        assert db.conn.execute("SELECT ai_insight FROM email_clusters").fetchall() == [('{"v": 2}',)]
+
+        # 旧版本的单列聚类键索引在初始化时删除
+        db.conn.execute("CREATE INDEX idx_email_clusters_cluster_key ON email_clusters (cluster_key)")
+        db.ensure_indexes()
+        assert _index_names(db) == set(INDEXES)
+        db.close()
+        print(f"✓ 索引: {sorted(INDEXES)}")
+
+
+if __name__ == "__main__":
+    test_indexes_maintained()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,171 @@
+"""
+分块导入引擎测试脚本
+
+测试内容：
+1. 记录边界切分（引号内换行不被切断）
+2. 分块并行导入与一次性导入结果一致
+3. 导入进度记录
+4. 失败时保留已提交的块
+5. gzip / zstd 压缩文件流式解压导入与预览
+"""
+import sys
+import os
+import io
+import csv
+import gzip
+import tempfile
+
+import pyarrow as pa
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.ingest_service import IngestService, ChunkIngestError, iter_record_chunks
+from services.preview_service import PreviewService
+
+
+def _write_sample_csv(path: str, rows: int = 500):
+    """生成包含多行正文和转义引号的样本 CSV"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["From", "To", "Subject", "Body", "Date"])
+        for i in range(rows):
+            writer.writerow([
+                f"user{i % 7}@company.com",
+                f"peer{i % 5}@vendor.com",
+                f"主题 {i % 11}",
+                f"第一行 {i}\n第二行 \"引用\" {i}\n",
+                f"2024-01-{(i % 28) + 1:02d} 10:00:00"
+            ])
+
+
+MAPPING = {
+    "sender": "From",
+    "receiver": "To",
+    "subject": "Subject",
+    "content": "Body",
+    "timestamp": "Date"
+}
+
+
+def test_record_chunks_keep_quoted_newlines():
+    """测试 1: 切分点只落在引号外的换行上"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for i in range(200):
+        writer.writerow([i, f"a\nb \"c\" {i}"])
+    data = buf.getvalue().encode()
+
+    chunks = list(iter_record_chunks(io.BytesIO(data), '"', chunk_size=64))
+    assert b"".join(c for _, c in chunks) == data
+    assert len(chunks) > 1
+
+    total_rows = 0
+    for offset, chunk in chunks:
+        assert data[offset:offset + len(chunk)] == chunk
+        total_rows += len(list(csv.reader(io.StringIO(chunk.decode()))))
+    assert total_rows == 200
+    print(f"✓ 切分为 {len(chunks)} 块，共 {total_rows} 行")
+
+
+def test_chunked_ingest_matches_single_statement():
+    """测试 2/3: 分块导入与整体导入结果一致，并记录进度"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(csv_path)
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t1", "chunked", csv_path)
+
+        filter_config = {"logic": "OR", "conditions": [
+            {"field": "Subject", "match_type": "exact", "value": "主题 3"}
+        ]}
+        progress = IngestService(db, chunk_size=2048, workers=3).ingest_csv(
+            "t1", csv_path, MAPPING, filter_config
+        )
+
+        expected = db.conn.execute(f"""
+            SELECT COUNT(*) FROM read_csv_auto('{csv_path}')
+            {db.build_filter_where_clause(filter_config)}
+        """).fetchone()[0]
+        actual = db.conn.execute("SELECT COUNT(*) FROM emails WHERE task_id = 't1'").fetchone()[0]
+
+        assert actual == expected
+        assert progress["status"] == "DONE"
+        assert progress["rows_read"] == 500
+        assert progress["rows_inserted"] == expected
+        assert progress["bytes_read"] == os.path.getsize(csv_path)
+        assert progress["chunks_total"] > 1
+
+        body, ts = db.conn.execute(
+            "SELECT content, timestamp FROM emails WHERE task_id = 't1' AND content LIKE '第一行 0\n%'"
+        ).fetchone()
+        assert body == "第一行 0\n第二行 \"引用\" 0\n"
+        assert ts is not None
+        db.close()
+        print(f"✓ 导入 {actual} 行，{progress['chunks_total']} 块")
+
+
+def test_failed_chunk_keeps_committed_rows():
+    """测试 4: 某块失败时保留之前已提交的块"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "broken.csv")
+        # 损坏行需位于 DuckDB 方言嗅探的采样范围（约 2 万行）之外
+        _write_sample_csv(csv_path, rows=21000)
+        with open(csv_path, "a", encoding="utf-8") as f:
+            f.write("only,three,columns\n")
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t2", "broken", csv_path)
+
+        try:
+            IngestService(db, chunk_size=64 * 1024, workers=2).ingest_csv("t2", csv_path, MAPPING)
+            raise AssertionError("应当抛出 ChunkIngestError")
+        except ChunkIngestError as e:
+            failed_chunk = e.chunk_index
+
+        progress = db.get_ingest_progress("t2")
+        committed = db.conn.execute("SELECT COUNT(*) FROM emails WHERE task_id = 't2'").fetchone()[0]
+        assert progress["status"] == "FAILED"
+        assert progress["failed_chunk"] == failed_chunk
+        assert progress["chunks_done"] == failed_chunk
+        assert 0 < committed == progress["rows_inserted"]
+        db.close()
+        print(f"✓ 第 {failed_chunk} 块失败，保留 {committed} 行")
+
+
+def test_compressed_ingest():
+    """测试 5: 压缩文件不落盘解压，导入结果与未压缩文件一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(csv_path, rows=3000)
+        with open(csv_path, "rb") as f:
+            raw = f.read()
+        gz_path = csv_path + ".gz"
+        with gzip.open(gz_path, "wb") as f:
+            f.write(raw)
+        zst_path = csv_path + ".zst"
+        with pa.CompressedOutputStream(zst_path, "zstd") as f:
+            f.write(raw)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        for task_id, path in (("gz", gz_path), ("zst", zst_path)):
+            db.create_task(task_id, task_id, path)
+            # 上传接口按最后一个扩展名传入文件类型
+            db.ingest_file_with_config(task_id, path, os.path.splitext(path)[1].lstrip("."), MAPPING)
+            progress = db.get_ingest_progress(task_id)
+            count = db.conn.execute("SELECT COUNT(*) FROM emails WHERE task_id = ?", [task_id]).fetchone()[0]
+            assert count == progress["rows_inserted"] == 3000
+            assert progress["bytes_read"] == progress["total_bytes"] == os.path.getsize(path)
+
+        # 小文件完整解压，行数精确
+        info = PreviewService().get_file_info(gz_path)
+        assert info["row_count"] == 3000 and not info["row_count_estimated"]
+        assert PreviewService().get_csv_columns(zst_path) == ["From", "To", "Subject", "Body", "Date"]
+        db.close()
+        print("✓ gzip / zstd 文件导入成功")
+
+
+if __name__ == "__main__":
+    test_record_chunks_keep_quoted_newlines()
+    test_chunked_ingest_matches_single_statement()
+    test_failed_chunk_keeps_committed_rows()
+    test_compressed_ingest()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,95 @@
+"""
+Arrow 结果读取与 orjson 响应测试脚本
+
+测试内容：
+1. fetch_records 与逐行 fetchall + dict(zip) 的结果一致（时间列为 ISO 字符串，JSON 列已解析，NULL 保留，按批读取）
+2. FastJSONResponse 输出与 FastAPI 默认 JSONResponse（jsonable_encoder + json）解码后一致
+3. 分析结果由模型直接序列化保存，读取时以 Fragment 原样拼接进响应
+"""
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api.responses import FastJSONResponse
+from services.ai_base import EmailAnalysisResult
+from services.db_service import DBService, fetch_records, iter_record_batches
+
+
+def test_fetch_records_matches_rows():
+    """测试 1/2: Arrow 列批次读取与 orjson 编码"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t")
+        db.conn.execute("""
+            INSERT INTO emails (id, task_id, sender, subject, content, timestamp)
+            SELECT range::INTEGER, 't', 'user' || (range % 3) || '@x.com', '主题 ' || range, NULL,
+                   CASE WHEN range % 7 = 0 THEN NULL
+                        ELSE TIMESTAMP '2024-01-01 08:00:00.250' + INTERVAL (range) MINUTE END
+            FROM range(2500)
+        """)
+        db.save_analysis_result("a1", "t", 1, "batch_summary", "azure", {"summary": "摘要", "tags": ["合同"]})
+
+        sql = "SELECT * FROM emails e LEFT JOIN analysis_results a ON a.email_id = e.id ORDER BY e.id"
+        cursor = db.conn.execute(sql)
+        columns = [desc[0] for desc in cursor.description]
+        expected = []
+        for row in cursor.fetchall():
+            record = dict(zip(columns, row))
+            for key, value in record.items():
+                if isinstance(value, datetime):
+                    record[key] = value.isoformat()
+            if record["result"]:
+                record["result"] = json.loads(record["result"])
+            expected.append(record)
+
+        assert [len(b) for b in iter_record_batches(db.conn.execute(sql), batch_size=1000)] == [1000, 1000, 500]
+        records = fetch_records(db.conn.execute(sql), json_columns=("result",))
+        assert records == expected
+        assert records[1]["timestamp"] == "2024-01-01T08:01:00.250000" and records[0]["timestamp"] is None
+        assert records[1]["result"] == {"summary": "摘要", "tags": ["合同"]} and records[2]["result"] is None
+
+        content = {"emails": records, "page": 1, "ratio": Decimal("0.5"), "at": datetime(2024, 1, 2, 3, 4, 5)}
+        fast = FastJSONResponse(content)
+        assert fast.media_type == "application/json"
+        assert json.loads(fast.body) == json.loads(JSONResponse(jsonable_encoder(content)).body)
+        assert "主题".encode() in fast.body
+        db.close()
+        print(f"✓ {len(records)} 行经 Arrow 读取与逐行读取一致，orjson 输出与默认编码一致")
+
+
+def test_analysis_result_pass_through():
+    """测试 3: 分析结果只序列化一次、读取不解析"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t")
+        db.conn.execute("INSERT INTO emails (id, task_id, subject) SELECT range::INTEGER, 't', '主题' FROM range(1, 4)")
+        model = EmailAnalysisResult(summary="付款延迟", risk_level="高", tags=["合同"], key_findings="", key_points=[])
+        db.save_analysis_result("a1", "t", 1, "batch_summary", "azure", model)
+        db.save_analysis_result("a2", "t", 2, "summary", "azure", {"summary": "摘要", "score": 0.5})
+        stored = db.conn.execute("SELECT result FROM analysis_results WHERE id = 'a1'").fetchone()[0]
+        assert stored == model.model_dump_json()
+
+        parsed = db.get_emails_by_task("t")
+        raw = db.get_emails_by_task("t", raw_json=True)
+        assert parsed[0]["batch_analysis_result"] == model.model_dump()
+        assert isinstance(raw[0]["batch_analysis_result"], orjson.Fragment) and raw[2]["batch_analysis_result"] is None
+        assert json.loads(FastJSONResponse({"emails": raw}).body) == {"emails": parsed}
+
+        results = db.get_analysis_results(2, raw_json=True)
+        assert json.loads(FastJSONResponse(results).body)[0]["result"] == {"summary": "摘要", "score": 0.5}
+        db.close()
+        print("✓ 分析结果由模型直接序列化保存，读取时原样拼接进响应")
+
+
+if __name__ == "__main__":
+    test_fetch_records_matches_rows()
+    test_analysis_result_pass_through()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,141 @@
+"""
+邮箱格式导入测试脚本
+
+测试内容：
+1. mbox 流式切分与解析（含 mboxrd 转义）
+2. .eml 压缩包与 Maildir 目录导入
+3. 预览服务对邮箱格式的支持；mbox 预览只读取开头估算邮件数，后台统计后为精确值
+"""
+import sys
+import os
+import zipfile
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.mailbox_service import (
+    MAILBOX_COLUMNS, count_messages, estimate_message_count, iter_raw_messages, parse_message
+)
+from services.preview_service import PreviewService
+
+
+def _make_message(i: int) -> str:
+    """生成一封样本邮件"""
+    return (
+        f"From: User {i} <user{i}@company.com>\n"
+        f"To: peer{i % 3}@vendor.com, Boss <boss@company.com>\n"
+        f"Cc: audit@company.com\n"
+        f"Subject: 周报 {i}\n"
+        f"Date: Mon, 0{(i % 9) + 1} Jan 2024 10:00:00 +0800\n"
+        f"Message-ID: <msg{i}@company.com>\n"
+        f"In-Reply-To: <msg{i - 1}@company.com>\n"
+        "Content-Type: text/plain; charset=utf-8\n"
+        "\n"
+        f"正文 {i}\n"
+        "From here on the line is escaped\n"
+    )
+
+
+def _write_mbox(path: str, count: int):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            body = _make_message(i).replace("\nFrom here", "\n>From here")
+            f.write(f"From user{i}@company.com Mon Jan  1 10:00:00 2024\n{body}\n")
+
+
+def test_mbox_parse():
+    """测试 1: mbox 切分与解析"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.mbox")
+        _write_mbox(path, 50)
+
+        assert count_messages(path) == 50
+        raws = [raw for _, raw in iter_raw_messages(path)]
+        assert len(raws) == 50
+
+        parsed = parse_message(raws[1])
+        assert set(parsed) == set(MAILBOX_COLUMNS)
+        assert parsed["sender"] == "user1@company.com"
+        assert parsed["receiver"] == "peer1@vendor.com, boss@company.com"
+        assert parsed["cc"] == "audit@company.com"
+        assert parsed["subject"] == "周报 1"
+        assert parsed["message_id"] == "<msg1@company.com>"
+        assert parsed["in_reply_to"] == "<msg0@company.com>"
+        assert "\nFrom here" in parsed["content"]
+        assert parsed["timestamp"].hour == 10
+        print("✓ mbox 解析正确")
+
+
+def test_mailbox_ingest():
+    """测试 2: mbox / eml 压缩包 / Maildir 导入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        mbox_path = os.path.join(tmp, "archive.mbox")
+        _write_mbox(mbox_path, 120)
+
+        zip_path = os.path.join(tmp, "export.zip")
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            for i in range(30):
+                zf.writestr(f"inbox/{i}.eml", _make_message(i))
+            zf.writestr("readme.txt", "not a message")
+
+        maildir = os.path.join(tmp, "Maildir")
+        for sub in ("cur", "new", "tmp"):
+            os.makedirs(os.path.join(maildir, sub))
+        for i in range(20):
+            sub = "cur" if i % 2 else "new"
+            with open(os.path.join(maildir, sub, f"{i}.host:2,S"), "w", encoding="utf-8") as f:
+                f.write(_make_message(i))
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        cases = [("mbox", mbox_path, "mbox", 120), ("zip", zip_path, "zip", 30), ("maildir", maildir, "", 20)]
+        for task_id, path, file_type, expected in cases:
+            db.create_task(task_id, task_id, path)
+            db.ingest_file_with_config(task_id, path, file_type)
+            count, with_cc, with_ts = db.conn.execute("""
+                SELECT COUNT(*), COUNT(cc), COUNT(timestamp) FROM emails WHERE task_id = ?
+            """, [task_id]).fetchone()
+            assert count == with_cc == with_ts == expected, (task_id, count, with_cc, with_ts)
+            assert db.get_task(task_id)["status"] == "DONE"
+            assert db.get_ingest_progress(task_id)["status"] == "DONE"
+
+        email = db.get_emails_by_task("mbox", limit=1)[0]
+        assert email["message_id"] and email["in_reply_to"]
+        db.close()
+        print("✓ mbox / zip / Maildir 导入成功")
+
+
+def test_mailbox_preview():
+    """测试 3: 预览服务"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.mbox")
+        _write_mbox(path, 40)
+
+        service = PreviewService()
+        assert service.get_csv_columns(path) == MAILBOX_COLUMNS
+        samples = service.get_sample_rows(path, limit=3)
+        assert len(samples) == 3 and isinstance(samples[0]["timestamp"], str)
+        assert service.get_file_info(path)["row_count"] == 40
+        assert estimate_message_count(path) == (40, False)
+        count, estimated = estimate_message_count(path, head_bytes=os.path.getsize(path) // 4)
+        assert estimated and 30 <= count <= 50
+
+        big_path = os.path.join(tmp, "big.mbox")
+        _write_mbox(big_path, 16000)
+        info = service.get_file_info(big_path)
+        assert info["row_count_estimated"] and abs(info["row_count"] - 16000) < 16000 * 0.1
+        assert service.fill_row_count(big_path) == 16000
+        assert not service.get_file_info(big_path)["row_count_estimated"]
+
+        filter_config = {"logic": "OR", "conditions": [
+            {"field": "subject", "match_type": "exact", "value": "周报 7"}
+        ]}
+        # 过滤条件为排除规则
+        assert service.get_filtered_row_count(path, filter_config) == 39
+        print("✓ 邮箱预览正确")
+
+
+if __name__ == "__main__":
+    test_mbox_parse()
+    test_mailbox_ingest()
+    test_mailbox_preview()
+    print("\n✅ 所有测试通过！")
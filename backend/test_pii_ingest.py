@@ -0,0 +1,131 @@
+"""
+导入时预脱敏测试脚本
+
+测试内容：
+1. 进程池分批脱敏后，同一值在整个任务中对应同一 Token，映射持久化后可完整还原
+2. 追加导入到已脱敏的任务时自动脱敏新增行，沿用已有 Token 并继续编号
+3. 批量分析的运行时脱敏与之后的预脱敏共用任务级 Token：运行时新分配的 Token 写入 pii_tokens，不会有一个 Token 对应两个值
+"""
+import sys
+import os
+import re
+import csv
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import services.db_service as db_module
+from services.db_service import DBService
+from services.batch_analysis_service import BatchAnalysisService
+from services.ingest_service import IngestService
+from services.pii_masking_service import PIIMaskingService
+from test_ingest import MAPPING
+
+PII_PATTERN = re.compile(r"[\w.]+@[\w.]+\.\w{2,}|1[3-9]\d{9}|\b(?:\d{1,3}\.){3}\d{1,3}\b")
+
+
+def _write_pii_csv(path: str, start: int, rows: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["From", "To", "Subject", "Body", "Date"])
+        for i in range(start, start + rows):
+            writer.writerow([
+                f"user{i % 13}@company.com",
+                "legal@vendor.com",
+                f"合同 {i % 5}，请回电1380000{i % 17:04d}",
+                f"你好，\n请联系 owner{i % 29}@partner.org 或拨打1390000{i % 11:04d}，服务器 10.0.{i % 3}.1\n",
+                "2024-01-01 10:00:00"
+            ])
+
+
+def _masked_rows(db: DBService):
+    return db.conn.execute(
+        """SELECT sender, receiver, subject, content,
+                  masked_sender, masked_receiver, masked_subject, masked_content
+           FROM emails ORDER BY id"""
+    ).fetchall()
+
+
+def test_parallel_masking_consistent_tokens():
+    """测试 1/2: 任务级 Token 一致、可还原"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_pii_csv(path, 0, 600)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", path)
+        db.ingest_file_with_config("t", path, "csv", MAPPING)
+        assert not db.has_masked_content("t")
+
+        # 多批时使用进程池
+        assert IngestService(db, workers=2).precompute_masked_content("t", batch_rows=50) == 600
+        tokens = db.get_pii_tokens("t")
+        assert len(tokens) == 13 + 1 + 17 + 29 + 11 + 3 == len(set(tokens.values()))
+
+        restore = PIIMaskingService(tokens)
+        for row in _masked_rows(db):
+            raw, masked = row[:4], row[4:]
+            for raw_value, masked_value in zip(raw, masked):
+                assert not PII_PATTERN.search(masked_value)
+                assert restore.unmask_text(masked_value, partial_mask=False) == raw_value
+        assert db.conn.execute(
+            "SELECT COUNT(DISTINCT masked_sender) FROM emails"
+        ).fetchone()[0] == 13
+
+        # 追加导入：沿用已有 Token，新值继续编号
+        more = os.path.join(tmp, "more.csv")
+        _write_pii_csv(more, 600, 40)
+        with open(more, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerow(["new@company.com", "legal@vendor.com", "新主题", "正文", "2024-01-02 10:00:00"])
+        db.ingest_file_with_config("t", more, "csv", MAPPING, append=True)
+        assert db.conn.execute("SELECT COUNT(*) FROM emails WHERE masked_content IS NULL").fetchone()[0] == 0
+        updated = db.get_pii_tokens("t")
+        assert {value: updated[value] for value in tokens} == tokens
+        assert updated["new@company.com"] == f"<EMAIL_{sum(t.startswith('<EMAIL_') for t in tokens.values()) + 1:03d}>"
+        db.close()
+        print(f"✓ 预脱敏 600 封邮件，{len(tokens)} 个任务级 Token")
+
+
+def test_runtime_masking_shares_task_tokens():
+    """测试 3: 运行时脱敏后预脱敏，Token 不冲突"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_pii_csv(path, 0, 200)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        saved = db_module._db_service
+        db_module._db_service = db
+        try:
+            db.create_task("rt", "rt", path)
+            db.ingest_file_with_config("rt", path, "csv", MAPPING)
+            # 运行时脱敏一封（尚未预脱敏）：新 Token 写入 pii_tokens
+            email = db.get_email_by_id(200)
+            email["content"] = "请联系 runtime@only.com，" + email["content"]
+            masked = asyncio.run(BatchAnalysisService().build_masked_email_text(email, "rt"))
+            runtime_tokens = db.get_pii_tokens("rt")
+            assert runtime_tokens["runtime@only.com"] == "<EMAIL_001>" and "<EMAIL_001>" in masked
+
+            IngestService(db, workers=2).precompute_masked_content("rt", batch_rows=50)
+            tokens = db.get_pii_tokens("rt")
+            assert len(tokens) == len(set(tokens.values()))
+            assert {value: tokens[value] for value in runtime_tokens} == runtime_tokens
+            assert db.conn.execute(
+                "SELECT COUNT(*) FROM emails WHERE masked_content LIKE '%<EMAIL_001>%'"
+            ).fetchone()[0] == 0
+
+            # 预脱敏之后的运行时脱敏沿用预脱敏分配的 Token
+            again = asyncio.run(BatchAnalysisService().build_masked_email_text(
+                {"subject": "x", "content": "owner3@partner.org"}, "rt"
+            ))
+            assert again.endswith(tokens["owner3@partner.org"])
+            db.delete_task("rt")
+        finally:
+            db_module._db_service = saved
+            db.close()
+        print(f"✓ 运行时脱敏与预脱敏共用 {len(tokens)} 个任务级 Token")
+
+
+if __name__ == "__main__":
+    test_parallel_masking_consistent_tokens()
+    test_runtime_masking_shares_task_tokens()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,80 @@
+"""
+预览元数据缓存测试脚本
+
+测试内容：
+1. 同一文件只嗅探一次，列名 / 样本 / 文件信息均从缓存返回
+2. 大文件先返回估算行数，后台统计后变为精确行数
+3. 文件内容变化后缓存失效
+"""
+import sys
+import os
+import csv
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.preview_service import PreviewService
+
+
+def _write_csv(path: str, rows: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["From", "To", "Subject", "Body", "Date"])
+        for i in range(rows):
+            writer.writerow([f"user{i}@company.com", "peer@vendor.com", f"主题 {i}",
+                             f"正文 {i}\n第二行", "2024-01-01 10:00:00"])
+
+
+class _CountingPreviewService(PreviewService):
+    """记录实际嗅探文件的次数"""
+
+    def __init__(self):
+        super().__init__()
+        self.builds = 0
+
+    def _build_metadata(self, file_path):
+        self.builds += 1
+        return super()._build_metadata(file_path)
+
+
+def test_metadata_cached():
+    """测试 1/2: 只嗅探一次，估算行数在统计后变为精确值"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_csv(path, 120000)
+        assert os.path.getsize(path) > 4 * 1024 * 1024
+
+        service = _CountingPreviewService()
+        assert service.get_csv_columns(path) == ["From", "To", "Subject", "Body", "Date"]
+        assert len(service.get_sample_rows(path, 5)) == 5
+        info = service.get_file_info(path)
+        assert service.builds == 1
+        assert info["row_count_estimated"]
+        assert abs(info["row_count"] - 120000) < 120000 * 0.1
+
+        assert service.fill_row_count(path) == 120000
+        info = service.get_file_info(path)
+        assert info["row_count"] == 120000 and not info["row_count_estimated"]
+        # 无过滤条件时直接使用缓存的行数
+        assert service.get_filtered_row_count(path, {"logic": "AND", "conditions": []}) == 120000
+        assert service.builds == 1
+        print(f"✓ 估算行数 → 精确行数 {info['row_count']}")
+
+
+def test_cache_invalidated_on_change():
+    """测试 3: 文件变化后重新嗅探"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.csv")
+        _write_csv(path, 10)
+
+        service = _CountingPreviewService()
+        assert service.get_file_info(path)["row_count"] == 10
+        _write_csv(path, 20)
+        assert service.get_file_info(path)["row_count"] == 20
+        assert service.builds == 2
+        print("✓ 文件变化后缓存失效")
+
+
+if __name__ == "__main__":
+    test_metadata_cached()
+    test_cache_invalidated_on_change()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,98 @@
+"""
+批量分析进度看板测试脚本
+
+测试内容：
+1. 计数在内存中累积，快照直接反映最新进度（含处理中项数与处理速率），数据库只在定时刷新时更新
+2. 任务结束时立即写入最终计数和状态，并移出看板；取消请求先反映在看板状态上
+"""
+import sys
+import os
+import asyncio
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.progress_board import ProgressBoard
+
+
+def _setup(tmp: str) -> DBService:
+    db = DBService(os.path.join(tmp, "test.duckdb"))
+    db.create_task("t", "t")
+    db.create_batch_job("j1", "t", "prompt", [], "azure")
+    db.create_batch_job("j2", "t", "prompt", [], "azure")
+    db.update_batch_job_status("j1", "RUNNING")
+    db.update_batch_job_status("j2", "RUNNING")
+    return db
+
+
+async def _run_progress(db: DBService):
+    board = ProgressBoard(db, flush_seconds=0.1)
+    # 1 项开始前已有结果
+    await board.start_job("j1", total=12, skipped=2, done=1)
+
+    for _ in range(4):
+        board.item_started("j1")
+    for result in ("SUCCESS", "FAILED"):
+        board.item_finished("j1", result)
+
+    snapshot = board.snapshot("j1")
+    assert snapshot["status"] == "RUNNING"
+    assert snapshot["processed_count"] == 3
+    assert snapshot["success_count"] == 2 and snapshot["failed_count"] == 1
+    assert snapshot["skipped_count"] == 2 and snapshot["total_count"] == 12
+    assert snapshot["in_flight"] == 2
+    assert snapshot["model_provider"] == "azure"
+
+    # 刷新前数据库中仍是旧计数
+    assert db.get_batch_job("j1")["processed_count"] == 0
+    await asyncio.sleep(0.3)
+    job = db.get_batch_job("j1")
+    assert (job["processed_count"], job["success_count"], job["skipped_count"]) == (3, 2, 2)
+    # 无变化时不重复写入
+    assert await board.flush() == 0
+    assert board.snapshot("j1")["items_per_second"] > 0
+
+    board.item_finished("j1", "SUCCESS")
+    await board.finish_job("j1", "COMPLETED")
+    assert board.get("j1") is None
+    job = db.get_batch_job("j1")
+    assert job["status"] == "COMPLETED" and job["completed_at"]
+    assert job["processed_count"] == 4 and job["success_count"] == 3
+
+
+async def _run_cancel(db: DBService):
+    board = ProgressBoard(db, flush_seconds=60)
+    await board.start_job("j2", total=5, skipped=0)
+    board.item_started("j2")
+    board.item_finished("j2", "SUCCESS")
+
+    board.set_status("j2", "CANCELLED")
+    assert board.snapshot("j2")["status"] == "CANCELLED"
+    await board.finish_job("j2", "CANCELLED")
+    job = db.get_batch_job("j2")
+    assert job["status"] == "CANCELLED" and job["processed_count"] == 1
+    assert board.snapshot("j2") is None
+
+
+def test_progress_board_coalesces_updates():
+    """测试 1/2: 内存计数与定时刷新"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _setup(tmp)
+        asyncio.run(_run_progress(db))
+        db.close()
+        print("✓ 计数在看板中累积，定时刷新写入数据库，结束时写入最终计数")
+
+
+def test_progress_board_state_transitions():
+    """测试 2/2: 取消与结束"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _setup(tmp)
+        asyncio.run(_run_cancel(db))
+        db.close()
+        print("✓ 取消状态先反映在看板上，结束时立即写入数据库")
+
+
+if __name__ == "__main__":
+    test_progress_board_coalesces_updates()
+    test_progress_board_state_transitions()
+    print("\n✅ 所有测试通过！")
@@ -0,0 +1,121 @@
+"""
+分析结果批量写入测试脚本
+
+测试内容：
+1. upsert_analysis_results 按 (email_id, analysis_type, model_provider) 覆盖已有结果，批内同键保留最后一条
+2. 写入缓冲按行数 / 时间间隔批量刷新，任务完成或被取消时写入全部剩余结果
+3. 旧数据库中的重复结果在建唯一索引前去重，只保留最新的一条
+"""
+import sys
+import os
+import asyncio
+import tempfile
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.result_sink import AnalysisResultSink
+
+
+def _setup(tmp: str) -> DBService:
+    db = DBService(os.path.join(tmp, "test.duckdb"))
+    db.create_task("t", "t")
+    db.conn.execute("INSERT INTO emails (id, task_id, subject) SELECT range::INTEGER, 't', '主题' FROM range(1, 1001)")
+    return db
+
+
+def _results(db: DBService):
+    return dict(db.conn.execute(
+        "SELECT email_id, result->>'summary' FROM analysis_results WHERE analysis_type = 'batch_summary'"
+    ).fetchall())
+
+
+def test_upsert_analysis_results():
+    """测试 1/3: 批量 upsert 与旧数据去重"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _setup(tmp)
+        now = datetime.now()
+        db.save_analysis_result("a1", "t", 1, "batch_summary", "azure", {"summary": "旧"})
+        written = db.upsert_analysis_results([
+            ("a2", "t", 1, "batch_summary", "azure", '{"summary": "新"}', now),
+            ("a3", "t", 2, "batch_summary", "azure", '{"summary": "第一次"}', now),
+            ("a4", "t", 2, "batch_summary", "azure", '{"summary": "第二次"}', now),
+            ("a5", "t", 2, "summary", "azure", '{"summary": "另一类型"}', now),
+        ])
+        assert written == 3
+        assert _results(db) == {1: "新", 2: "第二次"}
+        assert db.conn.execute("SELECT id FROM analysis_results WHERE email_id = 1").fetchone()[0] == "a1"
+        assert db.conn.execute("SELECT COUNT(*) FROM analysis_results").fetchone()[0] == 3
+
+        # 旧版本数据库：没有唯一索引，存在重复结果
+        db.conn.execute("DROP INDEX uq_analysis_results_key")
+        db.conn.execute("""
+            INSERT INTO analysis_results VALUES
+            ('d1', 't', 3, 'batch_summary', 'azure', '{"summary": "早"}', TIMESTAMP '2024-01-01'),
+            ('d2', 't', 3, 'batch_summary', 'azure', '{"summary": "晚"}', TIMESTAMP '2024-01-02')
+        """)
+        db.close()
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        assert _results(db) == {1: "新", 2: "第二次", 3: "晚"}
+        assert db.conn.execute(
+            "SELECT is_unique FROM duckdb_indexes() WHERE index_name = 'uq_analysis_results_key'"
+        ).fetchone()[0]
+        db.close()
+        print("✓ 批量 upsert 覆盖已有结果，旧数据去重后建立唯一索引")
+
+
+async def _run_sink(db: DBService):
+    # 按行数刷新：刷新间隔很长，每满 100 行写入一次
+    async with AnalysisResultSink(db, batch_rows=100, flush_ms=60_000) as sink:
+        for email_id in range(1, 251):
+            sink.put(f"r{email_id}", "t", email_id, "batch_summary", "azure", {"summary": f"s{email_id}"})
+            if email_id % 100 == 0:
+                for _ in range(500):
+                    if sink.rows_written == email_id:
+                        break
+                    await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        assert sink.rows_written == 200 and sink.flushes == 2 and sink.pending == 50
+    assert sink.pending == 0 and len(_results(db)) == 250
+
+    # 按时间刷新
+    async with AnalysisResultSink(db, batch_rows=1000, flush_ms=20) as sink:
+        sink.put("x", "t", 300, "batch_summary", "azure", {"summary": "timed"})
+        await asyncio.sleep(0.5)
+        assert sink.rows_written == 1 and sink.pending == 0
+
+    # 任务被取消：退出 async with 时写入剩余结果
+    started = asyncio.Event()
+
+    async def job():
+        async with AnalysisResultSink(db, batch_rows=1000, flush_ms=60_000) as sink:
+            for email_id in range(400, 450):
+                sink.put(f"c{email_id}", "t", email_id, "batch_summary", "azure", {"summary": "cancelled"})
+            started.set()
+            await asyncio.sleep(60)
+
+    running = asyncio.create_task(job())
+    await started.wait()
+    running.cancel()
+    try:
+        await running
+    except asyncio.CancelledError:
+        pass
+    return _results(db)
+
+
+def test_result_sink_flushes():
+    """测试 2/3: 写入缓冲"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _setup(tmp)
+        results = asyncio.run(_run_sink(db))
+        assert len(results) == 301 and results[300] == "timed"
+        assert all(results[email_id] == "cancelled" for email_id in range(400, 450))
+        db.close()
+        print("✓ 写入缓冲按行数 / 时间刷新，取消时写入剩余结果")
+
+
+if __name__ == "__main__":
+    test_upsert_analysis_results()
+    test_result_sink_flushes()
+    print("\n✅ 所有测试通过！")
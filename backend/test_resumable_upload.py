@@ -0,0 +1,95 @@
+"""
+分片上传测试脚本
+
+测试内容：
+1. 分片乱序、并行写入后文件内容一致
+2. 中断后根据清单只补传缺失分片
+3. 偏移、大小、校验值错误被拒绝
+"""
+import sys
+import os
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.storage_service import StorageService, UploadError
+
+
+def _chunks(data: bytes, chunk_size: int):
+    return [(offset, data[offset:offset + chunk_size]) for offset in range(0, len(data), chunk_size)]
+
+
+def test_parallel_resumable_upload():
+    """测试 1/2: 并行上传、断点续传"""
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = StorageService(tmp)
+        data = os.urandom(1024 * 1024 + 123)
+        chunk_size = 64 * 1024
+
+        status = storage.init_resumable_upload("emails.csv", len(data), chunk_size)
+        upload_id = status["upload_id"]
+        chunks = _chunks(data, chunk_size)
+        assert status["total_chunks"] == len(chunks) == 17
+
+        # 第一轮只上传偶数分片（模拟中途断开）
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(
+                lambda c: storage.write_upload_chunk(upload_id, c[0], c[1], hashlib.sha256(c[1]).hexdigest()),
+                chunks[::2]
+            ))
+
+        # 重新打开服务（模拟服务重启），根据清单补传缺失分片
+        storage = StorageService(tmp)
+        missing = storage.get_upload_status(upload_id)["missing_chunks"]
+        assert missing == list(range(1, 17, 2))
+        try:
+            storage.finalize_resumable_upload(upload_id)
+            raise AssertionError("缺少分片时应当拒绝 finalize")
+        except UploadError:
+            pass
+
+        for index in reversed(missing):
+            offset, chunk = chunks[index]
+            storage.write_upload_chunk(upload_id, offset, chunk)
+
+        file_path = storage.finalize_resumable_upload(upload_id)
+        with open(file_path, "rb") as f:
+            assert f.read() == data
+        assert sorted(os.listdir(os.path.dirname(file_path))) == ["emails.csv"]
+        print(f"✓ {len(chunks)} 个分片上传完成")
+
+
+def test_invalid_chunks_rejected():
+    """测试 3: 非法分片被拒绝"""
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = StorageService(tmp)
+        data = b"x" * 1000
+        upload_id = storage.init_resumable_upload("a.csv", len(data), 300)["upload_id"]
+
+        invalid = [
+            (10, data[:300], None),            # 偏移未对齐
+            (0, data[:200], None),             # 大小不符
+            (0, data[:300], "0" * 64),         # 校验值错误
+            (1200, data[:100], None),          # 超出文件末尾
+        ]
+        for offset, chunk, checksum in invalid:
+            try:
+                storage.write_upload_chunk(upload_id, offset, chunk, checksum)
+                raise AssertionError(f"应当拒绝偏移 {offset} 的分片")
+            except UploadError:
+                pass
+
+        assert storage.get_upload_status(upload_id)["received_chunks"] == []
+        try:
+            storage.get_upload_status("../../etc")
+            raise AssertionError("非法的上传 ID 应当被拒绝")
+        except FileNotFoundError:
+            pass
+        print("✓ 非法分片被拒绝")
+
+
+if __name__ == "__main__":
+    test_parallel_resumable_upload()
+    test_invalid_chunks_rejected()
+    print("\n✅ 所有测试通过！")
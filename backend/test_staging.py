@@ -0,0 +1,143 @@
+"""
+列式暂存副本测试脚本
+
+测试内容：
+1. CSV 暂存后过滤行数、样本与直接读取源文件一致
+2. 从暂存副本导入与从源文件导入结果一致
+3. 邮箱文件暂存与导入；确认导入时暂存副本随源文件移动
+4. 暂存失败或暂存期间源文件被移走时不留下临时文件和副本
+"""
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from services.preview_service import PreviewService
+import services.staging_service as staging_module
+from services.staging_service import get_staged_path, stage_file
+from services.storage_service import StorageService
+from test_ingest import _write_sample_csv, MAPPING
+from test_mailbox import _write_mbox
+
+
+FILTER = {"logic": "OR", "conditions": [
+    {"field": "Subject", "match_type": "exact", "value": "主题 3"},
+    {"field": "Body", "match_type": "contains", "value": "第一行 1"}
+]}
+
+
+def test_staged_preview_matches_source():
+    """测试 1: 暂存前后预览结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(csv_path, rows=2000)
+
+        service = PreviewService()
+        before = service.get_filtered_row_count(csv_path, FILTER)
+        service.prepare_upload(csv_path)
+        assert get_staged_path(csv_path)
+
+        info = service.get_file_info(csv_path)
+        assert info["row_count"] == 2000 and not info["row_count_estimated"]
+        assert service.get_filtered_row_count(csv_path, FILTER) == before
+        rows = service.get_sample_rows(csv_path, 30)
+        assert len(rows) == 30 and rows[0]["Body"] == "第一行 0\n第二行 \"引用\" 0\n"
+        print(f"✓ 暂存后过滤行数一致: {before}")
+
+
+def test_ingest_from_staged():
+    """测试 2/3: 从暂存副本导入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "emails.csv")
+        _write_sample_csv(csv_path, rows=2000)
+        mbox_path = os.path.join(tmp, "archive.mbox")
+        _write_mbox(mbox_path, 80)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("raw", "raw", csv_path)
+        db.ingest_file_with_config("raw", csv_path, "csv", MAPPING, FILTER)
+
+        assert stage_file(csv_path) == 2000
+        db.create_task("staged", "staged", csv_path)
+        db.ingest_file_with_config("staged", csv_path, "csv", MAPPING, FILTER)
+
+        query = """
+            SELECT sender, receiver, subject, content, timestamp FROM emails
+            WHERE task_id = ? ORDER BY id
+        """
+        raw_rows = db.conn.execute(query, ["raw"]).fetchall()
+        staged_rows = db.conn.execute(query, ["staged"]).fetchall()
+        assert raw_rows == staged_rows and len(raw_rows) > 0
+        assert db.get_ingest_progress("staged")["rows_read"] == 2000
+
+        # 邮箱：暂存副本随源文件移动后导入
+        assert stage_file(mbox_path) == 80
+        storage = StorageService(os.path.join(tmp, "uploads"))
+        temp_dir = os.path.join(tmp, "uploads", "temp_x")
+        os.makedirs(temp_dir)
+        os.replace(mbox_path, os.path.join(temp_dir, "archive.mbox"))
+        os.replace(mbox_path + ".staged.parquet", os.path.join(temp_dir, "archive.mbox.staged.parquet"))
+        new_path = storage.move_temp_file(os.path.join(temp_dir, "archive.mbox"), "temp_x", "task_mbox")
+        assert get_staged_path(new_path) and not os.path.exists(temp_dir)
+
+        db.create_task("mbox", "mbox", new_path)
+        db.ingest_file_with_config("mbox", new_path, "mbox")
+        count, with_cc = db.conn.execute(
+            "SELECT COUNT(*), COUNT(cc) FROM emails WHERE task_id = 'mbox'"
+        ).fetchone()
+        assert count == with_cc == 80
+        db.close()
+        print(f"✓ 暂存副本导入 {len(staged_rows)} 行，邮箱 {count} 封")
+
+
+def test_staging_interrupted():
+    """测试 4: 暂存中断"""
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = StorageService(os.path.join(tmp, "uploads"))
+        temp_dir = os.path.join(tmp, "uploads", "temp_x")
+        os.makedirs(temp_dir)
+        path = os.path.join(temp_dir, "archive.mbox")
+        _write_mbox(path, 30)
+        parse = staging_module.iter_parsed_batches
+        tmp_path = path + ".staged.parquet.tmp"
+
+        def failing(file_path):
+            batches = parse(file_path)
+            yield next(batches)
+            assert os.path.exists(tmp_path)
+            raise ValueError("解析失败")
+
+        moved = {}
+
+        def moved_midway(file_path):
+            batches = parse(file_path)
+            yield next(batches)
+            # 确认导入：源文件移入任务目录，写入中的临时文件被删除
+            moved["path"] = storage.move_temp_file(file_path, "temp_x", "task_x")
+            assert not os.path.exists(tmp_path)
+            yield from batches
+
+        try:
+            staging_module.iter_parsed_batches = failing
+            try:
+                stage_file(path)
+                raise AssertionError("应当失败")
+            except ValueError:
+                pass
+            assert os.listdir(temp_dir) == ["archive.mbox"]
+
+            staging_module.iter_parsed_batches = moved_midway
+            assert stage_file(path) is None
+        finally:
+            staging_module.iter_parsed_batches = parse
+        assert not os.path.exists(temp_dir)
+        assert os.listdir(os.path.dirname(moved["path"])) == ["archive.mbox"]
+        print("✓ 暂存失败或源文件被移走时清理临时文件")
+
+
+if __name__ == "__main__":
+    test_staged_preview_matches_source()
+    test_ingest_from_staged()
+    test_staging_interrupted()
+    print("\n✅ 所有测试通过！")
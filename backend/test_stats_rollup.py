@@ -0,0 +1,127 @@
+"""
+Dashboard 统计汇总测试脚本
+
+测试内容：
+1. 统计汇总在导入结束时一次扫描构建，总数、时间范围、按日趋势、发件人 Top N 与直接查询邮件表一致
+2. 追加导入时增量刷新，结果与全量重建一致；删除任务时一并删除
+3. 汇总缺失时读取回退为直接聚合（不触发构建），由启动时的回填全量构建
+"""
+import sys
+import os
+import csv
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.db_service import DBService
+from test_ingest import MAPPING
+
+
+def _write_csv(path: str, start: int, rows: int):
+    """发件人、时间分布不均，含缺失发件人 / 时间的行"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["From", "To", "Subject", "Body", "Date"])
+        for i in range(start, start + rows):
+            writer.writerow([
+                "" if i % 13 == 0 else f"user{i % (i % 9 + 1)}@{'company' if i % 3 else 'vendor'}.com",
+                f"peer{i % 4}@vendor.com",
+                f"主题 {i % 5}",
+                f"正文 {i}",
+                "" if i % 17 == 0 else f"2024-0{i % 3 + 1}-{(i % 28) + 1:02d} {i % 24:02d}:{i % 60:02d}:00"
+            ])
+
+
+def _expected(db: DBService, task_id: str, limit: int = 10):
+    """直接扫描邮件表的统计（原 Dashboard 查询）"""
+    q = lambda sql: db.conn.execute(sql, [task_id]).fetchall()
+    total, start, end = q("SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM emails WHERE task_id = ?")[0]
+    return {
+        "total_emails": total,
+        "date_range": {"start": start.isoformat() if start else None, "end": end.isoformat() if end else None},
+        "top_senders": [
+            {"sender": s, "count": c} for s, c in q(
+                f"""SELECT sender, COUNT(*) AS count FROM emails WHERE task_id = ? AND sender IS NOT NULL
+                    GROUP BY sender ORDER BY count DESC, sender LIMIT {limit}""")
+        ],
+        "email_trend": [
+            {"date": d.isoformat(), "count": c} for d, c in q(
+                """SELECT DATE(timestamp) AS date, COUNT(*) FROM emails WHERE task_id = ? AND timestamp IS NOT NULL
+                   GROUP BY DATE(timestamp) ORDER BY date""")
+        ],
+        "hourly_distribution": [
+            {"hour": h, "count": c} for h, c in q(
+                """SELECT hour(timestamp) AS h, COUNT(*) FROM emails WHERE task_id = ? AND timestamp IS NOT NULL
+                   GROUP BY h ORDER BY h""")
+        ],
+        "top_domains": [
+            {"domain": d, "count": c} for d, c in q(
+                f"""SELECT lower(split_part(sender, '@', 2)) AS d, COUNT(*) AS count FROM emails
+                    WHERE task_id = ? AND sender IS NOT NULL GROUP BY d ORDER BY count DESC, d LIMIT {limit}""")
+        ],
+    }
+
+
+def _rollup(db: DBService, task_id: str):
+    return db.conn.execute(
+        "SELECT * FROM task_stats WHERE task_id = ? ORDER BY dimension, stat_key", [task_id]
+    ).fetchall()
+
+
+def _check(db: DBService, task_id: str):
+    stats = db.get_dashboard_stats(task_id)
+    expected = _expected(db, task_id)
+    for key, value in expected.items():
+        assert stats[key] == value, key
+    assert stats["top_senders"][:5] == db.get_dashboard_stats(task_id, limit=5)["top_senders"]
+    assert sum(r["count"] for r in stats["top_receivers"]) == db.conn.execute(
+        "SELECT COUNT(receiver) FROM emails WHERE task_id = ?", [task_id]
+    ).fetchone()[0]
+    return stats
+
+
+def test_stats_rollup_matches_scans():
+    """测试 1/2/3: 汇总结果与直接查询一致，增量刷新与回填"""
+    with tempfile.TemporaryDirectory() as tmp:
+        first = os.path.join(tmp, "first.csv")
+        second = os.path.join(tmp, "second.csv")
+        _write_csv(first, 0, 400)
+        _write_csv(second, 400, 600)
+
+        db = DBService(os.path.join(tmp, "test.duckdb"))
+        db.create_task("t", "t", first)
+        db.ingest_file_with_config("t", first, "csv", MAPPING)
+        assert db.conn.execute("SELECT emails_through FROM task_stats_state WHERE task_id = 't'").fetchone() == (400,)
+        stats = _check(db, "t")
+        assert stats["total_emails"] == 400 and len(stats["hourly_distribution"]) == 24
+
+        # 追加：只扫描新增的 600 封邮件，与已有汇总合并
+        db.ingest_file_with_config("t", second, "csv", MAPPING, append=True)
+        stats = _check(db, "t")
+        assert stats["total_emails"] == 1000
+        incremental = _rollup(db, "t")
+        db.refresh_stats("t", full=True)
+        assert _rollup(db, "t") == incremental
+
+        # 旧版本导入的任务（没有汇总）：读取直接聚合，不写汇总表
+        db.drop_stats("t")
+        assert db.get_dashboard_stats("t") == stats
+        assert _rollup(db, "t") == []
+        assert db.backfill_rollups() == ["t"]
+        assert _rollup(db, "t") == incremental
+
+        # 空任务（未完成，不回填）
+        db.create_task("empty", "empty")
+        empty = db.get_dashboard_stats("empty")
+        assert empty["total_emails"] == 0 and empty["date_range"] == {"start": None, "end": None}
+        assert empty["top_senders"] == [] and empty["email_trend"] == []
+        assert db.backfill_rollups() == []
+
+        db.delete_task("t")
+        assert db.conn.execute("SELECT COUNT(*) FROM task_stats WHERE task_id = 't'").fetchone()[0] == 0
+        db.close()
+        print(f"✓ 统计汇总: {len(incremental)} 行，与直接查询一致，增量刷新与全量重建一致")
+
+
+if __name__ == "__main__":
+    test_stats_rollup_matches_scans()
+    print("\n✅ 所有测试通过！")
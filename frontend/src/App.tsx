@@ -379,7 +379,7 @@ function App() {
                             </label>
                             <input
                                 type="file"
-                                accept=".csv"
+                                accept=".csv,.gz,.zst,.parquet,.ndjson,.jsonl,.mbox,.mbx,.eml,.zip"
                                 onChange={(e) => setSelectedFile(e.target.files?.[0] || null)}
                                 className="w-full text-sm file:mr-3 file:py-2 file:px-4 file:rounded-lg file:border-0 file:text-sm file:font-medium file:bg-indigo-50 file:text-indigo-700 hover:file:bg-indigo-100"
                                 disabled={uploading}
@@ -257,7 +257,7 @@ const BatchAnalysisModal: React.FC<BatchAnalysisModalProps> = ({
             {/* 并行度 */}
             <div>
                 <label className="block text-sm font-semibold text-gray-700 mb-2">
-                    ⚡ 并行度: {concurrency}
+                    ⚡ 初始并行度: {concurrency}
                 </label>
                 <input
                     type="range"
@@ -312,7 +312,7 @@ const BatchAnalysisModal: React.FC<BatchAnalysisModalProps> = ({
                 <ul className="text-sm text-gray-600 space-y-1">
                     <li>• 任务类型: {isClusterAnalysis ? '聚类分析' : '单邮件批量分析'}</li>
                     <li>• 模型: Azure OpenAI</li>
-                    <li>• 并行度: {concurrency} 个并发请求</li>
+                    <li>• 并行度: 从 {concurrency} 个并发请求开始，按响应延迟和限流自动调整</li>
                     <li>• 重试次数: {maxRetries} 次</li>
                     {!isClusterAnalysis && <li>• 过滤关键词: {filterKeywords.length} 个</li>}
                 </ul>
@@ -21,12 +21,22 @@ interface JobStatus {
         failed: number;
         skipped: number;
         percent: number;
+        in_flight: number;
+        items_per_second: number;
     };
     config: {
         model: string;
         concurrency: number;
         max_retries: number;
     };
+    adaptive_concurrency?: {
+        limit: number;
+        in_flight: number;
+        min: number;
+        max: number;
+        paused_seconds: number;
+        history: Array<{ at: string; limit: number; reason: string }>;
+    } | null;
     timestamps: {
         created_at: string | null;
         started_at: string | null;
@@ -235,7 +245,17 @@ const BatchAnalysisProgress: React.FC<BatchAnalysisProgressProps> = ({
             {/* 配置信息 */}
             <div className="text-xs text-gray-500 flex flex-wrap gap-3">
                 <span>模型: {status.config.model}</span>
-                <span>并行度: {status.config.concurrency}</span>
+                <span>
+                    并行度: {status.adaptive_concurrency
+                        ? `${status.adaptive_concurrency.limit}（自动调整，初始 ${status.config.concurrency}）`
+                        : status.config.concurrency}
+                </span>
+                {!!status.adaptive_concurrency?.paused_seconds && (
+                    <span>限流暂停 {status.adaptive_concurrency.paused_seconds} 秒</span>
+                )}
+                {status.status === 'RUNNING' && (
+                    <span>处理中: {status.progress.in_flight} · 速率: {status.progress.items_per_second}/秒</span>
+                )}
                 {status.timestamps.started_at && (
                     <span>开始于: {new Date(status.timestamps.started_at).toLocaleTimeString('zh-CN')}</span>
                 )}
@@ -57,6 +57,8 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
 
     // Raw 视图状态
     const [emails, setEmails] = useState<Email[]>([]);
+    const [emailCursor, setEmailCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [selectedEmail, setSelectedEmail] = useState<Email | null>(null);
     const [loading, setLoading] = useState(false);
     const [analyzing, setAnalyzing] = useState<string | null>(null);
@@ -66,6 +68,8 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
     const [peopleClusters, setPeopleClusters] = useState<PeopleCluster[]>([]);
     const [subjectClusters, setSubjectClusters] = useState<SubjectCluster[]>([]);
     const [clusterPage, setClusterPage] = useState(1);
+    // 各页的分页游标：clusterCursors[i] 为读取第 i + 1 页的游标（第一页为 null）
+    const [clusterCursors, setClusterCursors] = useState<(string | null)[]>([null]);
     const [clusterTotalPages, setClusterTotalPages] = useState(0);
     const [clusterLoading, setClusterLoading] = useState(false);
     const [analyzingCluster, setAnalyzingCluster] = useState(false);
@@ -161,6 +165,7 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
             const response = await axios.get(`/api/tasks/${taskId}/emails`);
             const emailList = response.data.emails || [];
             setEmails(emailList);
+            setEmailCursor(response.data.next_cursor || null);
             if (emailList.length > 0) {
                 setSelectedEmail(emailList[0]);
                 loadAnalysisResults(emailList[0].id);
@@ -172,14 +177,48 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
         }
     };
 
+    // 游标分页：加载下一页并追加到列表
+    const loadMoreEmails = async () => {
+        if (!emailCursor) return;
+        setLoadingMore(true);
+        try {
+            const response = await axios.get(`/api/tasks/${taskId}/emails`, {
+                params: { cursor: emailCursor }
+            });
+            setEmails(prev => [...prev, ...(response.data.emails || [])]);
+            setEmailCursor(response.data.next_cursor || null);
+        } catch (error) {
+            console.error('Failed to load more emails:', error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
+    // 已知游标时按游标读取当前页，否则按页码读取
+    const clusterPageParams = () => ({
+        page: clusterPage,
+        page_size: 20,
+        cursor: clusterCursors[clusterPage - 1] || undefined
+    });
+
+    // 记录下一页的游标
+    const rememberNextCursor = (nextCursor: string | null) => {
+        setClusterCursors(prev => {
+            const cursors = prev.slice(0, clusterPage);
+            cursors[clusterPage] = nextCursor;
+            return cursors;
+        });
+    };
+
     const loadPeopleClusters = async () => {
         setClusterLoading(true);
         try {
             const response = await axios.get(`/api/clusters/people/${taskId}`, {
-                params: { page: clusterPage, page_size: 20 }
+                params: clusterPageParams()
             });
             setPeopleClusters(response.data.clusters || []);
             setClusterTotalPages(response.data.total_pages || 0);
+            rememberNextCursor(response.data.next_cursor || null);
         } catch (error) {
             console.error('Failed to load people clusters:', error);
         } finally {
@@ -191,10 +230,11 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
         setClusterLoading(true);
         try {
             const response = await axios.get(`/api/clusters/subjects/${taskId}`, {
-                params: { page: clusterPage, page_size: 20 }
+                params: clusterPageParams()
             });
             setSubjectClusters(response.data.clusters || []);
             setClusterTotalPages(response.data.total_pages || 0);
+            rememberNextCursor(response.data.next_cursor || null);
         } catch (error) {
             console.error('Failed to load subject clusters:', error);
         } finally {
@@ -341,7 +381,7 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
     // 渲染标签页按钮
     const renderTabButton = (tab: TabType, label: string, icon: string) => (
         <button
-            onClick={() => { setActiveTab(tab); setClusterPage(1); }}
+            onClick={() => { setActiveTab(tab); setClusterPage(1); setClusterCursors([null]); }}
             className={`px-4 py-2 rounded-full text-sm font-medium transition-all flex items-center gap-2 ${activeTab === tab
                 ? 'bg-green-500 text-white shadow-md'
                 : 'bg-gray-100 text-gray-600 hover:bg-gray-200'
@@ -419,6 +459,15 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
                                     </div>
                                 </div>
                             ))}
+                            {emailCursor && (
+                                <button
+                                    onClick={loadMoreEmails}
+                                    disabled={loadingMore}
+                                    className="w-full py-2 text-sm text-blue-600 bg-white border border-gray-200 rounded-lg hover:border-blue-300 disabled:opacity-50"
+                                >
+                                    {loadingMore ? '加载中...' : '加载更多'}
+                                </button>
+                            )}
                         </div>
                     )}
                 </div>
@@ -1007,7 +1056,7 @@ const EmailAnalyzer: React.FC<EmailAnalyzerProps> = ({ taskId, taskName, onClose
                                         // 从数据库获取最新分析的结果
                                         const clusterType = activeTab === 'people' ? 'people' : 'subjects';
                                         const response = await axios.get(`/api/clusters/${clusterType}/${taskId}`, {
-                                            params: { page: clusterPage, page_size: 20 }
+                                            params: clusterPageParams()
                                         });
 
                                         const updatedClusters = response.data.clusters || [];
@@ -14,7 +14,8 @@ interface UploadResponse {
     file_info: {
         filename: string;
         size_bytes: number;
-        row_count: number;
+        row_count: number | null;
+        row_count_estimated?: boolean;  // 精确行数在后台统计完成前为估算值
         extension: string;
     };
 }
@@ -38,6 +39,105 @@ interface FilterConfig {
     conditions: FilterCondition[];
 }
 
+// 过滤规则影响统计（index 为规则在列表中的下标）
+interface FilterImpact {
+    total: number;
+    count: number;
+    excluded: number;
+    conditions: { index: number; matched: number; only_matched: number }[];
+    overlaps: { a: number; b: number; count: number }[];
+}
+
+interface ResumableUploadStatus {
+    upload_id: string;
+    chunk_size: number;
+    total_chunks: number;
+    missing_chunks: number[];
+}
+
+// 超过该大小的文件使用分片上传（可断点续传）
+const RESUMABLE_THRESHOLD = 32 * 1024 * 1024;
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+const UPLOAD_PARALLELISM = 4;
+const UPLOAD_CHUNK_RETRIES = 3;
+
+// 计算分片的 SHA-256（非安全上下文下 crypto.subtle 不可用，此时不校验）
+const sha256Hex = async (buffer: ArrayBuffer): Promise<string | undefined> => {
+    if (!window.crypto?.subtle) return undefined;
+    const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+};
+
+// 分片上传：同一文件再次上传时复用会话，只补传缺失的分片
+const uploadResumable = async (
+    file: File,
+    onProgress: (done: number, total: number) => void
+): Promise<UploadResponse> => {
+    const storageKey = `resumable-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let status: ResumableUploadStatus | null = null;
+
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+        try {
+            status = (await axios.get<ResumableUploadStatus>(`/api/tasks/upload/${savedId}`)).data;
+        } catch {
+            localStorage.removeItem(storageKey);
+        }
+    }
+    if (!status) {
+        status = (await axios.post<ResumableUploadStatus>('/api/tasks/upload/init', {
+            filename: file.name,
+            total_size: file.size,
+            chunk_size: UPLOAD_CHUNK_SIZE
+        })).data;
+        localStorage.setItem(storageKey, status.upload_id);
+    }
+
+    const { upload_id, chunk_size, total_chunks } = status;
+    const queue = [...status.missing_chunks];
+    let done = total_chunks - queue.length;
+    onProgress(done, total_chunks);
+
+    const uploadChunk = async (index: number) => {
+        const offset = index * chunk_size;
+        const buffer = await file.slice(offset, offset + chunk_size).arrayBuffer();
+        const checksum = await sha256Hex(buffer);
+        for (let attempt = 1; ; attempt++) {
+            try {
+                await axios.put(`/api/tasks/upload/${upload_id}/chunk`, buffer, {
+                    params: { offset },
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        ...(checksum ? { 'X-Chunk-Checksum': checksum } : {})
+                    }
+                });
+                return;
+            } catch (error) {
+                if (attempt >= UPLOAD_CHUNK_RETRIES) throw error;
+            }
+        }
+    };
+
+    // 多个分片并行上传
+    const worker = async () => {
+        for (let index = queue.shift(); index !== undefined; index = queue.shift()) {
+            await uploadChunk(index);
+            onProgress(++done, total_chunks);
+        }
+    };
+    await Promise.all(Array.from({ length: UPLOAD_PARALLELISM }, worker));
+
+    const response = await axios.post<UploadResponse>(`/api/tasks/upload/${upload_id}/finalize`);
+    localStorage.removeItem(storageKey);
+    return response.data;
+};
+
+// 行数展示：后台统计完成前显示估算值
+const formatRowCount = (info: UploadResponse['file_info']) => {
+    if (info.row_count === null) return '统计中…';
+    return `${info.row_count_estimated ? '约 ' : ''}${info.row_count.toLocaleString()}`;
+};
+
 // 步骤枚举
 type WizardStep = 'upload' | 'mapping' | 'filter' | 'confirm';
 
@@ -49,12 +149,42 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
     const [selectedFile, setSelectedFile] = useState<File | null>(null);
     const [uploading, setUploading] = useState(false);
     const [uploadError, setUploadError] = useState<string | null>(null);
+    const [uploadProgress, setUploadProgress] = useState<number | null>(null);
 
     // 上传响应数据
     const [uploadData, setUploadData] = useState<UploadResponse | null>(null);
 
+    // 行数为估算值时轮询后台统计结果
+    useEffect(() => {
+        if (!uploadData?.file_info.row_count_estimated) return;
+        const tempFileId = uploadData.temp_file_id;
+        const timer = setInterval(async () => {
+            try {
+                const response = await axios.get(`/api/tasks/preview/${tempFileId}`);
+                const fileInfo = response.data.file_info;
+                if (!fileInfo.row_count_estimated) {
+                    setUploadData(prev => prev && prev.temp_file_id === tempFileId ? { ...prev, file_info: fileInfo } : prev);
+                }
+            } catch (error) {
+                console.error('Failed to refresh row count', error);
+            }
+        }, 2000);
+        return () => clearInterval(timer);
+    }, [uploadData?.temp_file_id, uploadData?.file_info.row_count_estimated]);
+
     // 步骤 2: 字段映射
     const [taskName, setTaskName] = useState('');
+    // 追加导入：选择已有任务时只导入该任务中尚不存在的邮件
+    const [appendTaskId, setAppendTaskId] = useState('');
+    const [existingTasks, setExistingTasks] = useState<{ id: string; name: string; status: string }[]>([]);
+    // 导入后预脱敏 PII（批量分析时直接使用脱敏结果）
+    const [maskPii, setMaskPii] = useState(false);
+
+    useEffect(() => {
+        axios.get('/api/tasks/')
+            .then(response => setExistingTasks(response.data))
+            .catch(error => console.error('Failed to load tasks:', error));
+    }, []);
     const [mapping, setMapping] = useState<FieldMapping>({
         sender: '',
         receiver: '',
@@ -94,14 +224,20 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
         setUploading(true);
         setUploadError(null);
 
-        const formData = new FormData();
-        formData.append('file', selectedFile);
-
         try {
-            const response = await axios.post<UploadResponse>('/api/tasks/upload', formData, {
-                headers: { 'Content-Type': 'multipart/form-data' }
-            });
-            const data = response.data;
+            let data: UploadResponse;
+            if (selectedFile.size > RESUMABLE_THRESHOLD) {
+                data = await uploadResumable(selectedFile, (done, total) => {
+                    setUploadProgress(Math.round((done / total) * 100));
+                });
+            } else {
+                const formData = new FormData();
+                formData.append('file', selectedFile);
+                const response = await axios.post<UploadResponse>('/api/tasks/upload', formData, {
+                    headers: { 'Content-Type': 'multipart/form-data' }
+                });
+                data = response.data;
+            }
             setUploadData(data);
 
             // 自动设置任务名称为文件名（去除扩展名）
@@ -134,13 +270,14 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
             setUploadError(error.response?.data?.detail || '文件上传失败，请重试');
         } finally {
             setUploading(false);
+            setUploadProgress(null);
         }
     };
 
     // 验证字段映射
     const validateMapping = (): boolean => {
         const errors: string[] = [];
-        if (!taskName.trim()) errors.push('请输入任务名称');
+        if (!appendTaskId && !taskName.trim()) errors.push('请输入任务名称');
         if (!mapping.sender) errors.push('请选择发件人字段');
         if (!mapping.receiver) errors.push('请选择收件人字段');
         if (!mapping.subject) errors.push('请选择主题字段');
@@ -185,8 +322,33 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
 
     // 过滤预览统计
     const [filteredCount, setFilteredCount] = useState<number | null>(null);
+    const [filterImpact, setFilterImpact] = useState<FilterImpact | null>(null);
     const [calculatingCount, setCalculatingCount] = useState(false);
 
+    // 规则变化后旧的统计不再有效
+    useEffect(() => {
+        setFilterImpact(null);
+    }, [filterConfig]);
+
+    // 一次请求统计每条规则的命中数、重叠数和最终导入行数
+    const fetchFilterImpact = async (): Promise<FilterImpact | null> => {
+        if (!uploadData) return null;
+        setCalculatingCount(true);
+        try {
+            const response = await axios.post<FilterImpact>('/api/tasks/preview/count', {
+                temp_file_id: uploadData.temp_file_id,
+                filter: filterConfig
+            });
+            setFilterImpact(response.data);
+            return response.data;
+        } catch (error) {
+            console.error("Failed to get filtered count", error);
+            return null;
+        } finally {
+            setCalculatingCount(false);
+        }
+    };
+
     // 步骤 3: 确认过滤规则
     const handleFilterNext = async () => {
         if (!uploadData) return;
@@ -195,32 +357,18 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
         const validConditions = filterConfig.conditions.filter(c => c.field && c.value);
 
         if (validConditions.length > 0) {
-            setCalculatingCount(true);
-            try {
-                const payload = {
-                    temp_file_id: uploadData.temp_file_id,
-                    filter: {
-                        logic: filterConfig.logic,
-                        conditions: validConditions
-                    }
-                };
-                const response = await axios.post('/api/tasks/preview/count', payload);
-                setFilteredCount(response.data.count);
-                setCurrentStep('confirm');
-            } catch (error) {
-                console.error("Failed to get filtered count", error);
-                // 即使失败也允许继续，只是不显示预览数
-                setFilteredCount(null);
-                setCurrentStep('confirm');
-            } finally {
-                setCalculatingCount(false);
-            }
+            // 即使失败也允许继续，只是不显示预览数
+            const impact = filterImpact ?? await fetchFilterImpact();
+            setFilteredCount(impact ? impact.count : null);
         } else {
             setFilteredCount(uploadData.file_info.row_count);
-            setCurrentStep('confirm');
         }
+        setCurrentStep('confirm');
     };
 
+    const conditionImpact = (index: number) =>
+        filterImpact?.conditions.find(c => c.index === index);
+
     // 步骤 4: 执行导入
     const handleImport = async () => {
         if (!uploadData) return;
@@ -241,7 +389,9 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                 filter: validConditions.length > 0 ? {
                     logic: filterConfig.logic,
                     conditions: validConditions
-                } : null
+                } : null,
+                append_to_task_id: appendTaskId || null,
+                mask_pii: maskPii
             };
 
             await axios.post('/api/tasks/import', payload);
@@ -336,7 +486,7 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                             <div className="text-center py-8 border-2 border-dashed border-gray-300 rounded-lg hover:border-blue-500 transition-colors">
                                 <input
                                     type="file"
-                                    accept=".csv"
+                                    accept=".csv,.gz,.zst,.parquet,.ndjson,.jsonl,.mbox,.mbx,.eml,.zip"
                                     onChange={(e) => {
                                         setSelectedFile(e.target.files?.[0] || null);
                                         setUploadError(null);
@@ -361,6 +511,11 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                     <p className="text-blue-600">
                                         {selectedFile.name} ({(selectedFile.size / 1024 / 1024).toFixed(2)} MB)
                                     </p>
+                                    {uploadProgress !== null && (
+                                        <p className="text-sm text-blue-500 mt-1">
+                                            已上传 {uploadProgress}%（中断后重新上传同一文件会从断点继续）
+                                        </p>
+                                    )}
                                 </div>
                             )}
 
@@ -375,19 +530,40 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                     {/* 步骤 2: 字段映射 */}
                     {currentStep === 'mapping' && uploadData && (
                         <div className="space-y-6">
+                            {/* 导入目标 */}
+                            {existingTasks.length > 0 && (
+                                <div>
+                                    <label className="block text-sm font-medium text-gray-700 mb-1">导入到</label>
+                                    <select
+                                        value={appendTaskId}
+                                        onChange={(e) => setAppendTaskId(e.target.value)}
+                                        className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
+                                    >
+                                        <option value="">新建任务</option>
+                                        {existingTasks.map(task => (
+                                            <option key={task.id} value={task.id} disabled={task.status === 'PROCESSING'}>
+                                                追加到: {task.name}（跳过已导入的邮件）
+                                            </option>
+                                        ))}
+                                    </select>
+                                </div>
+                            )}
+
                             {/* 任务名称 */}
-                            <div>
-                                <label className="block text-sm font-medium text-gray-700 mb-1">
-                                    任务名称 <span className="text-red-500">*</span>
-                                </label>
-                                <input
-                                    type="text"
-                                    value={taskName}
-                                    onChange={(e) => setTaskName(e.target.value)}
-                                    className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
-                                    placeholder="请输入任务名称"
-                                />
-                            </div>
+                            {!appendTaskId && (
+                                <div>
+                                    <label className="block text-sm font-medium text-gray-700 mb-1">
+                                        任务名称 <span className="text-red-500">*</span>
+                                    </label>
+                                    <input
+                                        type="text"
+                                        value={taskName}
+                                        onChange={(e) => setTaskName(e.target.value)}
+                                        className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
+                                        placeholder="请输入任务名称"
+                                    />
+                                </div>
+                            )}
 
                             {/* 文件信息 */}
                             <div className="bg-gray-50 rounded-lg p-4">
@@ -399,7 +575,7 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                     </div>
                                     <div>
                                         <span className="text-gray-500">行数:</span>
-                                        <span className="ml-2 font-medium">{uploadData.file_info.row_count.toLocaleString()}</span>
+                                        <span className="ml-2 font-medium">{formatRowCount(uploadData.file_info)}</span>
                                     </div>
                                     <div>
                                         <span className="text-gray-500">列数:</span>
@@ -533,6 +709,18 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                             className="flex-1 px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
                                         />
 
+                                        {/* 规则影响 */}
+                                        {conditionImpact(index) && (
+                                            <span
+                                                className="w-28 text-xs text-gray-600 text-right"
+                                                title="命中行数 / 仅被该规则命中的行数"
+                                            >
+                                                命中 {conditionImpact(index)!.matched.toLocaleString()}
+                                                <br />
+                                                仅此规则 {conditionImpact(index)!.only_matched.toLocaleString()}
+                                            </span>
+                                        )}
+
                                         {/* 删除按钮 */}
                                         <button
                                             onClick={() => removeFilterCondition(index)}
@@ -552,6 +740,42 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                 </button>
                             </div>
 
+                            {/* 规则影响统计 */}
+                            {filterConfig.conditions.some(c => c.field && c.value) && (
+                                <div className="p-4 bg-gray-50 border rounded-lg text-sm space-y-2">
+                                    <div className="flex items-center justify-between">
+                                        {filterImpact ? (
+                                            <span className="text-gray-700">
+                                                共 {filterImpact.total.toLocaleString()} 行，预计导入
+                                                <span className="mx-1 font-medium text-green-600">{filterImpact.count.toLocaleString()}</span>
+                                                行，排除
+                                                <span className="mx-1 font-medium text-red-500">{filterImpact.excluded.toLocaleString()}</span>
+                                                行
+                                            </span>
+                                        ) : (
+                                            <span className="text-gray-500">统计每条规则命中的行数</span>
+                                        )}
+                                        <button
+                                            onClick={fetchFilterImpact}
+                                            disabled={calculatingCount || filterImpact !== null}
+                                            className="px-3 py-1 text-blue-600 border border-blue-300 rounded-md hover:bg-blue-50 disabled:text-gray-400 disabled:border-gray-200"
+                                        >
+                                            {calculatingCount ? '统计中...' : '统计影响'}
+                                        </button>
+                                    </div>
+                                    {filterImpact && filterImpact.overlaps.some(o => o.count > 0) && (
+                                        <div className="text-xs text-gray-600">
+                                            规则重叠:
+                                            {filterImpact.overlaps.filter(o => o.count > 0).map(o => (
+                                                <span key={`${o.a}-${o.b}`} className="ml-2">
+                                                    #{o.a + 1} ∩ #{o.b + 1}: {o.count.toLocaleString()}
+                                                </span>
+                                            ))}
+                                        </div>
+                                    )}
+                                </div>
+                            )}
+
                             {filterConfig.conditions.length === 0 && (
                                 <div className="text-center text-gray-500 py-4">
                                     未设置过滤规则，将导入全部数据
@@ -575,12 +799,14 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                     <h4 className="text-sm font-medium text-gray-500 mb-2">任务信息</h4>
                                     <div className="grid grid-cols-2 gap-4">
                                         <div>
-                                            <span className="text-gray-700">任务名称:</span>
-                                            <span className="ml-2 font-medium">{taskName}</span>
+                                            <span className="text-gray-700">{appendTaskId ? '追加到任务:' : '任务名称:'}</span>
+                                            <span className="ml-2 font-medium">
+                                                {appendTaskId ? existingTasks.find(t => t.id === appendTaskId)?.name : taskName}
+                                            </span>
                                         </div>
                                         <div>
                                             <span className="text-gray-700">原始行数:</span>
-                                            <span className="ml-2 font-medium">{uploadData.file_info.row_count.toLocaleString()}</span>
+                                            <span className="ml-2 font-medium">{formatRowCount(uploadData.file_info)}</span>
                                         </div>
                                         {filteredCount !== null && (
                                             <>
@@ -591,7 +817,7 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                                 <div>
                                                     <span className="text-gray-700">过滤排除:</span>
                                                     <span className="ml-2 font-medium text-red-500">
-                                                        {(uploadData.file_info.row_count - filteredCount).toLocaleString()}
+                                                        {Math.max(0, (uploadData.file_info.row_count ?? filteredCount) - filteredCount).toLocaleString()}
                                                     </span>
                                                 </div>
                                             </>
@@ -621,11 +847,16 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                             <div className="text-sm text-gray-600">
                                                 逻辑: <span className="font-medium">{filterConfig.logic === 'OR' ? '满足任一条件即排除' : '满足所有条件才排除'}</span>
                                             </div>
-                                            {filterConfig.conditions.filter(c => c.field && c.value).map((cond, i) => (
+                                            {filterConfig.conditions.map((cond, i) => cond.field && cond.value && (
                                                 <div key={i} className="text-sm">
                                                     <span className="font-mono bg-red-50 text-red-700 px-2 py-1 rounded">
                                                         排除 {cond.field} {cond.match_type === 'exact' ? '=' : '包含'} "{cond.value}"
                                                     </span>
+                                                    {conditionImpact(i) && (
+                                                        <span className="ml-2 text-gray-500">
+                                                            命中 {conditionImpact(i)!.matched.toLocaleString()} 行
+                                                        </span>
+                                                    )}
                                                 </div>
                                             ))}
                                         </div>
@@ -635,6 +866,16 @@ const ImportWizard: React.FC<ImportWizardProps> = ({ onClose, onSuccess }) => {
                                 </div>
                             </div>
 
+                            <label className="flex items-center text-sm text-gray-700">
+                                <input
+                                    type="checkbox"
+                                    checked={maskPii}
+                                    onChange={(e) => setMaskPii(e.target.checked)}
+                                    className="mr-2"
+                                />
+                                导入后预先脱敏邮箱、手机号、IP（AI 分析时直接使用脱敏结果，Token 在任务内保持一致）
+                            </label>
+
                             {importError && (
                                 <div className="bg-red-50 border border-red-200 rounded-lg p-4 text-red-700">
                                     {importError}